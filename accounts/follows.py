@@ -0,0 +1,79 @@
+import time
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from notifications import tasks as notification_tasks
+from tweets import timeline_cache
+
+from .models import FriendShip, User
+
+# フォロー・フォロー解除と User.followers_count / following_count の増減は必ず同じトランザクションで行う
+
+
+def follow(follower, following):
+    with transaction.atomic():
+        _, created = FriendShip.objects.get_or_create(
+            follower=follower, following=following
+        )
+        if created:
+            User.objects.filter(id=follower.id).update(
+                following_count=F("following_count") + 1
+            )
+            User.objects.filter(id=following.id).update(
+                followers_count=F("followers_count") + 1
+            )
+            notification_tasks.notify_follow.defer(
+                follower.id, following.id, int(time.time())
+            )
+    if created:
+        _follow_changed(follower, following)
+    return created
+
+
+def unfollow(follower, following):
+    with transaction.atomic():
+        deleted, _ = FriendShip.objects.filter(
+            follower=follower, following=following
+        ).delete()
+        if deleted:
+            # カウンタがずれていても負にはしない (ずれは repair_follow_counts で直す)
+            User.objects.filter(id=follower.id, following_count__gt=0).update(
+                following_count=F("following_count") - 1
+            )
+            User.objects.filter(id=following.id, followers_count__gt=0).update(
+                followers_count=F("followers_count") - 1
+            )
+    if deleted:
+        _follow_changed(follower, following)
+    return bool(deleted)
+
+
+def actual_count(field):
+    # FriendShip を数え直す式。"following" ならフォロワー数、"follower" ならフォロー数
+    return Coalesce(
+        Subquery(
+            FriendShip.objects.filter(**{field: OuterRef("pk")})
+            .order_by()
+            .values(field)
+            .annotate(n=Count("id"))
+            .values("n")
+        ),
+        0,
+    )
+
+
+def _follow_changed(follower, following):
+    # プロフィールのフォロー数・フォロワー数とフォローボタンの ETag を変える (tweets.conditional)
+    timeline_cache.touch([("follow", follower.id), ("follow", following.id)])
+
+
+# async ビュー用。transaction.atomic は await をまたげないので、トランザクションごと1回でスレッドへ渡す
+async def afollow(follower, following):
+    return await sync_to_async(follow)(follower, following)
+
+
+async def aunfollow(follower, following):
+    return await sync_to_async(unfollow)(follower, following)
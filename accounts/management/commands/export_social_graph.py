@@ -0,0 +1,36 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts import social_graph
+
+
+class Command(BaseCommand):
+    help = "ユーザー・フォロー・ツイート・いいねを NDJSON (1ファイル) か CSV (ディレクトリ) に書き出します。"
+
+    def add_arguments(self, parser):
+        parser.add_argument("output", help="書き出し先。NDJSON は - で標準出力、CSV はディレクトリ")
+        parser.add_argument("--format", choices=social_graph.FORMATS, default="ndjson")
+        parser.add_argument(
+            "--chunk-size", type=int, default=2000, help="1回に DB から読む行数"
+        )
+        parser.add_argument(
+            "--progress-every", type=int, default=100000, help="進み具合を出す間隔 (行)"
+        )
+
+    def handle(self, *args, **options):
+        output = options["output"]
+        # 標準出力へ書き出すときは、進み具合を標準エラーへ出す
+        log = self.stderr if output == "-" else self.stdout
+        progress = social_graph.Progress(log.write, options["progress_every"])
+
+        if options["format"] == "csv":
+            if output == "-":
+                raise CommandError("CSV はディレクトリを指定してください。")
+            social_graph.export_csv(output, options["chunk_size"], progress)
+        elif output == "-":
+            social_graph.export_ndjson(sys.stdout, options["chunk_size"], progress)
+        else:
+            with open(output, "w", encoding="utf-8") as f:
+                social_graph.export_ndjson(f, options["chunk_size"], progress)
+        log.write(self.style.SUCCESS(f"書き出しました: {progress.summary()}"))
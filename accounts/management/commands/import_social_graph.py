@@ -0,0 +1,69 @@
+import os
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from accounts import social_graph
+
+# 読み込んだ後に作り直すもの (bulk_create ではカウンタもシグナルも動かないので)
+DERIVED_COMMANDS = [
+    "repair_follow_counts",
+    "reconcile_like_counts",
+    "backfill_tweet_entities",
+    "rebuild_search_index",
+    "rebuild_timelines",
+]
+
+
+class Command(BaseCommand):
+    help = "export_social_graph で書き出したファイルを読み込みます。--checkpoint を付けると、止まったところから再開できます。"
+
+    def add_arguments(self, parser):
+        parser.add_argument("source", help="NDJSON のファイル、または CSV のディレクトリ")
+        parser.add_argument(
+            "--format",
+            choices=social_graph.FORMATS,
+            default=None,
+            help="省略時は source から判断する",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=1000, help="1回の bulk_create とコミットの行数"
+        )
+        parser.add_argument(
+            "--checkpoint",
+            help="進み具合を保存するファイル。あれば続きから読み込み、最後まで終わったら消す",
+        )
+        parser.add_argument(
+            "--progress-every", type=int, default=100000, help="進み具合を出す間隔 (行)"
+        )
+        parser.add_argument(
+            "--skip-derived",
+            action="store_true",
+            help="カウンタ・ハッシュタグ・検索の索引・タイムラインを作り直さない",
+        )
+
+    def handle(self, *args, **options):
+        source = options["source"]
+        fmt = options["format"] or ("csv" if os.path.isdir(source) else "ndjson")
+        try:
+            checkpoint = social_graph.Checkpoint(options["checkpoint"], source, fmt)
+        except ValueError as e:
+            raise CommandError(str(e))
+        if checkpoint.resumed:
+            self.stdout.write(
+                f"チェックポイントから再開します ({checkpoint.state['section']}, {checkpoint.state['offset']} バイト目)。"
+            )
+
+        progress = social_graph.Progress(self.stdout.write, options["progress_every"])
+        importer = social_graph.Importer(options["batch_size"], progress, checkpoint)
+        try:
+            importer.run(source, fmt)
+        except (IntegrityError, ValueError) as e:
+            raise CommandError(f"読み込めませんでした (コミット済みのバッチは残っています): {e}")
+        checkpoint.remove()
+        self.stdout.write(self.style.SUCCESS(f"読み込みました: {progress.summary()}"))
+
+        if not options["skip_derived"]:
+            for name in DERIVED_COMMANDS:
+                call_command(name, stdout=self.stdout, stderr=self.stderr)
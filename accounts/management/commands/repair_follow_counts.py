@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+
+from accounts.follows import actual_count
+from accounts.models import User
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = "User.followers_count / following_count と FriendShip の実件数がずれているユーザーを修正します。"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run", action="store_true", help="修正せずに、ずれている件数だけ表示する"
+        )
+
+    def handle(self, *args, **options):
+        followers = actual_count("following")
+        following = actual_count("follower")
+        drifted = (
+            User.objects.annotate(
+                actual_followers=followers, actual_following=following
+            )
+            .filter(
+                ~Q(followers_count=F("actual_followers"))
+                | ~Q(following_count=F("actual_following"))
+            )
+            .order_by("id")
+        )
+
+        fixed = 0
+        last_id = 0
+        # 読みながら同じテーブルへ書き込むので、iterator ではなく id で区切って少しずつ処理する
+        while ids := list(
+            drifted.filter(id__gt=last_id).values_list("id", flat=True)[:BATCH_SIZE]
+        ):
+            if not options["dry_run"]:
+                User.objects.filter(id__in=ids).update(
+                    followers_count=followers, following_count=following
+                )
+            fixed += len(ids)
+            last_id = ids[-1]
+
+        verb = "見つかりました" if options["dry_run"] else "修正しました"
+        self.stdout.write(self.style.SUCCESS(f"{fixed} 人のフォロー数のずれが{verb}。"))
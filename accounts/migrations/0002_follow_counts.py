@@ -0,0 +1,60 @@
+# Generated by Django 4.1.13 on 2026-10-18 07:32
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_follow_counts(apps, schema_editor):
+    FriendShip = apps.get_model("accounts", "FriendShip")
+    User = apps.get_model("accounts", "User")
+
+    def count(field):
+        return Coalesce(
+            Subquery(
+                FriendShip.objects.filter(**{field: OuterRef("pk")})
+                .order_by()
+                .values(field)
+                .annotate(n=Count("id"))
+                .values("n")
+            ),
+            0,
+        )
+
+    User.objects.update(
+        followers_count=count("following"), following_count=count("follower")
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="followers_count",
+            field=models.PositiveIntegerField(default=0, verbose_name="フォロワー数"),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="following_count",
+            field=models.PositiveIntegerField(default=0, verbose_name="フォロー数"),
+        ),
+        migrations.AddIndex(
+            model_name="friendship",
+            index=models.Index(
+                fields=["follower", "created_at", "id"], name="friendship_follower_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="friendship",
+            index=models.Index(
+                fields=["following", "created_at", "id"],
+                name="friendship_following_idx",
+            ),
+        ),
+        migrations.RunPython(fill_follow_counts, migrations.RunPython.noop),
+    ]
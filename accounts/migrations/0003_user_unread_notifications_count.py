@@ -0,0 +1,18 @@
+# Generated by Django 4.1.13 on 2026-10-18 08:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0002_follow_counts"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="unread_notifications_count",
+            field=models.PositiveIntegerField(default=0, verbose_name="未読の通知数"),
+        ),
+    ]
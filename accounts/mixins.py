@@ -0,0 +1,18 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user
+from django.contrib.auth.mixins import AccessMixin
+
+
+async def aget_user(request):
+    # request.user は最初に触ったときにセッションを DB から読む遅延オブジェクトなので、
+    # async ビューの中でそのまま触ると SynchronousOnlyOperation になる。先にスレッドで読んでおく
+    return await sync_to_async(get_user)(request)
+
+
+class AsyncLoginRequiredMixin(AccessMixin):
+    # async def のハンドラだけを持つビュー用の LoginRequiredMixin
+    async def dispatch(self, request, *args, **kwargs):
+        request.user = await aget_user(request)
+        if not request.user.is_authenticated:
+            return self.handle_no_permission()
+        return await super().dispatch(request, *args, **kwargs)
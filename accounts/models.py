@@ -7,6 +7,13 @@ class User(AbstractUser):
     email = models.EmailField(max_length=254)
     # emailのbrank=trueになっているのを上書きするために記述
     # EmailFieldを使うことで@が必要とかバリデーション関連を追加する
+    followers_count = models.PositiveIntegerField(verbose_name="フォロワー数", default=0)
+    following_count = models.PositiveIntegerField(verbose_name="フォロー数", default=0)
+    # FriendShip の件数を毎回 COUNT しないための非正規化カラム (accounts.follows で増減させる)
+    unread_notifications_count = models.PositiveIntegerField(
+        verbose_name="未読の通知数", default=0
+    )
+    # 通知のバッジを COUNT せずに出すためのカウンタ (notifications.inbox で増減させる)
 
     class Meta:
         verbose_name_plural = "ユーザー"
@@ -40,6 +47,17 @@ class FriendShip(models.Model):
                 fields=["follower", "following"], name="friendship_unique"
             ),
         ]
+        indexes = [
+            models.Index(
+                fields=["follower", "created_at", "id"],
+                name="friendship_follower_idx",
+            ),
+            models.Index(
+                fields=["following", "created_at", "id"],
+                name="friendship_following_idx",
+            ),
+        ]
+        # フォロー中・フォロワー一覧のキーセットページング (created_at, id) 用
 
     def __str__(self):
         return f"{self.follower} → {self.following}"
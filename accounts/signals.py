@@ -0,0 +1,38 @@
+from django.db.models.signals import post_delete, pre_delete
+from django.dispatch import receiver
+
+from tweets import tasks as tweet_tasks
+from tweets.models import Like
+
+from . import tasks
+from .models import FriendShip, User
+
+# ユーザーを消すと FriendShip と Like も CASCADE で消えるが、相手側のカウンタ
+# (followers_count / following_count / like_count) はそのまま残る。消した後でワーカーに数え直させる
+
+
+@receiver(pre_delete, sender=User)
+def collect_counter_targets(sender, instance, **kwargs):
+    # 消える前に、カウンタがずれる相手を覚えておく
+    instance._counter_user_ids = list(
+        FriendShip.objects.filter(follower=instance).values_list(
+            "following_id", flat=True
+        )
+    ) + list(
+        FriendShip.objects.filter(following=instance).values_list(
+            "follower_id", flat=True
+        )
+    )
+    instance._counter_tweet_ids = list(
+        Like.objects.filter(user=instance).values_list("tweet_id", flat=True)
+    )
+
+
+@receiver(post_delete, sender=User)
+def repair_counters(sender, instance, **kwargs):
+    user_ids = getattr(instance, "_counter_user_ids", None)
+    if user_ids:
+        tasks.repair_follow_counts.defer(sorted(set(user_ids)))
+    tweet_ids = getattr(instance, "_counter_tweet_ids", None)
+    if tweet_ids:
+        tweet_tasks.reconcile_like_counts.defer(sorted(set(tweet_ids)))
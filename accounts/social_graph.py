@@ -0,0 +1,338 @@
+import contextlib
+import csv
+import json
+import os
+import time
+
+from django.core.management.color import no_style
+from django.db import connection, transaction
+
+from tweets.models import Like, Tweet
+
+from .models import FriendShip, User
+
+# ユーザー・フォロー・ツイート・いいねの書き出しと読み込み (export_social_graph / import_social_graph)
+# - NDJSON は1ファイルに SECTIONS の順で1行1件 ({"type": "tweet", ...})
+# - CSV は1つのディレクトリに SECTIONS ごとのファイル (users.csv など。1行目は列名)
+# - id はそのまま保つ (参照を付け替えない)。カウンタやタイムライン、検索の索引は書き出さず、読み込んだ後で作り直す
+# どちらも全件をメモリに載せず、少しずつ読み書きする
+
+SECTIONS = [
+    (
+        "user",
+        User,
+        [
+            "id",
+            "username",
+            "email",
+            "password",
+            "first_name",
+            "last_name",
+            "is_active",
+            "is_staff",
+            "is_superuser",
+            "date_joined",
+            "last_login",
+        ],
+    ),
+    ("friendship", FriendShip, ["id", "follower_id", "following_id", "created_at"]),
+    (
+        "tweet",
+        Tweet,
+        ["id", "user_id", "content", "created_at", "updated_at", "pulled"],
+    ),
+    ("like", Like, ["id", "tweet_id", "user_id", "created_at"]),
+]
+MODELS = {name: model for name, model, _ in SECTIONS}
+FIELDS = {name: fields for name, _, fields in SECTIONS}
+FORMATS = ("ndjson", "csv")
+
+
+def csv_path(directory, name):
+    return os.path.join(directory, f"{name}s.csv")
+
+
+class Progress:
+    # every 行ごとに「件数と1秒あたりの行数」を出す
+    def __init__(self, write, every):
+        self.write = write
+        self.every = every
+        self.start = time.perf_counter()
+        self.rows = {}
+        self.total = 0
+        self.reported = 0
+
+    def add(self, name, count=1):
+        self.rows[name] = self.rows.get(name, 0) + count
+        self.total += count
+        if self.every and self.total - self.reported >= self.every:
+            self.reported = self.total
+            self.write(
+                f"{name}: {self.rows[name]} 行 (全体 {self.total} 行, {self.rate():.0f} 行/秒)"
+            )
+
+    def rate(self):
+        elapsed = time.perf_counter() - self.start
+        return self.total / elapsed if elapsed else 0.0
+
+    def summary(self):
+        counts = ", ".join(f"{name} {count}" for name, count in self.rows.items())
+        return f"{self.total} 行 ({counts}), {self.rate():.0f} 行/秒"
+
+
+# 書き出し
+
+
+def _value(value):
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+def iter_rows(name, chunk_size):
+    # id 順に chunk_size 件ずつ読む (モデルのインスタンスは作らない)
+    return (
+        MODELS[name]
+        .objects.order_by("pk")
+        .values_list(*FIELDS[name])
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+def export_ndjson(out, chunk_size, progress):
+    for name, _, fields in SECTIONS:
+        for row in iter_rows(name, chunk_size):
+            record = {"type": name}
+            record.update(zip(fields, map(_value, row)))
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            progress.add(name)
+
+
+def export_csv(directory, chunk_size, progress):
+    os.makedirs(directory, exist_ok=True)
+    for name, _, fields in SECTIONS:
+        with open(csv_path(directory, name), "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(fields)
+            for row in iter_rows(name, chunk_size):
+                writer.writerow("" if value is None else _value(value) for value in row)
+                progress.add(name)
+
+
+# 読み込み
+
+
+class LineReader:
+    # バイナリで1行ずつ読み、読み終えた位置 (バイト) を offset に持つ
+    # csv.reader は1件に必要な行だけを引き出すので、1件読んだ直後の offset はその件の終わりになる
+    def __init__(self, f):
+        self.f = f
+        self.offset = f.tell()
+
+    def __iter__(self):
+        for line in self.f:
+            self.offset += len(line)
+            yield line.decode("utf-8")
+
+
+def parse(name, record):
+    # 文字列 (CSV) や ISO 形式の日時 (NDJSON) を、フィールドの型に戻してインスタンスにする
+    model = MODELS[name]
+    values = {}
+    for attname in FIELDS[name]:
+        if attname not in record:
+            # 列を足す前に書き出したファイル。既定値のままにする
+            continue
+        field = model._meta.get_field(attname.removesuffix("_id"))
+        value = record[attname]
+        if value == "" and field.null:
+            value = None
+        values[attname] = None if value is None else field.to_python(value)
+    return model(**values)
+
+
+@contextlib.contextmanager
+def keep_timestamps():
+    # auto_now / auto_now_add のフィールドは bulk_create でも今の時刻で上書きされるので、読み込みの間だけ外す
+    changed = []
+    for _, model, _ in SECTIONS:
+        for field in model._meta.concrete_fields:
+            for attr in ("auto_now", "auto_now_add"):
+                if getattr(field, attr, False):
+                    setattr(field, attr, False)
+                    changed.append((field, attr))
+    try:
+        yield
+    finally:
+        for field, attr in changed:
+            setattr(field, attr, True)
+
+
+class Checkpoint:
+    # どこまで読み込んだか。バッチをコミットするたびに書き直し、最後まで終わったら消す
+    def __init__(self, path, source, fmt):
+        self.path = path
+        self.state = {
+            "source": os.path.abspath(source),
+            "format": fmt,
+            "section": None,
+            "offset": 0,
+            "rows": {},
+            # コミット中のバッチ [section, 終わりの offset]。コミットの後、save するまでに止まると残る
+            "pending": None,
+        }
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                saved = json.load(f)
+            if (saved["source"], saved["format"]) != (self.state["source"], fmt):
+                raise ValueError(f"チェックポイント {path} は別の入力 ({saved['source']}) のものです。")
+            self.state = saved
+
+    @property
+    def resumed(self):
+        return self.state["section"] is not None
+
+    def begin(self, section, offset):
+        # バッチをコミットする前に呼ぶ。再開したとき、このバッチの行は既に入っているかもしれない
+        self.state.update(pending=[section, offset])
+        self.write()
+
+    def save(self, section, offset, rows):
+        self.state.update(section=section, offset=offset, rows=dict(rows), pending=None)
+        self.write()
+
+    def write(self):
+        if not self.path:
+            return
+        # 途中で止まっても壊れたファイルが残らないよう、書いてから差し替える
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.state, f)
+        os.replace(tmp, self.path)
+
+    def remove(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class Importer:
+    def __init__(self, batch_size, progress, checkpoint):
+        self.batch_size = batch_size
+        self.progress = progress
+        self.checkpoint = checkpoint
+        # 前回までに読み込んだ行数 (チェックポイントにはこれと今回の分の合計を書く)
+        self.previous = dict(checkpoint.state["rows"])
+        # 前回、コミットしたかどうか分からないまま止まったバッチ
+        self.replay = checkpoint.state.get("pending")
+
+    def in_replay(self, name, offset):
+        # offset で読み終わる name の行が、前回止まったバッチに入っているか
+        return (
+            self.replay is not None
+            and name == self.replay[0]
+            and offset <= self.replay[1]
+        )
+
+    def leaves_replay(self, name, offset, next_offset):
+        # 次の行から前回止まったバッチの外に出るか (出るところでバッチを分ける)
+        return self.in_replay(name, offset) and not self.in_replay(name, next_offset)
+
+    def flush(self, name, objs, offset):
+        # 1バッチを1トランザクションでコミットしてから、チェックポイントを進める
+        # 前回止まったバッチの行だけは、もう入っている id を飛ばす。それ以外で重なる行があれば
+        # IntegrityError で止める (黙って捨てて、入れた件数に数えることはしない)
+        if objs:
+            model = MODELS[name]
+            self.checkpoint.begin(name, offset)
+            with transaction.atomic():
+                if self.in_replay(name, offset):
+                    existing = set(
+                        model.objects.filter(
+                            pk__in=[obj.pk for obj in objs]
+                        ).values_list("pk", flat=True)
+                    )
+                    objs = [obj for obj in objs if obj.pk not in existing]
+                model.objects.bulk_create(objs)
+            self.progress.add(name, len(objs))
+        rows = dict(self.previous)
+        for key, count in self.progress.rows.items():
+            rows[key] = rows.get(key, 0) + count
+        self.checkpoint.save(name, offset, rows)
+
+    def run(self, source, fmt):
+        # 外部キーの確認は最後にまとめて行う (SQLite は読み込みの間 foreign_keys を OFF にする)
+        with keep_timestamps(), connection.constraint_checks_disabled():
+            if fmt == "ndjson":
+                self.import_ndjson(source)
+            else:
+                self.import_csv(source)
+        connection.check_constraints(
+            table_names=[model._meta.db_table for _, model, _ in SECTIONS]
+        )
+        reset_sequences()
+
+    def import_ndjson(self, path):
+        with open(path, "rb") as f:
+            f.seek(self.checkpoint.state["offset"])
+            reader = LineReader(f)
+            name, objs, offset = None, [], reader.offset
+            for line in reader:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if record["type"] not in MODELS:
+                    raise ValueError(f"不明な種類です: {record['type']}")
+                if objs and (
+                    record["type"] != name
+                    or self.leaves_replay(name, offset, reader.offset)
+                ):
+                    self.flush(name, objs, offset)
+                    objs = []
+                name = record["type"]
+                objs.append(parse(name, record))
+                offset = reader.offset
+                if len(objs) >= self.batch_size:
+                    self.flush(name, objs, offset)
+                    objs = []
+            if objs:
+                self.flush(name, objs, offset)
+
+    def import_csv(self, directory):
+        names = [name for name, _, _ in SECTIONS]
+        start = self.checkpoint.state["section"]
+        for name in names[names.index(start) if start else 0 :]:
+            path = csv_path(directory, name)
+            if not os.path.exists(path):
+                continue
+            offset = self.checkpoint.state["offset"] if name == start else 0
+            self.import_csv_file(name, path, offset)
+
+    def import_csv_file(self, name, path, offset):
+        with open(path, "rb") as f:
+            # 1行目の列名には改行が入らないので、そのまま1行読めばよい
+            header = next(csv.reader([f.readline().decode("utf-8")]))
+            if offset:
+                f.seek(offset)
+            reader = LineReader(f)
+            objs = []
+            for row in csv.reader(reader):
+                if objs and self.leaves_replay(name, offset, reader.offset):
+                    self.flush(name, objs, offset)
+                    objs = []
+                objs.append(parse(name, dict(zip(header, row))))
+                offset = reader.offset
+                if len(objs) >= self.batch_size:
+                    self.flush(name, objs, reader.offset)
+                    objs = []
+            self.flush(name, objs, reader.offset)
+
+
+def reset_sequences():
+    # id を指定して入れたので、PostgreSQL などは次に振る id を最大値の後ろへ進める (SQLite は不要)
+    sql = connection.ops.sequence_reset_sql(
+        no_style(), [model for _, model, _ in SECTIONS]
+    )
+    if sql:
+        with connection.cursor() as cursor:
+            for statement in sql:
+                cursor.execute(statement)
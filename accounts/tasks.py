@@ -0,0 +1,13 @@
+from tasks.queue import task
+
+from .follows import actual_count
+from .models import User
+
+
+@task
+def repair_follow_counts(user_ids):
+    # UPDATE の中で FriendShip を数え直す (repair_follow_counts コマンドの、対象を絞った版)
+    User.objects.filter(id__in=user_ids).update(
+        followers_count=actual_count("following"),
+        following_count=actual_count("follower"),
+    )
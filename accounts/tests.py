@@ -1,11 +1,22 @@
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
 from django.conf import settings
 from django.contrib.auth import SESSION_KEY
 from django.contrib.messages import get_messages
-from django.test import TestCase
+from django.core.management import CommandError, call_command
+from django.db import transaction
+from django.test import AsyncClient
 from django.urls import reverse
 
-from tweets.models import Tweet
+from mysite.testcases import TestCase
+from search.index import search_tweets
+from tweets.models import Like, TimelineEntry, Tweet
 
+from . import follows, social_graph
 from .models import FriendShip, User
 
 
@@ -327,9 +338,9 @@ class TestUserProfileView(TestCase):
         self.url = reverse(
             "accounts:user_profile", kwargs={"username": self.user1.username}
         )
-        self.friendship = FriendShip.objects.create(
-            follower=self.user1, following=self.user2
-        )
+        follows.follow(self.user1, self.user2)
+        self.user1.refresh_from_db()
+        # カウンタも更新されるように、フォローは accounts.follows 経由で作る
 
     def test_success_get(self):
         response = self.client.get(self.url)
@@ -347,6 +358,94 @@ class TestUserProfileView(TestCase):
         )
 
 
+class TestUserProfileViewerState(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="testuser",
+            password="testpassword",
+        )
+        self.client.login(username="testuser", password="testpassword")
+        self.url = reverse(
+            "accounts:user_profile", kwargs={"username": self.user.username}
+        )
+
+    def test_query_count_does_not_depend_on_tweet_count(self):
+        for n in (10, 100, 1000):
+            with self.subTest(n=n):
+                Tweet.objects.all().delete()
+                Tweet.objects.bulk_create(
+                    Tweet(user=self.user, content=f"testpost{i}") for i in range(n)
+                )
+                Like.objects.bulk_create(
+                    Like(tweet=tweet, user=self.user)
+                    for tweet in Tweet.objects.all()
+                    if tweet.id % 2
+                )
+                # session, user, profile user, tweets, liked ids, is_following, suggestions
+                with self.assertNumQueries(7):
+                    response = self.client.get(self.url)
+                for tweet in response.context["tweet_list"]:
+                    self.assertEqual(tweet.is_liked, bool(tweet.id % 2))
+
+    def test_pages_do_not_overlap(self):
+        Tweet.objects.bulk_create(
+            Tweet(user=self.user, content=f"testpost{i}") for i in range(30)
+        )
+        response = self.client.get(self.url)
+        first = [tweet.id for tweet in response.context["tweet_list"]]
+        response = self.client.get(
+            self.url, {"cursor": response.context["next_cursor"]}
+        )
+        second = [tweet.id for tweet in response.context["tweet_list"]]
+        self.assertEqual(len(first), 20)
+        self.assertEqual(len(second), 10)
+        self.assertFalse(set(first) & set(second))
+        self.assertIsNone(response.context["next_cursor"])
+
+
+class TestUserProfileConditionalGet(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(
+            username="testuser1", password="testpassword"
+        )
+        self.user2 = User.objects.create_user(
+            username="testuser2", password="testpassword"
+        )
+        self.tweet = Tweet.objects.create(user=self.user2, content="testpost")
+        self.client.login(username="testuser1", password="testpassword")
+        self.url = reverse(
+            "accounts:user_profile", kwargs={"username": self.user2.username}
+        )
+        self.etag = self.client.get(self.url)["ETag"]
+
+    def test_not_modified(self):
+        # session, user, 相手のユーザー
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=self.etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_modified_by_follow(self):
+        follows.follow(self.user1, self.user2)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=self.etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["follower_count"], 1)
+
+    def test_modified_by_like_from_others(self):
+        Like.objects.create(user=self.user2, tweet=self.tweet)
+        self.assertEqual(
+            self.client.get(self.url, HTTP_IF_NONE_MATCH=self.etag).status_code, 304
+        )
+        self.client.login(username="testuser2", password="testpassword")
+        self.client.post(reverse("tweets:unlike", kwargs={"pk": self.tweet.pk}))
+        self.client.login(username="testuser1", password="testpassword")
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=self.etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_not_found(self):
+        url = reverse("accounts:user_profile", kwargs={"username": "nobody"})
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
 class TestUserProfileEditView(TestCase):
     def test_success_get(self):
         pass
@@ -389,6 +488,15 @@ class TestFollowView(TestCase):
             ).exists()
         )
 
+    def test_follow_counts(self):
+        url = reverse("accounts:follow", kwargs={"username": self.user2.username})
+        self.client.post(url)
+        self.client.post(url)
+        self.user1.refresh_from_db()
+        self.user2.refresh_from_db()
+        self.assertEqual(self.user1.following_count, 1)
+        self.assertEqual(self.user2.followers_count, 1)
+
     def test_failure_post_with_not_exist_user(self):
         url = reverse("accounts:follow", kwargs={"username": "not_exist_username"})
         response = self.client.post(url)
@@ -426,6 +534,17 @@ class TestUnfollowView(TestCase):
         self.client.login(username="testuser1", password="testpassword")
         FriendShip.objects.create(follower=self.user1, following=self.user2)
 
+    def test_follow_counts(self):
+        follows.follow(self.user2, self.user1)
+        url = reverse("accounts:unfollow", kwargs={"username": self.user2.username})
+        self.client.post(url)
+        self.client.post(url)
+        self.user1.refresh_from_db()
+        self.user2.refresh_from_db()
+        self.assertEqual(self.user1.following_count, 0)
+        self.assertEqual(self.user1.followers_count, 1)
+        self.assertEqual(self.user2.followers_count, 0)
+
     def test_success_post(self):
         url = reverse("accounts:unfollow", kwargs={"username": self.user2.username})
         response = self.client.post(url)
@@ -495,3 +614,299 @@ class TestFollowerListView(TestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, "accounts/follower_list.html")
+
+
+class TestFollowListPagination(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="testuser",
+            password="testpassword",
+        )
+        self.client.login(username="testuser", password="testpassword")
+        others = User.objects.bulk_create(
+            User(username=f"testuser{i}") for i in range(25)
+        )
+        FriendShip.objects.bulk_create(
+            FriendShip(follower=self.user, following=other) for other in others
+        )
+        FriendShip.objects.bulk_create(
+            FriendShip(follower=other, following=self.user) for other in others
+        )
+
+    def assert_paginated(self, name, context_name):
+        url = reverse(name, kwargs={"username": self.user.username})
+        response = self.client.get(url)
+        first = list(response.context[context_name])
+        response = self.client.get(url, {"cursor": response.context["next_cursor"]})
+        second = list(response.context[context_name])
+        self.assertEqual(len(first), 20)
+        self.assertEqual(len(second), 5)
+        self.assertFalse(set(first) & set(second))
+        self.assertIsNone(response.context["next_cursor"])
+
+    def test_following_list(self):
+        self.assert_paginated("accounts:following_list", "following_list")
+
+    def test_follower_list(self):
+        self.assert_paginated("accounts:follower_list", "follower_list")
+
+    def test_failure_get_with_invalid_cursor(self):
+        url = reverse("accounts:follower_list", kwargs={"username": "testuser"})
+        response = self.client.get(url, {"cursor": "invalid"})
+        self.assertEqual(response.status_code, 404)
+
+
+class TestRepairFollowCounts(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(username="testuser1")
+        self.user2 = User.objects.create_user(username="testuser2")
+        FriendShip.objects.create(follower=self.user1, following=self.user2)
+        User.objects.filter(id=self.user2.id).update(following_count=3)
+
+    def test_repair_drift(self):
+        out = StringIO()
+        call_command("repair_follow_counts", stdout=out)
+        self.assertIn("2 人", out.getvalue())
+        self.user1.refresh_from_db()
+        self.user2.refresh_from_db()
+        self.assertEqual(self.user1.following_count, 1)
+        self.assertEqual(self.user1.followers_count, 0)
+        self.assertEqual(self.user2.following_count, 0)
+        self.assertEqual(self.user2.followers_count, 1)
+
+
+class TestAsyncFollowView(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(
+            username="testuser1",
+            password="testpassword",
+        )
+        self.user2 = User.objects.create_user(
+            username="testuser2",
+            password="testpassword",
+        )
+        self.async_client.force_login(self.user1)
+        self.follow_url = reverse(
+            "accounts:follow_async", kwargs={"username": "testuser2"}
+        )
+        self.unfollow_url = reverse(
+            "accounts:unfollow_async", kwargs={"username": "testuser2"}
+        )
+
+    async def test_follow_and_unfollow(self):
+        response = await self.async_client.post(self.follow_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(),
+            {"username": "testuser2", "is_following": True, "followers_count": 1},
+        )
+        self.assertTrue(
+            await FriendShip.objects.filter(
+                follower=self.user1, following=self.user2
+            ).aexists()
+        )
+
+        # 2回目はカウンタを増やさない
+        response = await self.async_client.post(self.follow_url)
+        self.assertEqual(response.json()["followers_count"], 1)
+
+        response = await self.async_client.post(self.unfollow_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(),
+            {"username": "testuser2", "is_following": False, "followers_count": 0},
+        )
+        self.assertFalse(await FriendShip.objects.aexists())
+        user1 = await User.objects.aget(id=self.user1.id)
+        self.assertEqual(user1.following_count, 0)
+
+    async def test_follow_backfills_timeline(self):
+        await Tweet.objects.acreate(user=self.user2, content="testpost")
+        await self.async_client.post(self.follow_url)
+        self.assertTrue(await TimelineEntry.objects.filter(owner=self.user1).aexists())
+        await self.async_client.post(self.unfollow_url)
+        self.assertFalse(await TimelineEntry.objects.filter(owner=self.user1).aexists())
+
+    async def test_follow_self(self):
+        url = reverse("accounts:follow_async", kwargs={"username": "testuser1"})
+        response = await self.async_client.post(url)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(await FriendShip.objects.aexists())
+
+    async def test_not_exist_user(self):
+        url = reverse("accounts:follow_async", kwargs={"username": "nobody"})
+        response = await self.async_client.post(url)
+        self.assertEqual(response.status_code, 404)
+
+    async def test_login_required(self):
+        response = await AsyncClient().post(self.follow_url)
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(await FriendShip.objects.aexists())
+
+
+class TestSocialGraphIO(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        users = [
+            User.objects.create_user(username=f"user{i}", password="testpassword")
+            for i in range(3)
+        ]
+        follows.follow(users[0], users[1])
+        follows.follow(users[2], users[1])
+        follows.follow(users[1], users[0])
+        tweets = [
+            Tweet.objects.create(user=users[1], content='改行\nと, カンマと "引用符"'),
+            Tweet.objects.create(user=users[0], content="#django の話"),
+        ]
+        Like.objects.create(user=users[0], tweet=tweets[0])
+        Like.objects.create(user=users[2], tweet=tweets[0])
+        Tweet.objects.filter(id=tweets[0].id).update(like_count=2)
+        self.snapshot = self.dump()
+
+    def dump(self):
+        return {
+            name: list(model.objects.order_by("pk").values_list(*fields))
+            for name, model, fields in social_graph.SECTIONS
+        }
+
+    def path(self, name):
+        return os.path.join(self.dir.name, name)
+
+    def export(self, fmt, output):
+        out = StringIO()
+        call_command("export_social_graph", output, format=fmt, stdout=out)
+        self.assertIn(
+            "書き出しました: 10 行 (user 3, friendship 3, tweet 2, like 2)", out.getvalue()
+        )
+
+    def import_(self, source, **options):
+        out = StringIO()
+        call_command("import_social_graph", source, stdout=out, **options)
+        return out.getvalue()
+
+    def assertRestored(self):
+        self.assertEqual(self.dump(), self.snapshot)
+        # カウンタ・タイムライン・検索の索引は読み込んだ後で作り直す
+        user1 = User.objects.get(username="user1")
+        self.assertEqual((user1.followers_count, user1.following_count), (2, 1))
+        self.assertEqual(Tweet.objects.get(user=user1).like_count, 2)
+        self.assertTrue(TimelineEntry.objects.filter(owner__username="user0").exists())
+        self.assertEqual(len(search_tweets("カンマ")), 1)
+        self.assertTrue(self.client.login(username="user0", password="testpassword"))
+
+    def test_ndjson_round_trip(self):
+        self.export("ndjson", self.path("graph.ndjson"))
+        with open(self.path("graph.ndjson"), encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(
+            [r["type"] for r in records],
+            ["user"] * 3 + ["friendship"] * 3 + ["tweet"] * 2 + ["like"] * 2,
+        )
+
+        User.objects.all().delete()
+        output = self.import_(self.path("graph.ndjson"), batch_size=2)
+        self.assertIn("読み込みました: 10 行", output)
+        self.assertRestored()
+
+    def test_csv_round_trip(self):
+        self.export("csv", self.path("graph"))
+        self.assertEqual(
+            sorted(os.listdir(self.path("graph"))),
+            ["friendships.csv", "likes.csv", "tweets.csv", "users.csv"],
+        )
+        User.objects.all().delete()
+        self.import_(self.path("graph"), batch_size=2)
+        self.assertRestored()
+
+    def test_resume_from_checkpoint(self):
+        self.export("ndjson", self.path("graph.ndjson"))
+        User.objects.all().delete()
+        checkpoint = self.path("import.checkpoint")
+        flush = social_graph.Importer.flush
+        calls = []
+
+        def fail_on_third(importer, name, objs, offset):
+            calls.append(name)
+            if len(calls) == 3:
+                raise RuntimeError("止まった")
+            flush(importer, name, objs, offset)
+
+        with mock.patch.object(social_graph.Importer, "flush", fail_on_third):
+            with self.assertRaises(RuntimeError):
+                self.import_(
+                    self.path("graph.ndjson"), batch_size=2, checkpoint=checkpoint
+                )
+        with open(checkpoint, encoding="utf-8") as f:
+            self.assertEqual(json.load(f)["rows"], {"user": 3})
+
+        output = self.import_(
+            self.path("graph.ndjson"), batch_size=2, checkpoint=checkpoint
+        )
+        self.assertIn("チェックポイントから再開します", output)
+        # 続きの 7 行だけを読み込む
+        self.assertIn("読み込みました: 7 行", output)
+        self.assertFalse(os.path.exists(checkpoint))
+        self.assertRestored()
+
+    def test_resume_after_commit_before_checkpoint(self):
+        # バッチをコミットした後、チェックポイントを書く前に止まったら、そのバッチだけ入れ直しになる
+        self.export("ndjson", self.path("graph.ndjson"))
+        User.objects.all().delete()
+        checkpoint = self.path("import.checkpoint")
+        save = social_graph.Checkpoint.save
+        calls = []
+
+        def fail_on_third(cp, section, offset, rows):
+            calls.append(section)
+            if len(calls) == 3:
+                raise RuntimeError("止まった")
+            save(cp, section, offset, rows)
+
+        with mock.patch.object(social_graph.Checkpoint, "save", fail_on_third):
+            with self.assertRaises(RuntimeError):
+                self.import_(
+                    self.path("graph.ndjson"), batch_size=2, checkpoint=checkpoint
+                )
+        self.assertEqual(FriendShip.objects.count(), 2)
+
+        output = self.import_(
+            self.path("graph.ndjson"), batch_size=3, checkpoint=checkpoint
+        )
+        # 入れ直した 2 行は数えない
+        self.assertIn("読み込みました: 5 行 (friendship 1, tweet 2, like 2)", output)
+        self.assertRestored()
+
+    def test_conflict_is_an_error(self):
+        # チェックポイントの外で同じ id の行があれば、飛ばさずに止める
+        self.export("ndjson", self.path("graph.ndjson"))
+        with self.assertRaisesMessage(CommandError, "読み込めませんでした"):
+            self.import_(self.path("graph.ndjson"), skip_derived=True)
+        self.assertEqual(self.dump(), self.snapshot)
+
+    def test_checkpoint_of_other_source(self):
+        checkpoint = self.path("import.checkpoint")
+        with open(checkpoint, "w", encoding="utf-8") as f:
+            json.dump({"source": "/other.ndjson", "format": "ndjson"}, f)
+        with self.assertRaisesMessage(CommandError, "別の入力"):
+            self.import_(self.path("graph.ndjson"), checkpoint=checkpoint)
+
+    def test_missing_reference(self):
+        with open(self.path("broken.ndjson"), "w", encoding="utf-8") as f:
+            f.write(
+                json.dumps(
+                    {
+                        "type": "like",
+                        "id": 99,
+                        "tweet_id": 999,
+                        "user_id": 999,
+                        "created_at": "2024-01-01T00:00:00+00:00",
+                    }
+                )
+                + "\n"
+            )
+        # バッチごとにコミットするので、確認で見つかった行は残る (テストでは巻き戻しておく)
+        with transaction.atomic():
+            with self.assertRaisesMessage(CommandError, "tweets_like"):
+                self.import_(self.path("broken.ndjson"), skip_derived=True)
+            transaction.set_rollback(True)
@@ -10,6 +10,16 @@ urlpatterns = [
     path("<str:username>/", views.UserProfileView.as_view(), name="user_profile"),
     path("<str:username>/follow/", views.FollowView.as_view(), name="follow"),
     path("<str:username>/unfollow/", views.UnFollowView.as_view(), name="unfollow"),
+    path(
+        "<str:username>/follow/async/",
+        views.AsyncFollowView.as_view(),
+        name="follow_async",
+    ),
+    path(
+        "<str:username>/unfollow/async/",
+        views.AsyncUnFollowView.as_view(),
+        name="unfollow_async",
+    ),
     path(
         "<str:username>/following_list/",
         views.FollowingListView.as_view(),
@@ -1,14 +1,25 @@
+from asgiref.sync import sync_to_async
 from django.contrib import messages
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.views import LoginView, LogoutView
+from django.http import Http404, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse_lazy
 from django.views import View
 from django.views.generic import DetailView, ListView
 from django.views.generic.edit import CreateView
 
+from mysite.db_router import ReplicaReadMixin
+from suggestions import index as suggestions
+from tweets import tasks as timeline_tasks
+from tweets import timeline_cache
+from tweets.conditional import ConditionalGetMixin
+from tweets.pagination import InvalidCursor, paginate, paginate_or_404
+
+from . import follows
 from .forms import LoginForm, SignUpForm
+from .mixins import AsyncLoginRequiredMixin
 from .models import FriendShip, User
 
 
@@ -50,39 +61,71 @@ class UserLogoutView(LoginRequiredMixin, LogoutView):
     template_name = "accounts/logout.html"
 
 
-class UserProfileView(LoginRequiredMixin, DetailView):
+class UserProfileView(
+    LoginRequiredMixin, ConditionalGetMixin, ReplicaReadMixin, DetailView
+):
     model = User
     context_object_name = "user"
     template_name = "accounts/profile.html"
     slug_field = "username"
     slug_url_kwarg = "username"
 
+    def get_stamp_pairs(self):
+        # 相手のツイート・そのいいね数・ユーザー名・フォロー数 (とフォローボタン)、自分のいいね状態
+        # 相手はここで1回だけ読み、200 のときも get_object で使い回す
+        self.object = get_object_or_404(User, username=self.kwargs["username"])
+        return [
+            ("author", self.object.id),
+            ("author_likes", self.object.id),
+            ("user", self.object.id),
+            ("follow", self.object.id),
+            ("viewer_likes", self.request.user.id),
+            ("notifications", self.request.user.id),
+            ("suggestions", 0),
+            ("follow", self.request.user.id),
+        ]
+
+    def get_object(self, queryset=None):
+        if getattr(self, "object", None) is not None:
+            return self.object
+        return super().get_object(queryset)
+
     def get_context_data(self, **kwargs):
         # Insert the single object into the context dict.
         context = super().get_context_data(**kwargs)
         # 既存のコンテキストデータを取得
         # ↓↓ 追加したい情報たち
         user = self.object
-        tweet_list = user.tweets.prefetch_related("likes").order_by("-created_at")
+        cursor = self.request.GET.get("cursor")
+        try:
+            page = timeline_cache.cached_page(
+                f"profile:{user.id}:{cursor or ''}",
+                [("author", user.id)],
+                lambda: paginate(user.tweets.select_related("user"), cursor),
+            )
+        except InvalidCursor:
+            raise Http404("無効なカーソルです。")
         # User＆Tweetテーブルを合体させる(INNER JOIN)
         # オブジェクト名.related_name.クエリセットAPI：1対多 の参照。
+        tweet_list = timeline_cache.annotate_viewer_state(
+            self.request.user, page.object_list
+        )
+        # いいね済みかどうかは表示するページのツイートの分だけ1回のクエリで取ってくる
         is_following = FriendShip.objects.filter(
             following=user, follower=self.request.user
         ).exists()
         # exists() : boolの代わりに、少なくともひとつ以上の結果があるか判断するクエリセットAPI(なくても行けそう)
         # 参考：https://man.plustar.jp/django/ref/models/querysets.html#django.db.models.query.QuerySet.exists
-        following_count = FriendShip.objects.filter(follower=user).count()
-        follower_count = FriendShip.objects.filter(following=user).count()
-        login_user = self.request.user
-        liked_list = login_user.likes.values_list("tweet", flat=True)
         context = {
             "user": user,
             "tweet_list": tweet_list,
+            "next_cursor": page.next_cursor,
             "is_following": is_following,
-            "following_count": following_count,
-            "follower_count": follower_count,
-            "liked_list": liked_list,
+            "following_count": user.following_count,
+            "follower_count": user.followers_count,
+            "suggestion_list": suggestions.suggestions_for(self.request.user),
         }
+        # フォロー数・フォロワー数は User に持たせたカウンタをそのまま使う (COUNT しない)
         return context
 
 
@@ -96,11 +139,12 @@ class FollowView(LoginRequiredMixin, View):
             # == : 比較演算子
             messages.warning(request, "無効な操作です。")
             return render(request, "tweets/home.html")
-        elif FriendShip.objects.filter(follower=follower, following=following).exists():
+        elif not follows.follow(follower, following):
             messages.warning(request, f"あなたはすでに { following.username } をフォローしています。")
             return render(request, "tweets/home.html")
         else:
-            FriendShip.objects.create(follower=follower, following=following)
+            timeline_tasks.backfill_timeline.defer(follower.id, following.id)
+            # 相手の最近のツイートを自分のタイムラインへ入れておく (ワーカーで)
             messages.info(request, f"{ following.username } をフォローしました。")
             return redirect("tweets:home")
 
@@ -110,40 +154,89 @@ class UnFollowView(LoginRequiredMixin, View):
         follower = self.request.user
         following = get_object_or_404(User, username=self.kwargs["username"])
 
-        if friend := FriendShip.objects.filter(following=following, follower=follower):
-            friend.delete()
+        if follows.unfollow(follower, following):
+            timeline_tasks.remove_author_timeline.defer(follower.id, following.id)
             messages.info(request, f"{following.username} のフォローを解除しました。")
             return redirect("tweets:home")
         else:
             messages.warning(request, "無効な操作です。")
             return render(request, "tweets/home.html")
-        # セイウチ演算子：代入文 → 代入式として使えるように！！
-        # 特にif文においては、代入と評価を同時に行うことが出来るようになる。
 
 
-class FollowingListView(LoginRequiredMixin, ListView):
-    model = User
+class AsyncFollowView(AsyncLoginRequiredMixin, View):
+    # FollowView の async 版。画面遷移せず JSON を返す (何度呼んでもフォロー中になるだけ)
+    is_following = True
+
+    async def post(self, request, **kwargs):
+        follower = request.user
+        try:
+            following = await User.objects.aget(username=self.kwargs["username"])
+        except User.DoesNotExist:
+            raise Http404("ユーザーが見つかりませんでした。")
+        if follower == following:
+            return JsonResponse({"error": "無効な操作です。"}, status=400)
+
+        if self.is_following:
+            if await follows.afollow(follower, following):
+                await sync_to_async(timeline_tasks.backfill_timeline.defer)(
+                    follower.id, following.id
+                )
+        elif await follows.aunfollow(follower, following):
+            await sync_to_async(timeline_tasks.remove_author_timeline.defer)(
+                follower.id, following.id
+            )
+
+        followers_count = await (
+            User.objects.filter(id=following.id)
+            .values_list("followers_count", flat=True)
+            .aget()
+        )
+        context = {
+            "username": following.username,
+            "is_following": self.is_following,
+            "followers_count": followers_count,
+        }
+        return JsonResponse(context)
+
+
+class AsyncUnFollowView(AsyncFollowView):
+    is_following = False
+
+
+class FollowingListView(LoginRequiredMixin, ReplicaReadMixin, ListView):
     template_name = "accounts/following_list.html"
+    context_object_name = "following_list"
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
+    def get_queryset(self):
         user = get_object_or_404(User, username=self.kwargs["username"])
-        context["following_list"] = FriendShip.objects.select_related(
-            "following"
-        ).filter(follower=user)
+        self.page = paginate_or_404(
+            FriendShip.objects.select_related("following").filter(follower=user),
+            self.request.GET.get("cursor"),
+        )
         # select_related：User＆FriendShipテーブルを合体させる(INNER JOIN)
+        # フォローした日時 (created_at, id) の新しい順にキーセットでページングする
+        return self.page.object_list
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["next_cursor"] = self.page.next_cursor
         return context
 
 
-class FollowerListView(LoginRequiredMixin, ListView):
-    model = User
+class FollowerListView(LoginRequiredMixin, ReplicaReadMixin, ListView):
     template_name = "accounts/follower_list.html"
+    context_object_name = "follower_list"
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
+    def get_queryset(self):
         user = get_object_or_404(User, username=self.kwargs["username"])
         # urlで表示している人の情報を持ってくる
-        context["follower_list"] = FriendShip.objects.select_related("follower").filter(
-            following=user
+        self.page = paginate_or_404(
+            FriendShip.objects.select_related("follower").filter(following=user),
+            self.request.GET.get("cursor"),
         )
+        return self.page.object_list
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["next_cursor"] = self.page.next_cursor
         return context
@@ -0,0 +1,7 @@
+from django.contrib import admin
+
+from .models import DailyRollup, HourlyRollup, RollupState
+
+admin.site.register(HourlyRollup)
+admin.site.register(DailyRollup)
+admin.site.register(RollupState)
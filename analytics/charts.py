@@ -0,0 +1,132 @@
+from datetime import date, datetime
+from datetime import timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import DailyRollup, HourlyRollup
+from .rollups import HOUR, day_bucket, hour_bucket
+
+# ダッシュボードのグラフ。集計表の行 (数のある区間だけ) を NumPy の配列に並べ、移動平均と SVG の座標もまとめて計算する
+
+WIDTH = 600
+HEIGHT = 120
+
+
+def dense(rows, start, length):
+    # rows: [(bucket, count), ...] を start からの length 区間の配列にする (行の無い区間は 0)
+    values = np.zeros(length, dtype=np.int64)
+    if rows:
+        buckets, counts = np.array(rows, dtype=np.int64).T
+        index = buckets - start
+        inside = (index >= 0) & (index < length)
+        np.add.at(values, index[inside], counts[inside])
+    return values
+
+
+def moving_average(values, window):
+    # 直前 window 区間 (自分を含む) の平均。始めのほうは、あるだけの区間で割る
+    sums = np.concatenate(([0], np.cumsum(values, dtype=np.float64)))
+    end = np.arange(1, len(values) + 1)
+    begin = np.maximum(end - window, 0)
+    return (sums[end] - sums[begin]) / (end - begin)
+
+
+def points(values, top):
+    # SVG の polyline の points 属性。左から右へ、上ほど大きい値
+    if len(values) == 0:
+        return ""
+    x = np.linspace(0, WIDTH, len(values)) if len(values) > 1 else np.zeros(1)
+    y = HEIGHT - np.asarray(values, dtype=np.float64) * (HEIGHT / max(top, 1))
+    return " ".join(f"{a:.1f},{b:.1f}" for a, b in zip(x, y))
+
+
+class Chart:
+    def __init__(self, title, labels, values, window):
+        self.title = title
+        self.labels = labels
+        self.values = values
+        self.average = moving_average(values, window)
+        self.window = window
+        self.total = int(values.sum())
+        self.top = int(values.max()) if len(values) else 0
+        self.points = points(values, self.top)
+        self.average_points = points(self.average, self.top)
+        self.width = WIDTH
+        self.height = HEIGHT
+
+    def rows(self):
+        # 表で見せる用。新しい区間から
+        return [
+            (label, int(value), round(float(average), 1))
+            for label, value, average in zip(self.labels, self.values, self.average)
+        ][::-1]
+
+
+def _rollup_rows(model, subjects, start, end):
+    # subjects: [(metric, subject_id), ...] の区間 [start, end] の行を1回のクエリで読む
+    # {(metric, subject_id): [(bucket, count), ...]}
+    rows = {subject: [] for subject in subjects}
+    condition = Q()
+    for metric, subject_id in subjects:
+        condition |= Q(metric=metric, subject_id=subject_id)
+    for metric, subject_id, bucket, count in model.objects.filter(
+        condition, bucket__gte=start, bucket__lte=end
+    ).values_list("metric", "subject_id", "bucket", "count"):
+        rows[metric, subject_id].append((bucket, count))
+    return rows
+
+
+def hourly_charts(subjects, now=None):
+    # subjects: [(title, metric, subject_id), ...] の直近 ANALYTICS_HOURS 時間
+    length = settings.ANALYTICS_HOURS
+    end = hour_bucket(now or timezone.now())
+    start = end - length + 1
+    rows = _rollup_rows(
+        HourlyRollup,
+        [(metric, subject_id) for _, metric, subject_id in subjects],
+        start,
+        end,
+    )
+    labels = [
+        timezone.localtime(
+            datetime.fromtimestamp(bucket * HOUR, tz=dt_timezone.utc)
+        ).strftime("%m/%d %H:00")
+        for bucket in range(start, end + 1)
+    ]
+    return [
+        Chart(
+            title,
+            labels,
+            dense(rows[metric, subject_id], start, length),
+            settings.ANALYTICS_MOVING_AVERAGE_HOURS,
+        )
+        for title, metric, subject_id in subjects
+    ]
+
+
+def daily_charts(subjects, now=None):
+    # subjects: [(title, metric, subject_id), ...] の直近 ANALYTICS_DAYS 日
+    length = settings.ANALYTICS_DAYS
+    end = day_bucket(now or timezone.now())
+    start = end - length + 1
+    rows = _rollup_rows(
+        DailyRollup,
+        [(metric, subject_id) for _, metric, subject_id in subjects],
+        start,
+        end,
+    )
+    labels = [
+        date.fromordinal(bucket).strftime("%m/%d") for bucket in range(start, end + 1)
+    ]
+    return [
+        Chart(
+            title,
+            labels,
+            dense(rows[metric, subject_id], start, length),
+            settings.ANALYTICS_MOVING_AVERAGE_DAYS,
+        )
+        for title, metric, subject_id in subjects
+    ]
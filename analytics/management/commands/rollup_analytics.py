@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from analytics import rollups
+
+
+class Command(BaseCommand):
+    help = "いいね・フォローを前回の続きから1時間ごと・1日ごとの集計表へ足し込みます。"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None)
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="集計をすべて消して最初から数え直します (取り消されたいいね・フォローも反映されます)。",
+        )
+
+    def handle(self, *args, **options):
+        if options["rebuild"]:
+            totals = rollups.rebuild(options["batch_size"])
+        else:
+            totals = rollups.roll_up_all(options["batch_size"])
+        for source, rolled in totals.items():
+            self.stdout.write(f"{source}: {rolled} 件を集計しました。")
+        deleted = rollups.prune()
+        self.stdout.write(f"{deleted} 件の古い1時間ごとの集計を削除しました。")
@@ -0,0 +1,109 @@
+# Generated by Django 4.1.13 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "metric",
+                    models.CharField(
+                        choices=[
+                            ("tweet_likes", "ツイートへのいいね"),
+                            ("account_likes", "アカウントへのいいね"),
+                            ("followers", "新しいフォロワー"),
+                        ],
+                        max_length=16,
+                    ),
+                ),
+                ("subject_id", models.BigIntegerField()),
+                ("bucket", models.IntegerField()),
+                ("count", models.IntegerField(default=0)),
+            ],
+            options={
+                "verbose_name_plural": "1日ごとの集計",
+                "abstract": False,
+            },
+        ),
+        migrations.CreateModel(
+            name="HourlyRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "metric",
+                    models.CharField(
+                        choices=[
+                            ("tweet_likes", "ツイートへのいいね"),
+                            ("account_likes", "アカウントへのいいね"),
+                            ("followers", "新しいフォロワー"),
+                        ],
+                        max_length=16,
+                    ),
+                ),
+                ("subject_id", models.BigIntegerField()),
+                ("bucket", models.IntegerField()),
+                ("count", models.IntegerField(default=0)),
+            ],
+            options={
+                "verbose_name_plural": "1時間ごとの集計",
+                "abstract": False,
+            },
+        ),
+        migrations.CreateModel(
+            name="RollupState",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("source", models.CharField(max_length=16, unique=True)),
+                ("high_water", models.BigIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name_plural": "集計の進み具合",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="hourlyrollup",
+            constraint=models.UniqueConstraint(
+                fields=("metric", "subject_id", "bucket"), name="hourlyrollup_unique"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="dailyrollup",
+            constraint=models.UniqueConstraint(
+                fields=("metric", "subject_id", "bucket"), name="dailyrollup_unique"
+            ),
+        ),
+    ]
@@ -0,0 +1,58 @@
+from django.db import models
+
+
+class Rollup(models.Model):
+    # いいね・フォローを (指標, 対象, 区間) ごとに数えた表。グラフはこの表だけを読み、Like や FriendShip を数えない
+    # python manage.py rollup_analytics が前回の続き (RollupState) から足し込む
+    TWEET_LIKES = "tweet_likes"
+    ACCOUNT_LIKES = "account_likes"
+    FOLLOWERS = "followers"
+    METRIC_CHOICES = [
+        (TWEET_LIKES, "ツイートへのいいね"),
+        (ACCOUNT_LIKES, "アカウントへのいいね"),
+        (FOLLOWERS, "新しいフォロワー"),
+    ]
+
+    metric = models.CharField(max_length=16, choices=METRIC_CHOICES)
+    subject_id = models.BigIntegerField()
+    # ツイートへのいいねはツイートの id、それ以外はユーザーの id (ツイートやユーザーが消えても過去の数は残す)
+    bucket = models.IntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        abstract = True
+        constraints = [
+            models.UniqueConstraint(
+                fields=["metric", "subject_id", "bucket"],
+                name="%(class)s_unique",
+            ),
+        ]
+        # (metric, subject_id) で絞って bucket の範囲を読むのにも使う
+
+    def __str__(self):
+        return f"{self.metric}:{self.subject_id}@{self.bucket} = {self.count}"
+
+
+class HourlyRollup(Rollup):
+    # bucket は UNIX 時刻 // 3600
+    class Meta(Rollup.Meta):
+        verbose_name_plural = "1時間ごとの集計"
+
+
+class DailyRollup(Rollup):
+    # bucket は TIME_ZONE での日付の date.toordinal()
+    class Meta(Rollup.Meta):
+        verbose_name_plural = "1日ごとの集計"
+
+
+class RollupState(models.Model):
+    # 集計元 (likes / follows) ごとに、どの id まで足し込んだか
+    source = models.CharField(max_length=16, unique=True)
+    high_water = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "集計の進み具合"
+
+    def __str__(self):
+        return f"{self.source} <= {self.high_water}"
@@ -0,0 +1,133 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from accounts.models import FriendShip
+from tweets.models import Like
+
+from .models import DailyRollup, HourlyRollup, Rollup, RollupState
+
+# いいね・フォローの集計表 (HourlyRollup / DailyRollup) への足し込み
+# 集計元の id を RollupState.high_water まで足し込み済みとして、それより大きい id だけを id 順に読む
+# 直近 ANALYTICS_ROLLUP_LAG_SECONDS の行はまだ読まない (id の小さいトランザクションが後からコミットされることがあるため)
+# いいね・フォローの取り消しは引かない (取り消しの記録が無い)。数え直すときは rebuild する
+
+HOUR = 60 * 60
+UPSERT_ROWS = 1000
+
+
+def hour_bucket(dt):
+    return int(dt.timestamp()) // HOUR
+
+
+def day_bucket(dt):
+    return timezone.localdate(dt).toordinal()
+
+
+def _likes(after, limit):
+    rows = (
+        Like.objects.filter(id__gt=after)
+        .order_by("id")
+        .values_list("id", "created_at", "tweet_id", "tweet__user_id")[:limit]
+    )
+    for row_id, created_at, tweet_id, author_id in rows:
+        yield row_id, created_at, [
+            (Rollup.TWEET_LIKES, tweet_id),
+            (Rollup.ACCOUNT_LIKES, author_id),
+        ]
+
+
+def _follows(after, limit):
+    rows = (
+        FriendShip.objects.filter(id__gt=after)
+        .order_by("id")
+        .values_list("id", "created_at", "following_id")[:limit]
+    )
+    for row_id, created_at, following_id in rows:
+        yield row_id, created_at, [(Rollup.FOLLOWERS, following_id)]
+
+
+SOURCES = {"likes": _likes, "follows": _follows}
+
+
+def _add(model, counts):
+    # counts: {(metric, subject_id, bucket): 増分}。INSERT ... ON CONFLICT DO UPDATE で足し込む
+    table = connection.ops.quote_name(model._meta.db_table)
+    count = connection.ops.quote_name("count")
+    items = list(counts.items())
+    with connection.cursor() as cursor:
+        for start in range(0, len(items), UPSERT_ROWS):
+            chunk = items[start : start + UPSERT_ROWS]
+            values = ", ".join(["(%s, %s, %s, %s)"] * len(chunk))
+            cursor.execute(
+                f"INSERT INTO {table} (metric, subject_id, bucket, {count}) "
+                f"VALUES {values} "
+                f"ON CONFLICT (metric, subject_id, bucket) "
+                f"DO UPDATE SET {count} = {table}.{count} + excluded.{count}",
+                [value for key, n in chunk for value in (*key, n)],
+            )
+
+
+def roll_up(source, batch_size=None, now=None):
+    # 集計元 source の続きを最大 batch_size 行だけ足し込み、足し込んだ行数を返す
+    batch_size = batch_size or settings.ANALYTICS_ROLLUP_BATCH_SIZE
+    cutoff = (now or timezone.now()) - timedelta(
+        seconds=settings.ANALYTICS_ROLLUP_LAG_SECONDS
+    )
+    with transaction.atomic():
+        # 同時に動かしても同じ行を二重に数えないよう、進み具合の行をロックしてから読む
+        RollupState.objects.get_or_create(source=source)
+        state = RollupState.objects.select_for_update().get(source=source)
+        hourly, daily = Counter(), Counter()
+        high_water, rolled = state.high_water, 0
+        for row_id, created_at, subjects in SOURCES[source](
+            state.high_water, batch_size
+        ):
+            if created_at >= cutoff:
+                break
+            hour, day = hour_bucket(created_at), day_bucket(created_at)
+            for metric, subject_id in subjects:
+                hourly[metric, subject_id, hour] += 1
+                daily[metric, subject_id, day] += 1
+            high_water, rolled = row_id, rolled + 1
+        if rolled:
+            _add(HourlyRollup, hourly)
+            _add(DailyRollup, daily)
+            state.high_water = high_water
+            state.save(update_fields=["high_water", "updated_at"])
+    return rolled
+
+
+def roll_up_all(batch_size=None, now=None):
+    # すべての集計元を追いつくまで足し込む。{source: 行数}
+    batch_size = batch_size or settings.ANALYTICS_ROLLUP_BATCH_SIZE
+    totals = {}
+    for source in SOURCES:
+        totals[source] = 0
+        while True:
+            rolled = roll_up(source, batch_size, now)
+            totals[source] += rolled
+            if rolled < batch_size:
+                break
+    return totals
+
+
+def rebuild(batch_size=None, now=None):
+    # 集計をすべて消して最初から数え直す (取り消されたいいね・フォローも反映される)
+    with transaction.atomic():
+        HourlyRollup.objects.all().delete()
+        DailyRollup.objects.all().delete()
+        RollupState.objects.all().delete()
+    return roll_up_all(batch_size, now)
+
+
+def prune(now=None):
+    # グラフに使わなくなった古い1時間ごとの集計を消す。1日ごとの集計は残す
+    end = hour_bucket(now or timezone.now())
+    deleted, _ = HourlyRollup.objects.filter(
+        bucket__lte=end - settings.ANALYTICS_HOURLY_RETENTION_SECONDS // HOUR
+    ).delete()
+    return deleted
@@ -0,0 +1,173 @@
+from datetime import timedelta
+from io import StringIO
+
+import numpy as np
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts import follows
+from accounts.models import FriendShip, User
+from mysite.testcases import TestCase
+from tweets.models import Like, Tweet
+
+from . import charts, rollups
+from .models import DailyRollup, HourlyRollup, Rollup, RollupState
+
+
+def backdate(model, seconds):
+    model.objects.update(created_at=timezone.now() - timedelta(seconds=seconds))
+
+
+class TestRollups(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(
+            username="author", password="testpassword"
+        )
+        self.fans = [
+            User.objects.create_user(username=f"fan{i}", password="testpassword")
+            for i in range(3)
+        ]
+        self.tweet = Tweet.objects.create(user=self.author, content="testpost")
+        for fan in self.fans:
+            Like.objects.create(user=fan, tweet=self.tweet)
+            follows.follow(fan, self.author)
+        backdate(Like, 3600)
+        backdate(FriendShip, 3600)
+
+    def counts(self, model, metric, subject_id):
+        return sum(
+            model.objects.filter(metric=metric, subject_id=subject_id).values_list(
+                "count", flat=True
+            )
+        )
+
+    def test_roll_up(self):
+        self.assertEqual(rollups.roll_up_all(), {"likes": 3, "follows": 3})
+        for model in (HourlyRollup, DailyRollup):
+            self.assertEqual(self.counts(model, Rollup.TWEET_LIKES, self.tweet.id), 3)
+            self.assertEqual(
+                self.counts(model, Rollup.ACCOUNT_LIKES, self.author.id), 3
+            )
+            self.assertEqual(self.counts(model, Rollup.FOLLOWERS, self.author.id), 3)
+        self.assertEqual(
+            RollupState.objects.get(source="likes").high_water,
+            Like.objects.order_by("-id").values_list("id", flat=True)[0],
+        )
+
+        # 2回目は前回の続きだけを足す
+        self.assertEqual(rollups.roll_up_all(), {"likes": 0, "follows": 0})
+        Like.objects.create(user=self.author, tweet=self.tweet)
+        backdate(Like, 3600)
+        self.assertEqual(rollups.roll_up_all()["likes"], 1)
+        self.assertEqual(self.counts(DailyRollup, Rollup.TWEET_LIKES, self.tweet.id), 4)
+
+    def test_recent_rows_wait(self):
+        # 直近 ANALYTICS_ROLLUP_LAG_SECONDS の行は次の回に回す
+        rollups.roll_up_all()
+        follows.follow(self.fans[0], self.fans[1])
+        self.assertEqual(rollups.roll_up_all()["follows"], 0)
+        later = timezone.now() + timedelta(minutes=5)
+        self.assertEqual(rollups.roll_up_all(now=later)["follows"], 1)
+
+    def test_batches(self):
+        self.assertEqual(rollups.roll_up("likes", batch_size=2), 2)
+        self.assertEqual(rollups.roll_up("likes", batch_size=2), 1)
+        self.assertEqual(
+            self.counts(HourlyRollup, Rollup.TWEET_LIKES, self.tweet.id), 3
+        )
+
+    def test_rebuild(self):
+        rollups.roll_up_all()
+        Like.objects.filter(user=self.fans[0]).delete()
+        rollups.rebuild()
+        self.assertEqual(self.counts(DailyRollup, Rollup.TWEET_LIKES, self.tweet.id), 2)
+
+    def test_prune(self):
+        HourlyRollup.objects.create(
+            metric=Rollup.FOLLOWERS, subject_id=1, bucket=0, count=1
+        )
+        rollups.roll_up_all()
+        self.assertEqual(rollups.prune(), 1)
+        self.assertTrue(HourlyRollup.objects.exists())
+
+    def test_command(self):
+        out = StringIO()
+        call_command("rollup_analytics", stdout=out)
+        self.assertIn("likes: 3 件を集計しました。", out.getvalue())
+        out = StringIO()
+        call_command("rollup_analytics", rebuild=True, stdout=out)
+        self.assertIn("likes: 3 件を集計しました。", out.getvalue())
+
+
+class TestCharts(TestCase):
+    def test_dense(self):
+        values = charts.dense([(10, 2), (13, 5), (99, 1)], 10, 5)
+        np.testing.assert_array_equal(values, [2, 0, 0, 5, 0])
+
+    def test_moving_average(self):
+        values = np.array([2, 4, 6, 8])
+        np.testing.assert_allclose(
+            charts.moving_average(values, 2), [2.0, 3.0, 5.0, 7.0]
+        )
+        np.testing.assert_allclose(
+            charts.moving_average(values, 10), [2.0, 3.0, 4.0, 5.0]
+        )
+
+    def test_points(self):
+        self.assertEqual(charts.points(np.array([0, 2]), 2), "0.0,120.0 600.0,0.0")
+        self.assertEqual(charts.points(np.array([0, 0]), 0), "0.0,120.0 600.0,120.0")
+
+
+class TestAnalyticsViews(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="testuser", password="testpassword"
+        )
+        self.other = User.objects.create_user(username="other", password="testpassword")
+        self.client.login(username="testuser", password="testpassword")
+        self.tweet = Tweet.objects.create(user=self.user, content="testpost")
+        Like.objects.create(user=self.other, tweet=self.tweet)
+        backdate(Like, 3600)
+        rollups.roll_up_all()
+
+    def test_account(self):
+        # session, user, 1時間ごとの集計, 1日ごとの集計
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse("analytics:account"))
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, "analytics/dashboard.html")
+        likes, followers = response.context["daily_charts"]
+        self.assertEqual(likes.total, 1)
+        self.assertEqual(likes.values[-1] + likes.values[-2], 1)
+        self.assertEqual(len(likes.values), 30)
+        self.assertEqual(followers.total, 0)
+        self.assertEqual(response.context["hourly_charts"][0].total, 1)
+
+    def test_tweet(self):
+        response = self.client.get(reverse("analytics:tweet", args=[self.tweet.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["daily_charts"][0].total, 1)
+        self.assertContains(response, "testpost")
+
+    def test_tweet_of_other_user(self):
+        tweet = Tweet.objects.create(user=self.other, content="testpost")
+        response = self.client.get(reverse("analytics:tweet", args=[tweet.id]))
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(ANALYTICS_DAYS=3)
+    def test_reads_only_rollups(self):
+        Like.objects.all().delete()
+        response = self.client.get(reverse("analytics:account"))
+        self.assertEqual(response.context["daily_charts"][0].total, 1)
+        self.assertEqual(len(response.context["daily_charts"][0].rows()), 3)
+
+    def test_profile_link(self):
+        url = reverse("accounts:user_profile", args=[self.user.username])
+        response = self.client.get(url)
+        self.assertContains(response, reverse("analytics:account"))
+        self.assertContains(response, reverse("analytics:tweet", args=[self.tweet.id]))
+        url = reverse("accounts:user_profile", args=[self.other.username])
+        response = self.client.get(url)
+        self.assertNotContains(response, reverse("analytics:account"))
@@ -0,0 +1,9 @@
+from django.urls import path
+
+from . import views
+
+app_name = "analytics"
+urlpatterns = [
+    path("", views.AccountAnalyticsView.as_view(), name="account"),
+    path("tweets/<int:pk>/", views.TweetAnalyticsView.as_view(), name="tweet"),
+]
@@ -0,0 +1,40 @@
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.views.generic import DetailView, TemplateView
+
+from mysite.db_router import ReplicaReadMixin
+from tweets.models import Tweet
+
+from . import charts
+from .models import Rollup
+
+
+class AccountAnalyticsView(LoginRequiredMixin, ReplicaReadMixin, TemplateView):
+    # 自分のアカウントへのいいねと新しいフォロワー。集計表 (analytics.rollups) だけを読む
+    template_name = "analytics/dashboard.html"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        user_id = self.request.user.id
+        subjects = [
+            ("いいね", Rollup.ACCOUNT_LIKES, user_id),
+            ("新しいフォロワー", Rollup.FOLLOWERS, user_id),
+        ]
+        context["hourly_charts"] = charts.hourly_charts(subjects)
+        context["daily_charts"] = charts.daily_charts(subjects)
+        return context
+
+
+class TweetAnalyticsView(LoginRequiredMixin, ReplicaReadMixin, DetailView):
+    # 自分のツイートへのいいね。他の人のツイートは 404
+    template_name = "analytics/dashboard.html"
+    context_object_name = "tweet"
+
+    def get_queryset(self):
+        return Tweet.objects.filter(user=self.request.user)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        subjects = [("いいね", Rollup.TWEET_LIKES, self.object.id)]
+        context["hourly_charts"] = charts.hourly_charts(subjects)
+        context["daily_charts"] = charts.daily_charts(subjects)
+        return context
@@ -0,0 +1,284 @@
+import argparse
+import copy
+import json
+import os
+import shutil
+import sys
+import tempfile
+from contextlib import contextmanager
+
+# 使い方
+#   python -m benchmarks run --output before.json
+#   python -m benchmarks run --output after.json
+#   python -m benchmarks compare before.json after.json
+#   python -m benchmarks throughput --concurrency 8
+#   python -m benchmarks sqlite --concurrency 8
+#   python -m benchmarks render --size 50 --size 200 --size 1000
+# 実行のたびにテスト用 DB を作って、そこへデータを入れてから計測する (開発用の db.sqlite3 は触らない)
+
+PRIVATE_CACHE_BACKENDS = (
+    "django.core.cache.backends.filebased.FileBasedCache",
+    "django.core.cache.backends.locmem.LocMemCache",
+)
+
+
+@contextmanager
+def test_database(name=None):
+    # name を渡すとファイルの DB (複数スレッドから同時に書き込むとき用)、渡さなければメモリ上の DB
+    # timeline のキャッシュも計測の間だけ別の場所にする (prepare で空にするので、開発用のものを消さない)
+    from django.conf import settings
+    from django.db import connection
+    from django.test.utils import (
+        override_settings,
+        setup_test_environment,
+        teardown_test_environment,
+    )
+
+    setup_test_environment(debug=False)
+    cache_dir = tempfile.mkdtemp(prefix="benchmarks-cache-")
+    caches = copy.deepcopy(settings.CACHES)
+    timeline = caches[settings.TIMELINE_CACHE_ALIAS]
+    # ファイルとプロセス内のキャッシュは LOCATION で分かれる (Redis などはサーバーの指定なので変えない)
+    if timeline["BACKEND"] in PRIVATE_CACHE_BACKENDS:
+        timeline["LOCATION"] = cache_dir
+    cache_settings = override_settings(CACHES=caches)
+    cache_settings.enable()
+    if name:
+        connection.settings_dict["TEST"]["NAME"] = name
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield settings
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        cache_settings.disable()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        teardown_test_environment()
+
+
+def seed_options(args):
+    return {
+        "users": args.users,
+        "tweets": args.tweets,
+        "likes": args.likes,
+        "follows_per_user": args.follows_per_user,
+        "alpha": args.alpha,
+    }
+
+
+def run(args):
+    from .runner import run_benchmarks
+
+    with test_database() as settings:
+        settings.TIMELINE_CACHE_ENABLED = not args.no_cache
+        result = run_benchmarks(
+            names=args.scenario,
+            iterations=args.iterations,
+            memory_iterations=args.memory_iterations,
+            random_seed=args.seed,
+            **seed_options(args),
+        )
+
+    output = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    for name, row in result["scenarios"].items():
+        print(
+            f"{name:<14} p50 {row['p50_ms']:>8.2f}ms  p95 {row['p95_ms']:>8.2f}ms  "
+            f"p99 {row['p99_ms']:>8.2f}ms  queries {row['queries_mean']:>6.2f}  "
+            f"peak {row['peak_memory_kb']:>8.1f}KB"
+        )
+    return 0
+
+
+# sqlite サブコマンドで本番用プロファイル (settings.SQLITE_PRODUCTION_PROFILE) と比べる設定
+# Django の sqlite3 バックエンドそのまま (PRAGMA なし、DEFERRED、リクエストごとに接続し直す)
+SQLITE_BASELINE_PROFILE = {
+    "CONN_MAX_AGE": 0,
+    "CONN_HEALTH_CHECKS": False,
+    "OPTIONS": {},
+}
+
+
+@contextmanager
+def database_profile(profile):
+    # 接続を開く前に default の設定を差し替える (スレッドごとの接続も同じ dict から作られる)
+    from django.db import connection
+
+    saved = {key: connection.settings_dict[key] for key in profile}
+    connection.settings_dict.update(profile)
+    try:
+        yield
+    finally:
+        connection.settings_dict.update(saved)
+
+
+def run_throughput_on_file(args):
+    from .runner import run_throughput_benchmarks
+
+    with tempfile.TemporaryDirectory() as directory:
+        with test_database(os.path.join(directory, "benchmark.sqlite3")) as settings:
+            settings.TIMELINE_CACHE_ENABLED = not args.no_cache
+            return run_throughput_benchmarks(
+                kinds=args.scenario,
+                requests=args.requests,
+                concurrency=args.concurrency,
+                random_seed=args.seed,
+                **seed_options(args),
+            )
+
+
+def write_output(args, result):
+    output = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+
+def print_throughput(throughput, prefix=""):
+    for kind, modes in throughput.items():
+        for mode, row in modes.items():
+            print(
+                f"{prefix}{kind:<8}{mode:<6}{row['requests_per_s']:>8.1f} req/s  "
+                f"p50 {row['p50_ms']:>8.2f}ms  p95 {row['p95_ms']:>8.2f}ms  "
+                f"errors {row['errors']}"
+            )
+
+
+def throughput(args):
+    result = run_throughput_on_file(args)
+    write_output(args, result)
+    print_throughput(result["throughput"])
+    return 0
+
+
+def sqlite(args):
+    from django.conf import settings
+
+    profiles = {
+        "baseline": SQLITE_BASELINE_PROFILE,
+        "production": {
+            key: value
+            for key, value in settings.SQLITE_PRODUCTION_PROFILE.items()
+            if key != "ENGINE"
+        },
+    }
+    result = {"meta": None, "profiles": {}}
+    for name, profile in profiles.items():
+        with database_profile(profile):
+            run = run_throughput_on_file(args)
+        result["meta"] = run["meta"]
+        result["profiles"][name] = run["throughput"]
+
+    write_output(args, result)
+    for name, throughput in result["profiles"].items():
+        print_throughput(throughput, prefix=f"{name:<12}")
+    return 0
+
+
+def render(args):
+    from .rendering import SIZES
+    from .runner import run_rendering_benchmarks
+
+    with test_database():
+        result = run_rendering_benchmarks(
+            sizes=args.size or SIZES,
+            iterations=args.iterations,
+            random_seed=args.seed,
+            **seed_options(args),
+        )
+
+    write_output(args, result)
+    for size, row in result["rendering"].items():
+        print(
+            f"{size:>6} cards  uncached {row['uncached']['cpu_p50_ms']:>9.2f}ms  "
+            f"cached {row['cached']['cpu_p50_ms']:>9.2f}ms  "
+            f"saved {row['saved_cpu_ms']:>9.2f}ms  x{row['speedup']}"
+        )
+    return 0
+
+
+def compare(args):
+    from .compare import compare, format_rows
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    rows = compare(baseline, current, args.threshold)
+    print(format_rows(rows))
+    # 回帰があれば終了コード 1 (CI で落とせるように)
+    return 1 if any(row["regressed"] for row in rows) else 0
+
+
+def add_seed_arguments(parser):
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--tweets", type=int, default=2000)
+    parser.add_argument("--likes", type=int, default=5000)
+    parser.add_argument("--follows-per-user", type=int, default=20)
+    parser.add_argument("--alpha", type=float, default=1.2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--output")
+
+
+def main(argv=None):
+    import django
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mysite.settings")
+    django.setup()
+
+    from .scenarios import SCENARIOS
+    from .throughput import URL_NAMES
+
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="データを入れて計測する")
+    run_parser.add_argument("--scenario", action="append", choices=list(SCENARIOS))
+    run_parser.add_argument("--iterations", type=int, default=100)
+    run_parser.add_argument("--memory-iterations", type=int, default=5)
+    add_seed_arguments(run_parser)
+    run_parser.set_defaults(func=run)
+
+    throughput_parser = subparsers.add_parser(
+        "throughput", help="いいね・フォローを WSGI と ASGI で同時に流して比べる"
+    )
+    throughput_parser.add_argument(
+        "--scenario", action="append", choices=list(URL_NAMES)
+    )
+    throughput_parser.add_argument("--requests", type=int, default=200)
+    throughput_parser.add_argument("--concurrency", type=int, default=8)
+    add_seed_arguments(throughput_parser)
+    throughput_parser.set_defaults(func=throughput)
+
+    sqlite_parser = subparsers.add_parser(
+        "sqlite", help="いいね・フォローの同時実行を SQLite の本番用プロファイルの有無で比べる"
+    )
+    sqlite_parser.add_argument("--scenario", action="append", choices=list(URL_NAMES))
+    sqlite_parser.add_argument("--requests", type=int, default=200)
+    sqlite_parser.add_argument("--concurrency", type=int, default=8)
+    add_seed_arguments(sqlite_parser)
+    sqlite_parser.set_defaults(func=sqlite)
+
+    render_parser = subparsers.add_parser(
+        "render", help="ツイート一覧の描画の CPU 時間をカードのキャッシュの有無で比べる"
+    )
+    render_parser.add_argument("--size", action="append", type=int)
+    render_parser.add_argument("--iterations", type=int, default=20)
+    add_seed_arguments(render_parser)
+    render_parser.set_defaults(func=render)
+
+    compare_parser = subparsers.add_parser("compare", help="2つの結果を比べる")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.2)
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
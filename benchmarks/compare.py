@@ -0,0 +1,41 @@
+# 2つの結果 JSON を比べて、悪くなったシナリオを返す
+# 時間とメモリは揺れるので threshold (割合) を超えたときだけ、クエリ数は1件でも増えたら回帰とみなす
+
+TIMED_METRICS = ("p50_ms", "p95_ms", "p99_ms", "peak_memory_kb")
+COUNTED_METRICS = ("queries_mean", "queries_max")
+
+
+def compare(baseline, current, threshold=0.2):
+    rows = []
+    for name, after in current["scenarios"].items():
+        before = baseline["scenarios"].get(name)
+        if before is None:
+            continue
+        for metric in TIMED_METRICS + COUNTED_METRICS:
+            old, new = before[metric], after[metric]
+            if metric in COUNTED_METRICS:
+                regressed = new > old
+            else:
+                regressed = old > 0 and (new - old) / old > threshold
+            rows.append(
+                {
+                    "scenario": name,
+                    "metric": metric,
+                    "before": old,
+                    "after": new,
+                    "change": (new - old) / old if old else 0.0,
+                    "regressed": regressed,
+                }
+            )
+    return rows
+
+
+def format_rows(rows):
+    lines = [f"{'scenario':<14}{'metric':<16}{'before':>12}{'after':>12}{'change':>10}"]
+    for row in rows:
+        mark = "  <-- regression" if row["regressed"] else ""
+        lines.append(
+            f"{row['scenario']:<14}{row['metric']:<16}"
+            f"{row['before']:>12}{row['after']:>12}{row['change']:>+10.1%}{mark}"
+        )
+    return "\n".join(lines)
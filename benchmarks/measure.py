@@ -0,0 +1,64 @@
+import statistics
+import time
+import tracemalloc
+from contextlib import ExitStack
+
+from django.db import connections
+
+from mysite.middleware import QueryStats
+
+
+def percentile(values, percent):
+    # 最近傍法。件数が少なくても結果が実際に測った値のどれかになる
+    ordered = sorted(values)
+    index = max(0, round(percent / 100 * len(ordered)) - 1)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+def _run(request):
+    stats = QueryStats()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(stats))
+        start = time.perf_counter()
+        response = request()
+        duration = time.perf_counter() - start
+    if response.status_code >= 400:
+        raise RuntimeError(f"status {response.status_code}: {response.request}")
+    return duration, stats.count
+
+
+def measure(scenario, iterations=100, memory_iterations=5, warmup=3):
+    # scenario.prepare() はリクエストの準備 (ログインや相手の選択) をして、計測するリクエストを返す
+    # 時間は tracemalloc なしで測り、メモリのピークは別の回で測る (tracemalloc を入れると遅くなるため)
+    for _ in range(warmup):
+        _run(scenario.prepare())
+
+    durations = []
+    queries = []
+    for _ in range(iterations):
+        duration, count = _run(scenario.prepare())
+        durations.append(duration * 1000)
+        queries.append(count)
+
+    peak = 0
+    tracemalloc.start()
+    try:
+        for _ in range(memory_iterations):
+            request = scenario.prepare()
+            tracemalloc.reset_peak()
+            _run(request)
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "iterations": iterations,
+        "p50_ms": round(percentile(durations, 50), 3),
+        "p95_ms": round(percentile(durations, 95), 3),
+        "p99_ms": round(percentile(durations, 99), 3),
+        "mean_ms": round(statistics.fmean(durations), 3),
+        "queries_mean": round(statistics.fmean(queries), 2),
+        "queries_max": max(queries),
+        "peak_memory_kb": round(peak / 1024, 1),
+    }
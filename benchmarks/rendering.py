@@ -0,0 +1,66 @@
+import statistics
+import time
+
+from django.template.loader import render_to_string
+from django.test import override_settings
+
+from accounts.models import User
+from tweets import timeline_cache, viewer_state
+from tweets.models import Tweet
+
+from .measure import percentile
+
+# ホームのツイート一覧 (tweets/tweet_list.html) の描画だけにかかる CPU 時間を、カードのキャッシュの有無で比べる
+# DB から読む時間は含めない (ツイートといいね状態は先に読んでおく)
+
+SIZES = (50, 200, 1000)
+
+
+def load_cards(dataset, size):
+    viewer = User.objects.get(id=dataset.user_ids[-1])
+    tweet_ids = dataset.tweet_ids[-size:]
+    tweets = Tweet.objects.select_related("user").in_bulk(tweet_ids)
+    return viewer_state.annotate_viewer_state(
+        viewer, [tweets[tweet_id] for tweet_id in reversed(tweet_ids)]
+    )
+
+
+def cpu_times(tweets, iterations):
+    times = []
+    for _ in range(iterations):
+        start = time.process_time()
+        render_to_string("tweets/tweet_list.html", {"tweet_list": tweets})
+        times.append((time.process_time() - start) * 1000)
+    return times
+
+
+def summarize(times):
+    return {
+        "cpu_mean_ms": round(statistics.mean(times), 3),
+        "cpu_p50_ms": round(percentile(times, 50), 3),
+        "cpu_p95_ms": round(percentile(times, 95), 3),
+    }
+
+
+def run_rendering(dataset, sizes=SIZES, iterations=20):
+    results = {}
+    for size in sizes:
+        tweets = load_cards(dataset, size)
+        with override_settings(TWEET_CARD_CACHE_ENABLED=False):
+            # テンプレートの読み込みを計測から外す
+            cpu_times(tweets, 1)
+            uncached = summarize(cpu_times(tweets, iterations))
+        with override_settings(TWEET_CARD_CACHE_ENABLED=True):
+            timeline_cache.get_cache().clear()
+            # 1回目でカードをキャッシュに入れておく
+            cpu_times(tweets, 1)
+            cached = summarize(cpu_times(tweets, iterations))
+        results[str(len(tweets))] = {
+            "uncached": uncached,
+            "cached": cached,
+            "saved_cpu_ms": round(uncached["cpu_p50_ms"] - cached["cpu_p50_ms"], 3),
+            "speedup": round(uncached["cpu_p50_ms"] / cached["cpu_p50_ms"], 2)
+            if cached["cpu_p50_ms"]
+            else None,
+        }
+    return results
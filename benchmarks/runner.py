@@ -0,0 +1,106 @@
+import platform
+import random
+import subprocess
+from datetime import datetime, timezone
+
+import django
+from django.conf import settings
+from django.core.cache import caches
+
+from . import seed as seeding
+from .measure import measure
+from .rendering import SIZES, run_rendering
+from .scenarios import SCENARIOS
+from .throughput import URL_NAMES, run_throughput
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def metadata(**options):
+    return {
+        "commit": git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "database": settings.DATABASES["default"]["ENGINE"],
+        "timeline_cache": settings.TIMELINE_CACHE_ENABLED,
+        "tasks_eager": settings.TASKS_EAGER,
+        **options,
+    }
+
+
+def prepare(random_seed, seed_options):
+    # DB は空であること (python -m benchmarks がテスト用 DB を作ってから呼ぶ)
+    for cache in caches.all():
+        cache.clear()
+    dataset = seeding.seed(random_seed=random_seed, **seed_options)
+    return dataset, random.Random(random_seed)
+
+
+def run_benchmarks(
+    names=None,
+    iterations=100,
+    memory_iterations=5,
+    random_seed=0,
+    **seed_options,
+):
+    dataset, rng = prepare(random_seed, seed_options)
+    results = {}
+    for name in names or SCENARIOS:
+        scenario = SCENARIOS[name](dataset, rng)
+        results[name] = measure(scenario, iterations, memory_iterations)
+    return {
+        "meta": metadata(
+            iterations=iterations, random_seed=random_seed, seed=seed_options
+        ),
+        "scenarios": results,
+    }
+
+
+def run_throughput_benchmarks(
+    kinds=None,
+    requests=200,
+    concurrency=8,
+    random_seed=0,
+    **seed_options,
+):
+    dataset, rng = prepare(random_seed, seed_options)
+    results = run_throughput(
+        dataset, rng, kinds or list(URL_NAMES), requests, concurrency
+    )
+    return {
+        "meta": metadata(
+            requests=requests,
+            concurrency=concurrency,
+            random_seed=random_seed,
+            seed=seed_options,
+        ),
+        "throughput": results,
+    }
+
+
+def run_rendering_benchmarks(
+    sizes=SIZES,
+    iterations=20,
+    random_seed=0,
+    **seed_options,
+):
+    # 一番大きいページの分だけツイートがあること
+    seed_options["tweets"] = max(seed_options.get("tweets", 0), *sizes)
+    dataset, _ = prepare(random_seed, seed_options)
+    return {
+        "meta": metadata(
+            iterations=iterations, random_seed=random_seed, seed=seed_options
+        ),
+        "rendering": run_rendering(dataset, sizes, iterations),
+    }
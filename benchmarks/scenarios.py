@@ -0,0 +1,110 @@
+from django.test import Client
+from django.urls import reverse
+
+from accounts import follows
+from accounts.models import User
+from tweets import timeline
+
+# 計測するシナリオ。prepare() で毎回ログインし直して相手を選び、計測対象のリクエストを返す
+# ログインや相手選びのクエリは計測に含めない
+
+
+class Scenario:
+    name = None
+
+    def __init__(self, dataset, rng):
+        self.dataset = dataset
+        self.rng = rng
+        self.client = Client()
+        self.users = User.objects.in_bulk(dataset.user_ids)
+
+    def login(self):
+        user = self.users[self.rng.choice(self.dataset.user_ids)]
+        self.client.force_login(user)
+        return user
+
+    def prepare(self):
+        raise NotImplementedError
+
+
+class HomeScenario(Scenario):
+    name = "home"
+
+    def prepare(self):
+        self.login()
+        return lambda: self.client.get(reverse("tweets:home"))
+
+
+class ProfileScenario(Scenario):
+    name = "profile"
+
+    def prepare(self):
+        self.login()
+        user = self.users[self.dataset.popular_user_id(self.rng)]
+        url = reverse("accounts:user_profile", kwargs={"username": user.username})
+        return lambda: self.client.get(url)
+
+
+class LikeScenario(Scenario):
+    name = "like"
+
+    def prepare(self):
+        self.login()
+        tweet_id = self.rng.choice(self.dataset.tweet_ids)
+        url = reverse("tweets:like", kwargs={"pk": tweet_id})
+        return lambda: self.client.post(url)
+
+
+class FollowScenario(Scenario):
+    name = "follow"
+
+    def prepare(self):
+        user = self.login()
+        following = self.users[self.dataset.popular_user_id(self.rng)]
+        while following == user:
+            following = self.users[self.rng.choice(self.dataset.user_ids)]
+        # すでにフォロー中なら外しておき、毎回「新しくフォローする」処理を測る
+        if follows.unfollow(user, following):
+            timeline.remove_author(user, following)
+        url = reverse("accounts:follow", kwargs={"username": following.username})
+        return lambda: self.client.post(url)
+
+
+class TweetCreateScenario(Scenario):
+    name = "tweet_create"
+
+    def prepare(self):
+        self.login()
+        data = {"content": f"benchmark {self.rng.random()}"}
+        return lambda: self.client.post(reverse("tweets:create"), data)
+
+
+class SearchScenario(Scenario):
+    name = "search"
+
+    def prepare(self):
+        self.login()
+        query = f"tweet {self.rng.randrange(100)}"
+        return lambda: self.client.get(reverse("search:index"), {"q": query})
+
+
+class TrendsScenario(Scenario):
+    name = "trends"
+
+    def prepare(self):
+        self.login()
+        return lambda: self.client.get(reverse("trends:json"))
+
+
+SCENARIOS = {
+    scenario.name: scenario
+    for scenario in [
+        HomeScenario,
+        ProfileScenario,
+        LikeScenario,
+        FollowScenario,
+        TweetCreateScenario,
+        SearchScenario,
+        TrendsScenario,
+    ]
+}
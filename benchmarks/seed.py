@@ -0,0 +1,122 @@
+import random
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+
+from accounts.models import FriendShip, User
+from search import index as search_index
+from tweets import timeline
+from tweets.models import Like, Tweet
+
+BATCH_SIZE = 1000
+PASSWORD = "benchmark-password"
+
+
+class Dataset:
+    def __init__(self, user_ids, tweet_ids, weights):
+        self.user_ids = user_ids
+        self.tweet_ids = tweet_ids
+        # ユーザーごとの人気 (フォローされやすさ)。シナリオで相手を選ぶときにも使う
+        self.weights = weights
+
+    def popular_user_id(self, rng):
+        return rng.choices(self.user_ids, self.weights)[0]
+
+
+def power_law_weights(n, alpha):
+    # 順位 r のユーザーが選ばれる重みを 1 / r^alpha にする (少数のユーザーにフォローが集中する)
+    return [1 / (rank + 1) ** alpha for rank in range(n)]
+
+
+def seed(
+    users=200,
+    tweets=2000,
+    likes=5000,
+    follows_per_user=20,
+    alpha=1.2,
+    random_seed=0,
+):
+    # 件数の多いテーブルは bulk_create でまとめて入れ、カウンタとタイムラインは最後に揃える
+    rng = random.Random(random_seed)
+    password = make_password(PASSWORD)
+    User.objects.bulk_create(
+        [
+            User(username=f"bench{i}", email=f"bench{i}@example.com", password=password)
+            for i in range(users)
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    user_ids = list(
+        User.objects.filter(username__startswith="bench")
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
+    weights = power_law_weights(len(user_ids), alpha)
+
+    follows = set()
+    for follower_id in user_ids:
+        count = rng.randint(1, follows_per_user * 2)
+        for following_id in rng.choices(user_ids, weights, k=count):
+            if following_id != follower_id:
+                follows.add((follower_id, following_id))
+    FriendShip.objects.bulk_create(
+        [
+            FriendShip(follower_id=follower_id, following_id=following_id)
+            for follower_id, following_id in follows
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    followers = Counter(following_id for _, following_id in follows)
+    following = Counter(follower_id for follower_id, _ in follows)
+    User.objects.bulk_update(
+        [
+            User(
+                id=user_id,
+                followers_count=followers[user_id],
+                following_count=following[user_id],
+            )
+            for user_id in user_ids
+        ],
+        ["followers_count", "following_count"],
+        batch_size=BATCH_SIZE,
+    )
+
+    authors = [rng.choice(user_ids) for _ in range(tweets)]
+    Tweet.objects.bulk_create(
+        [
+            Tweet(
+                user_id=author_id,
+                content=f"benchmark tweet {i}",
+                pulled=followers[author_id] >= settings.TIMELINE_FANOUT_THRESHOLD,
+            )
+            for i, author_id in enumerate(authors)
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    tweet_ids = list(
+        Tweet.objects.filter(user__in=user_ids)
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
+
+    liked = {(rng.choice(user_ids), rng.choice(tweet_ids)) for _ in range(likes)}
+    Like.objects.bulk_create(
+        [Like(user_id=user_id, tweet_id=tweet_id) for user_id, tweet_id in liked],
+        batch_size=BATCH_SIZE,
+    )
+    like_counts = Counter(tweet_id for _, tweet_id in liked)
+    Tweet.objects.bulk_update(
+        [
+            Tweet(id=tweet_id, like_count=count)
+            for tweet_id, count in like_counts.items()
+        ],
+        ["like_count"],
+        batch_size=BATCH_SIZE,
+    )
+
+    for user in User.objects.filter(id__in=user_ids):
+        timeline.rebuild(user)
+    # bulk_create ではシグナルが飛ばないので、検索の索引もまとめて作る
+    search_index.rebuild()
+    return Dataset(user_ids, tweet_ids, weights)
@@ -0,0 +1,118 @@
+import random
+
+from accounts.models import FriendShip, User
+from mysite.testcases import TestCase, TransactionTestCase
+from tweets.models import Like, TimelineEntry, Tweet
+
+from .compare import compare
+from .measure import percentile
+from .rendering import run_rendering
+from .runner import run_benchmarks
+from .scenarios import SCENARIOS
+from .seed import seed
+from .throughput import run_throughput
+
+
+class TestSeed(TestCase):
+    def test_seed(self):
+        dataset = seed(users=30, tweets=100, likes=200, follows_per_user=5)
+        self.assertEqual(len(dataset.user_ids), 30)
+        self.assertEqual(Tweet.objects.count(), 100)
+        self.assertTrue(TimelineEntry.objects.exists())
+        # カウンタが実際の行数と揃っている
+        for user in User.objects.all():
+            self.assertEqual(
+                user.followers_count, FriendShip.objects.filter(following=user).count()
+            )
+            self.assertEqual(
+                user.following_count, FriendShip.objects.filter(follower=user).count()
+            )
+        for tweet in Tweet.objects.all():
+            self.assertEqual(tweet.like_count, Like.objects.filter(tweet=tweet).count())
+
+    def test_power_law(self):
+        # 人気順の先頭ユーザーにフォローが集中する
+        dataset = seed(users=100, tweets=10, likes=10, follows_per_user=10)
+        top = User.objects.get(id=dataset.user_ids[0])
+        median = sorted(
+            User.objects.filter(id__in=dataset.user_ids).values_list(
+                "followers_count", flat=True
+            )
+        )[50]
+        self.assertGreater(top.followers_count, median * 5)
+
+
+class TestRunBenchmarks(TestCase):
+    def test_run(self):
+        result = run_benchmarks(
+            iterations=3,
+            memory_iterations=1,
+            users=20,
+            tweets=50,
+            likes=50,
+            follows_per_user=5,
+        )
+        self.assertEqual(set(result["scenarios"]), set(SCENARIOS))
+        for row in result["scenarios"].values():
+            self.assertLessEqual(row["p50_ms"], row["p95_ms"])
+            self.assertLessEqual(row["p95_ms"], row["p99_ms"])
+            self.assertGreater(row["queries_max"], 0)
+            self.assertGreater(row["peak_memory_kb"], 0)
+
+
+class TestThroughput(TransactionTestCase):
+    def test_run_throughput(self):
+        # WSGI はスレッドから、ASGI はリクエストごとのスレッドから DB に繋ぐので TransactionTestCase にする
+        dataset = seed(users=10, tweets=20, likes=10, follows_per_user=3)
+        results = run_throughput(dataset, random.Random(0), requests=6, concurrency=1)
+        for kind in ("like", "follow"):
+            for mode in ("wsgi", "asgi"):
+                row = results[kind][mode]
+                self.assertEqual(row["requests"], 6)
+                self.assertEqual(row["errors"], 0)
+                self.assertGreater(row["requests_per_s"], 0)
+
+
+class TestRendering(TestCase):
+    def test_run_rendering(self):
+        dataset = seed(users=10, tweets=30, likes=20, follows_per_user=3)
+        results = run_rendering(dataset, sizes=(5, 20), iterations=2)
+        self.assertEqual(set(results), {"5", "20"})
+        for row in results.values():
+            self.assertGreater(row["uncached"]["cpu_p50_ms"], 0)
+            self.assertIn("saved_cpu_ms", row)
+
+
+class TestCompare(TestCase):
+    def result(self, **values):
+        row = {
+            "p50_ms": 10.0,
+            "p95_ms": 20.0,
+            "p99_ms": 30.0,
+            "peak_memory_kb": 100.0,
+            "queries_mean": 5.0,
+            "queries_max": 5,
+        }
+        row.update(values)
+        return {"scenarios": {"home": row}}
+
+    def regressions(self, rows):
+        return {row["metric"] for row in rows if row["regressed"]}
+
+    def test_no_regression(self):
+        rows = compare(self.result(), self.result(p95_ms=22.0))
+        self.assertEqual(self.regressions(rows), set())
+
+    def test_latency_regression(self):
+        rows = compare(self.result(), self.result(p95_ms=30.0))
+        self.assertEqual(self.regressions(rows), {"p95_ms"})
+
+    def test_query_regression(self):
+        rows = compare(self.result(), self.result(queries_mean=5.5, queries_max=6))
+        self.assertEqual(self.regressions(rows), {"queries_mean", "queries_max"})
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 95), 7)
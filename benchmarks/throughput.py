@@ -0,0 +1,211 @@
+import asyncio
+import secrets
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.wsgi import get_wsgi_application
+from django.test import Client
+from django.urls import reverse
+
+from accounts.models import User
+
+from .measure import percentile
+
+# 同じリクエストの並びを、WSGI (スレッド) と ASGI (イベントループ) のハンドラへ同時に N 本ずつ流して比べる
+# テストクライアントではなく本物のハンドラを呼ぶ (ミドルウェアや CSRF の確認も本番と同じに通る)
+
+# 同時に書き込むので、SQLite はメモリではなくファイルの DB で動かす (python -m benchmarks throughput)
+URL_NAMES = {
+    "like": {
+        "wsgi": ("tweets:like", "tweets:unlike"),
+        "asgi": ("tweets:like_async", "tweets:unlike_async"),
+    },
+    "follow": {
+        "wsgi": ("accounts:follow", "accounts:unfollow"),
+        "asgi": ("accounts:follow_async", "accounts:unfollow_async"),
+    },
+}
+
+
+def login_cookies(users):
+    # ユーザーごとにセッションを作り、CSRF のトークンと一緒に Cookie ヘッダーにしておく
+    token = secrets.token_hex(16)
+    cookies = {}
+    for user in users:
+        client = Client()
+        client.force_login(user)
+        session = client.cookies[settings.SESSION_COOKIE_NAME].value
+        cookies[user.id] = (
+            f"{settings.SESSION_COOKIE_NAME}={session}; "
+            f"{settings.CSRF_COOKIE_NAME}={token}"
+        )
+    return cookies, token
+
+
+def build_plan(kind, dataset, rng, requests, viewers=20):
+    # (ユーザー, いいね/フォローするか, 相手) の並び。WSGI と ASGI で同じ並びを使う
+    users = User.objects.in_bulk(dataset.user_ids[-viewers:])
+    plan = []
+    for i in range(requests):
+        user = users[rng.choice(list(users))]
+        on = i % 2 == 0
+        if kind == "like":
+            target = rng.choice(dataset.tweet_ids)
+        else:
+            target = dataset.popular_user_id(rng)
+            while target == user.id:
+                target = rng.choice(dataset.user_ids)
+        plan.append((user.id, on, target))
+    return plan, users
+
+
+def resolve(kind, mode, plan, usernames):
+    on_name, off_name = URL_NAMES[kind][mode]
+    paths = []
+    for user_id, on, target in plan:
+        if kind == "like":
+            kwargs = {"pk": target}
+        else:
+            kwargs = {"username": usernames[target]}
+        paths.append((user_id, reverse(on_name if on else off_name, kwargs=kwargs)))
+    return paths
+
+
+def wsgi_request(app, path, cookie, token):
+    environ = {
+        "REQUEST_METHOD": "POST",
+        "PATH_INFO": path,
+        "QUERY_STRING": "",
+        "SERVER_NAME": "testserver",
+        "SERVER_PORT": "80",
+        "SERVER_PROTOCOL": "HTTP/1.1",
+        "HTTP_HOST": "testserver",
+        "HTTP_COOKIE": cookie,
+        "HTTP_X_CSRFTOKEN": token,
+        "CONTENT_LENGTH": "0",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": "http",
+        "wsgi.input": BytesIO(),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    statuses = []
+
+    def start_response(status, headers, exc_info=None):
+        statuses.append(int(status.split()[0]))
+
+    response = app(environ, start_response)
+    try:
+        b"".join(response)
+    finally:
+        response.close()
+    return statuses[0]
+
+
+async def asgi_request(app, path, cookie, token):
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [
+            (b"host", b"testserver"),
+            (b"cookie", cookie.encode()),
+            (b"x-csrftoken", token.encode()),
+        ],
+        "client": ("127.0.0.1", 0),
+        "server": ("testserver", 80),
+    }
+    sent = False
+    statuses = []
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            return {"type": "http.disconnect"}
+        sent = True
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            statuses.append(message["status"])
+
+    await app(scope, receive, send)
+    return statuses[0]
+
+
+def summarize(results, elapsed):
+    durations = [duration * 1000 for duration, _ in results]
+    errors = sum(1 for _, status in results if status >= 400)
+    return {
+        "requests": len(results),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_s": round(len(results) / elapsed, 1),
+        "p50_ms": round(percentile(durations, 50), 3),
+        "p95_ms": round(percentile(durations, 95), 3),
+        "p99_ms": round(percentile(durations, 99), 3),
+    }
+
+
+def run_wsgi(paths, cookies, token, concurrency):
+    app = get_wsgi_application()
+
+    def one(item):
+        user_id, path = item
+        start = time.perf_counter()
+        status = wsgi_request(app, path, cookies[user_id], token)
+        return time.perf_counter() - start, status
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(one, paths))
+    return summarize(results, time.perf_counter() - start)
+
+
+def run_asgi(paths, cookies, token, concurrency):
+    app = get_asgi_application()
+
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(item):
+            user_id, path = item
+            async with semaphore:
+                start = time.perf_counter()
+                status = await asgi_request(app, path, cookies[user_id], token)
+                return time.perf_counter() - start, status
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(one(item) for item in paths))
+        return summarize(results, time.perf_counter() - start)
+
+    return asyncio.run(main())
+
+
+def run_throughput(dataset, rng, kinds=("like", "follow"), requests=200, concurrency=8):
+    results = {}
+    for kind in kinds:
+        plan, users = build_plan(kind, dataset, rng, requests)
+        cookies, token = login_cookies(users.values())
+        usernames = dict(
+            User.objects.filter(id__in=dataset.user_ids).values_list("id", "username")
+        )
+        results[kind] = {
+            mode: runner(
+                resolve(kind, mode, plan, usernames), cookies, token, concurrency
+            )
+            for mode, runner in (("wsgi", run_wsgi), ("asgi", run_asgi))
+        }
+    return results
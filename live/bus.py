@@ -0,0 +1,106 @@
+import asyncio
+import functools
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# 画面へ送るイベントの pub/sub
+# - publish はどのスレッドから呼んでもよい (WSGI のスレッド、sync_to_async のスレッド)
+# - subscribe はイベントループの中で呼び、Subscription.get() を await して受け取る
+# InProcessBus は同じプロセスの購読者にしか届かない。プロセスを複数立てるときは
+# settings.LIVE_BUS_BACKEND に共有ブローカー (Redis の pub/sub など) を使う Bus を指定する
+# (ブローカーから受け取ったイベントを、このプロセスの Subscription.deliver に渡せばよい)
+
+CLOSED = object()
+
+
+class Subscription:
+    def __init__(self, bus, channels, maxsize):
+        self.bus = bus
+        self.channels = frozenset(channels)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+        self.closed = False
+        # 受け取り側が遅くてキューがあふれ、捨てたイベントの数
+        self.dropped = 0
+
+    def deliver(self, event):
+        # 別のスレッドから呼ばれるので、キューへの追加はイベントループに頼む
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # ループがもう閉じている (切断済み)
+            pass
+
+    def _put(self, event):
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def get(self, timeout=None):
+        # timeout 秒待っても来なければ None。close() の後は CLOSED
+        if self.closed and self.queue.empty():
+            return CLOSED
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.bus.unsubscribe(self)
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(CLOSED)
+
+
+class Bus:
+    def publish(self, channel, event):
+        raise NotImplementedError
+
+    def subscribe(self, channels):
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription):
+        raise NotImplementedError
+
+
+class InProcessBus(Bus):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.channels = {}  # channel => {Subscription}
+
+    def publish(self, channel, event):
+        with self.lock:
+            subscriptions = list(self.channels.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.deliver(event)
+        return len(subscriptions)
+
+    def subscribe(self, channels):
+        subscription = Subscription(self, channels, settings.LIVE_QUEUE_SIZE)
+        with self.lock:
+            for channel in subscription.channels:
+                self.channels.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            for channel in subscription.channels:
+                subscriptions = self.channels.get(channel)
+                if subscriptions is None:
+                    continue
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self.channels[channel]
+
+
+@functools.lru_cache(maxsize=None)
+def get_bus():
+    return import_string(settings.LIVE_BUS_BACKEND)()
@@ -0,0 +1,31 @@
+from .bus import get_bus
+
+# ツイートやいいねの処理から呼ぶ。どちらもコミットした後に呼ぶこと (まだ読めない状態を知らせない)
+
+
+def author_channel(user_id):
+    return f"author:{user_id}"
+
+
+def tweet_channel(tweet_id):
+    # そのツイートを表示している接続だけが購読する (live.stream)
+    return f"tweet:{tweet_id}"
+
+
+def tweet_created(tweet):
+    # フォロワーの画面に「新しいツイートがあります」を出す (フォローしている人の author チャンネルに届く)
+    get_bus().publish(
+        author_channel(tweet.user_id),
+        {"type": "tweet", "id": tweet.id, "author": tweet.user.username},
+    )
+
+
+def likes_changed(user, deltas):
+    # deltas: {tweet_id: +1 / -1}。押した本人にはビューの返事で反映済みなので、ストリームでは送らない
+    # ツイートごとのチャンネルに送るので、どの接続にも表示していないツイートの分は届かない
+    for tweet_id, delta in deltas.items():
+        if delta:
+            get_bus().publish(
+                tweet_channel(tweet_id),
+                {"type": "likes", "user_id": user.id, "deltas": {tweet_id: delta}},
+            )
@@ -0,0 +1,189 @@
+import asyncio
+import json
+import time
+from importlib import import_module
+from types import SimpleNamespace
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.db import close_old_connections
+from django.http.cookie import parse_cookie
+from django.urls import reverse
+
+from accounts.models import FriendShip
+
+from . import events
+from .bus import CLOSED, get_bus
+
+# Server-Sent Events のエンドポイント。Django のビューを通さない素の ASGI アプリ
+# (Django 4.1 の StreamingHttpResponse は async のイテレータを流せないので、接続ごとにスレッドを塞いでしまう)
+# mysite/asgi.py で with_stream() に包み、live:stream のパスだけをここへ回す
+# - 新しいツイート: フォロー中の人の投稿を1件ずつすぐに送る (event: tweet)
+# - いいね数: ツイートごとの増減を LIVE_LIKE_FLUSH_SECONDS の間まとめて、1つのイベントで送る (event: likes)
+#   届くのは ?tweets=1,2,3 で渡された (画面に出ている) ツイートの分だけ
+# フォローの変更は次の接続 (EventSource の再接続) から反映される
+
+
+class LikeCoalescer:
+    # 連打やバーストで同じツイートへ何度来ても、送るのはツイートごとに増減の合計1つだけ
+    def __init__(self):
+        self.deltas = {}
+        self.since = None
+
+    def add(self, deltas):
+        if self.since is None:
+            self.since = time.monotonic()
+        for tweet_id, delta in deltas.items():
+            self.deltas[tweet_id] = self.deltas.get(tweet_id, 0) + delta
+
+    def due_in(self, interval):
+        # 次に送るまでの秒数。溜まっていなければ None
+        if self.since is None:
+            return None
+        return max(self.since + interval - time.monotonic(), 0)
+
+    def flush(self):
+        # いいねしてすぐ取り消した、のように合計が 0 になったツイートは送らない
+        deltas = {tweet_id: delta for tweet_id, delta in self.deltas.items() if delta}
+        self.deltas = {}
+        self.since = None
+        return deltas
+
+
+def format_event(name, data):
+    return f"event: {name}\ndata: {json.dumps(data)}\n\n".encode()
+
+
+def tweet_ids(query_string):
+    # ?tweets=1,2,3 のツイートの id。数でないものは飛ばし、多すぎるときは新しい LIVE_MAX_TWEETS 件だけ
+    values = parse_qs(query_string).get("tweets", [""])[-1]
+    ids = sorted({int(value) for value in values.split(",") if value.isdigit()})
+    return ids[-settings.LIVE_MAX_TWEETS :]
+
+
+def _load_viewer(cookie_header, tweet_ids):
+    # セッションからログイン中のユーザーと、購読するチャンネルを決める
+    close_old_connections()
+    try:
+        cookies = parse_cookie(cookie_header)
+        session_key = cookies.get(settings.SESSION_COOKIE_NAME)
+        if session_key is None:
+            return None, []
+        engine = import_module(settings.SESSION_ENGINE)
+        user = get_user(SimpleNamespace(session=engine.SessionStore(session_key)))
+        if not user.is_authenticated:
+            return None, []
+        following_ids = FriendShip.objects.filter(follower_id=user.id).values_list(
+            "following_id", flat=True
+        )
+        channels = [events.tweet_channel(tweet_id) for tweet_id in tweet_ids]
+        channels += [events.author_channel(user_id) for user_id in following_ids]
+        return user, channels
+    finally:
+        close_old_connections()
+
+
+async def _watch_disconnect(receive, subscription):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+    subscription.close()
+
+
+async def _respond(send, status, body=b""):
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"text/plain; charset=utf-8")],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+async def stream(scope, receive, send):
+    if scope["method"] != "GET":
+        await _respond(send, 405)
+        return
+    headers = dict(scope["headers"])
+    user, channels = await sync_to_async(_load_viewer)(
+        headers.get(b"cookie", b"").decode("latin-1"),
+        tweet_ids(scope.get("query_string", b"").decode("latin-1")),
+    )
+    if user is None:
+        # EventSource は 200 以外なら再接続しない
+        await _respond(send, 403)
+        return
+
+    subscription = get_bus().subscribe(channels)
+    watcher = asyncio.ensure_future(_watch_disconnect(receive, subscription))
+    likes = LikeCoalescer()
+    try:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/event-stream"),
+                    (b"cache-control", b"no-cache"),
+                    # nginx などのプロキシにバッファさせない
+                    (b"x-accel-buffering", b"no"),
+                ],
+            }
+        )
+        retry = int(settings.LIVE_RETRY_SECONDS * 1000)
+        await send(
+            {
+                "type": "http.response.body",
+                "body": f"retry: {retry}\n\n".encode(),
+                "more_body": True,
+            }
+        )
+        while True:
+            timeout = likes.due_in(settings.LIVE_LIKE_FLUSH_SECONDS)
+            if timeout is None:
+                timeout = settings.LIVE_HEARTBEAT_SECONDS
+            event = await subscription.get(timeout)
+            if event is CLOSED:
+                break
+            body = b""
+            if event is None:
+                if likes.due_in(settings.LIVE_LIKE_FLUSH_SECONDS) is None:
+                    # 何も送るものがないときも、プロキシに切られないようにコメント行を送る
+                    body = b": ping\n\n"
+            elif event["type"] == "tweet":
+                body = format_event("tweet", event)
+            elif event["type"] == "likes" and event["user_id"] != user.id:
+                likes.add(event["deltas"])
+            if likes.due_in(settings.LIVE_LIKE_FLUSH_SECONDS) == 0:
+                deltas = likes.flush()
+                if deltas:
+                    body += format_event("likes", {"deltas": deltas})
+            if body:
+                await send(
+                    {"type": "http.response.body", "body": body, "more_body": True}
+                )
+    except OSError:
+        # 送信中に切断された
+        pass
+    finally:
+        subscription.close()
+        watcher.cancel()
+    try:
+        await send({"type": "http.response.body", "body": b""})
+    except OSError:
+        pass
+
+
+def with_stream(application):
+    # live:stream のパスへの HTTP だけを stream へ回し、残りはそのまま Django へ
+    path = reverse("live:stream")
+
+    async def app(scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == path:
+            await stream(scope, receive, send)
+        else:
+            await application(scope, receive, send)
+
+    return app
@@ -0,0 +1,264 @@
+import asyncio
+import json
+import threading
+from unittest import mock
+
+from django.conf import settings
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from accounts import follows
+from accounts.models import User
+from mysite.testcases import TestCase
+from tweets.models import Tweet
+
+from . import events
+from .bus import CLOSED, InProcessBus, get_bus
+from .stream import LikeCoalescer, stream, tweet_ids, with_stream
+
+
+def parse_events(body):
+    # "event: ...\ndata: ...\n\n" を (event, data) の並びにする (コメント行は飛ばす)
+    result = []
+    for block in body.decode().split("\n\n"):
+        fields = dict(
+            line.split(": ", 1) for line in block.splitlines() if ": " in line
+        )
+        if "event" in fields:
+            result.append((fields["event"], json.loads(fields["data"])))
+    return result
+
+
+class StreamClient:
+    # live.stream を ASGI のサーバーの代わりに呼ぶ
+    def __init__(self, app, cookie="", method="GET", query_string=""):
+        self.app = app
+        self.scope = {
+            "type": "http",
+            "method": method,
+            "path": reverse("live:stream"),
+            "query_string": query_string.encode(),
+            "headers": [(b"cookie", cookie.encode())],
+        }
+        self.incoming = asyncio.Queue()
+        self.messages = []
+        self.received = asyncio.Event()
+
+    async def receive(self):
+        return await self.incoming.get()
+
+    async def send(self, message):
+        self.messages.append(message)
+        self.received.set()
+
+    def start(self):
+        self.task = asyncio.ensure_future(self.app(self.scope, self.receive, self.send))
+
+    async def wait_for(self, event_name):
+        while True:
+            if any(name == event_name for name, _ in self.events()):
+                return
+            self.received.clear()
+            await asyncio.wait_for(self.received.wait(), 5)
+
+    async def disconnect(self):
+        await self.incoming.put({"type": "http.disconnect"})
+        await asyncio.wait_for(self.task, 5)
+
+    def status(self):
+        return self.messages[0]["status"]
+
+    def events(self):
+        return parse_events(b"".join(m.get("body", b"") for m in self.messages[1:]))
+
+
+class TestLikeCoalescer(TestCase):
+    def test_sum_per_tweet(self):
+        likes = LikeCoalescer()
+        self.assertIsNone(likes.due_in(1))
+        likes.add({1: 1, 2: 1})
+        likes.add({1: 1, 2: -1})
+        likes.add({1: 1, 3: -1})
+        self.assertEqual(likes.flush(), {1: 3, 3: -1})
+        self.assertIsNone(likes.due_in(1))
+
+    def test_due(self):
+        with mock.patch("time.monotonic", return_value=100.0):
+            likes = LikeCoalescer()
+            likes.add({1: 1})
+        with mock.patch("time.monotonic", return_value=100.25):
+            self.assertEqual(likes.due_in(1), 0.75)
+        with mock.patch("time.monotonic", return_value=102.0):
+            self.assertEqual(likes.due_in(1), 0)
+
+
+class TestInProcessBus(TestCase):
+    async def test_publish_from_thread(self):
+        bus = InProcessBus()
+        subscription = bus.subscribe(["a", "b"])
+        thread = threading.Thread(target=bus.publish, args=("a", {"n": 1}))
+        thread.start()
+        thread.join()
+        self.assertEqual(bus.publish("c", {"n": 2}), 0)
+        self.assertEqual(await subscription.get(1), {"n": 1})
+        self.assertIsNone(await subscription.get(0.01))
+
+        subscription.close()
+        self.assertEqual(bus.channels, {})
+        self.assertIs(await subscription.get(1), CLOSED)
+        self.assertEqual(bus.publish("a", {"n": 3}), 0)
+
+    @override_settings(LIVE_QUEUE_SIZE=2)
+    async def test_full_queue(self):
+        bus = InProcessBus()
+        subscription = bus.subscribe(["a"])
+        for i in range(3):
+            bus.publish("a", {"n": i})
+        await asyncio.sleep(0)
+        self.assertEqual(subscription.dropped, 1)
+        subscription.close()
+        self.assertEqual(await subscription.get(1), {"n": 1})
+        self.assertIs(await subscription.get(1), CLOSED)
+
+
+class TestPublish(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(
+            username="testuser1", password="testpassword"
+        )
+        self.user2 = User.objects.create_user(
+            username="testuser2", password="testpassword"
+        )
+        self.client.login(username="testuser1", password="testpassword")
+        self.tweet = Tweet.objects.create(user=self.user2, content="testpost")
+        self.publish = mock.patch.object(InProcessBus, "publish").start()
+        self.addCleanup(mock.patch.stopall)
+
+    def test_tweet_created(self):
+        self.client.post(reverse("tweets:create"), {"content": "新しいツイート"})
+        tweet = Tweet.objects.get(content="新しいツイート")
+        self.publish.assert_called_once_with(
+            f"author:{self.user1.id}",
+            {"type": "tweet", "id": tweet.id, "author": "testuser1"},
+        )
+
+    def test_like(self):
+        self.client.post(reverse("tweets:like", kwargs={"pk": self.tweet.pk}))
+        # 2回目は何も変わらないので送らない
+        self.client.post(reverse("tweets:like", kwargs={"pk": self.tweet.pk}))
+        self.publish.assert_called_once_with(
+            f"tweet:{self.tweet.id}",
+            {"type": "likes", "user_id": self.user1.id, "deltas": {self.tweet.id: 1}},
+        )
+
+    def test_like_batch(self):
+        other = Tweet.objects.create(user=self.user2, content="other")
+        self.client.post(
+            reverse("tweets:like_batch"),
+            {
+                "operations": [
+                    {"tweet_id": self.tweet.id, "action": "like"},
+                    {"tweet_id": other.id, "action": "unlike"},
+                ]
+            },
+            content_type="application/json",
+        )
+        self.publish.assert_called_once_with(
+            f"tweet:{self.tweet.id}",
+            {"type": "likes", "user_id": self.user1.id, "deltas": {self.tweet.id: 1}},
+        )
+
+
+@override_settings(LIVE_LIKE_FLUSH_SECONDS=0.05)
+class TestStream(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(
+            username="testuser1", password="testpassword"
+        )
+        self.user2 = User.objects.create_user(
+            username="testuser2", password="testpassword"
+        )
+        self.user3 = User.objects.create_user(
+            username="testuser3", password="testpassword"
+        )
+        follows.follow(self.user1, self.user2)
+        client = Client()
+        client.force_login(self.user1)
+        session = client.cookies[settings.SESSION_COOKIE_NAME].value
+        self.cookie = f"{settings.SESSION_COOKIE_NAME}={session}"
+        get_bus.cache_clear()
+        self.addCleanup(get_bus.cache_clear)
+
+    @override_settings(LIVE_MAX_TWEETS=2)
+    def test_tweet_ids(self):
+        self.assertEqual(tweet_ids("tweets=3,1,x,,3"), [1, 3])
+        self.assertEqual(tweet_ids("tweets=1,2,3"), [2, 3])
+        self.assertEqual(tweet_ids(""), [])
+
+    async def test_events(self):
+        client = StreamClient(stream, self.cookie, query_string="tweets=10,11")
+        client.start()
+        await client.received.wait()
+        self.assertEqual(client.status(), 200)
+        headers = dict(client.messages[0]["headers"])
+        self.assertEqual(headers[b"content-type"], b"text/event-stream")
+
+        # フォローしていない人のツイートと、自分のいいね、画面に出ていないツイートのいいねは届かない
+        tweet = Tweet(id=10, user=self.user2)
+        events.tweet_created(Tweet(id=11, user=self.user3))
+        events.tweet_created(tweet)
+        events.likes_changed(self.user1, {10: 1})
+        for _ in range(3):
+            events.likes_changed(self.user2, {10: 1, 11: 1})
+        events.likes_changed(self.user3, {11: -3, 12: 1})
+        await client.wait_for("likes")
+        await client.disconnect()
+
+        self.assertEqual(
+            client.events(),
+            [
+                ("tweet", {"type": "tweet", "id": 10, "author": "testuser2"}),
+                # 3回分が1つにまとまり、合計 0 になったツイートは送らない
+                ("likes", {"deltas": {"10": 3}}),
+            ],
+        )
+        self.assertEqual(
+            client.messages[-1], {"type": "http.response.body", "body": b""}
+        )
+        self.assertEqual(get_bus().channels, {})
+
+    @override_settings(LIVE_HEARTBEAT_SECONDS=0.01)
+    async def test_heartbeat(self):
+        client = StreamClient(stream, self.cookie)
+        client.start()
+        while b": ping" not in b"".join(m.get("body", b"") for m in client.messages):
+            client.received.clear()
+            await asyncio.wait_for(client.received.wait(), 5)
+        await client.disconnect()
+
+    async def test_anonymous(self):
+        client = StreamClient(stream)
+        client.start()
+        await asyncio.wait_for(client.task, 5)
+        self.assertEqual(client.status(), 403)
+
+    async def test_with_stream(self):
+        django_app = mock.AsyncMock()
+        app = with_stream(django_app)
+        client = StreamClient(app, method="POST")
+        client.start()
+        await asyncio.wait_for(client.task, 5)
+        self.assertEqual(client.status(), 405)
+        django_app.assert_not_called()
+
+        scope = {"type": "http", "path": "/tweets/home/"}
+        await app(scope, None, None)
+        django_app.assert_awaited_once_with(scope, None, None)
+
+    def test_wsgi(self):
+        # WSGI では常時接続を受けないので、EventSource に再接続をやめさせる
+        self.client.force_login(self.user1)
+        response = self.client.get(reverse("live:stream"))
+        self.assertEqual(response.status_code, 204)
+        response = self.client.get(reverse("tweets:home"))
+        self.assertContains(response, reverse("live:stream"))
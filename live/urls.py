@@ -0,0 +1,8 @@
+from django.urls import path
+
+from . import views
+
+app_name = "live"
+urlpatterns = [
+    path("stream/", views.StreamView.as_view(), name="stream"),
+]
@@ -0,0 +1,9 @@
+from django.http import HttpResponse
+from django.views import View
+
+
+class StreamView(View):
+    # ASGI で動かしていれば live.stream.with_stream が先に受け取るので、ここへは来ない
+    # WSGI (スレッドごとに1接続) では常時接続を受けられないので、204 で再接続をやめさせる
+    def get(self, request, **kwargs):
+        return HttpResponse(status=204)
@@ -13,4 +13,10 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mysite.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Server-Sent Events のパスだけは Django のビューを通さずに受ける (live.stream)
+# (Django の設定を読み込んでから import する)
+from live.stream import with_stream  # noqa: E402
+
+application = with_stream(django_application)
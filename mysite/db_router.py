@@ -0,0 +1,120 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+
+# 読み取り専用のビューの SQL をレプリカ (settings.DATABASE_REPLICAS) へ、それ以外はすべてプライマリ (default) へ送る
+# - レプリカを使うのは、ReplicaReadMixin を付けたビューへの GET / HEAD のときだけ (ReplicaRoutingMiddleware が決める)
+# - 書き込んだユーザーは DATABASE_REPLICA_STICKY_SECONDS の間プライマリから読む (署名付きクッキーで覚える)
+#   レプリカの遅れで、自分のいいねやフォローが消えたように見えないようにするため
+#   クッキーなのでセッションを保存し直す SQL は増えない
+
+PINNED_COOKIE = "db_pinned"
+# 書き込みとみなす SQL (SELECT・SAVEPOINT などでは固定しない)
+WRITE_STATEMENTS = ("INSERT", "UPDATE", "DELETE", "REPLACE")
+
+# 処理中のリクエストの RoutingState。sync_to_async で別スレッドに渡ったクエリにも引き継がれる
+_current_state = ContextVar("db_routing_state", default=None)
+
+
+class RoutingState:
+    def __init__(self):
+        self.replica = None
+        self.wrote = False
+
+
+class ReplicaReadMixin:
+    # このビューへの GET はレプリカから読んでよい (書き込みをしないビューにだけ付ける)
+    read_from_replica = True
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _current_state.get()
+        # セッションは書き込んだプライマリから読む (レプリカの遅れでログアウトしたように見えないように)
+        if state is not None and state.replica and model._meta.app_label != "sessions":
+            return state.replica
+        return None
+
+    def db_for_write(self, model, **hints):
+        # レプリカから読んだオブジェクトを保存するときも、プライマリへ書く
+        # (get_or_create で見つかったときや select_for_update もここを通るので、書いたかどうかは record_writes で見る)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # DATABASES はプライマリとその複製だけなので、どこから読んだオブジェクト同士でも関連付けてよい
+        return True
+
+
+def record_writes(execute, sql, params, many, context):
+    # connection.execute_wrapper から呼ばれる。実際に書き込む SQL を実行したリクエストだけを固定する
+    state = _current_state.get()
+    if state is not None and not state.wrote:
+        state.wrote = sql.lstrip()[:7].upper().startswith(WRITE_STATEMENTS)
+    return execute(sql, params, many, context)
+
+
+def install(connection, **kwargs):
+    if record_writes not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_writes)
+
+
+connection_created.connect(install)
+
+
+def install_all():
+    # すでに開かれている (このスレッドの) 接続にも付ける
+    for connection in connections.all():
+        install(connection)
+
+
+def is_pinned(request):
+    # 期限は署名の時刻で確かめる (クッキーの期限はブラウザ任せなので当てにしない)
+    return (
+        request.get_signed_cookie(
+            PINNED_COOKIE,
+            default=None,
+            salt=PINNED_COOKIE,
+            max_age=settings.DATABASE_REPLICA_STICKY_SECONDS,
+        )
+        is not None
+    )
+
+
+class ReplicaRoutingMiddleware:
+    # SessionMiddleware / AuthenticationMiddleware より後に置く
+    def __init__(self, get_response):
+        self.get_response = get_response
+        install_all()
+
+    def __call__(self, request):
+        state = RoutingState()
+        token = _current_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_state.reset(token)
+        if state.wrote and settings.DATABASE_REPLICAS:
+            response.set_signed_cookie(
+                PINNED_COOKIE,
+                "1",
+                salt=PINNED_COOKIE,
+                max_age=settings.DATABASE_REPLICA_STICKY_SECONDS,
+                secure=settings.SESSION_COOKIE_SECURE,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, "view_class", None)
+        if (
+            settings.DATABASE_REPLICAS
+            and request.method in ("GET", "HEAD")
+            and getattr(view_class, "read_from_replica", False)
+            and not is_pinned(request)
+        ):
+            _current_state.get().replica = random.choice(settings.DATABASE_REPLICAS)
+        return None
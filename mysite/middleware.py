@@ -0,0 +1,144 @@
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger("mysite.query_budget")
+
+# 処理中のリクエストの QueryStats。ContextVar なので、async ビューから sync_to_async で
+# 別スレッドに渡った ORM のクエリも同じリクエストに数えられる
+_current_stats = ContextVar("query_stats", default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.slowest_sql = None
+        self.slowest_duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper から呼ばれる。DEBUG でなくても数えられる
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.count += 1
+            self.duration += duration
+            if duration >= self.slowest_duration:
+                self.slowest_sql = sql
+                self.slowest_duration = duration
+
+
+def record_queries(execute, sql, params, many, context):
+    stats = _current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats(execute, sql, params, many, context)
+
+
+@contextmanager
+def unbudgeted():
+    # この中の SQL はリクエストの件数に数えない (テストでバックグラウンドタスクをその場で実行するとき用)
+    token = _current_stats.set(None)
+    try:
+        yield
+    finally:
+        _current_stats.reset(token)
+
+
+def install(connection, **kwargs):
+    # 接続はスレッドごとに作られるので、作られたときに1度だけ record_queries を付ける
+    if record_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_queries)
+
+
+connection_created.connect(install)
+
+
+def install_all():
+    # すでに開かれている (このスレッドの) 接続にも付ける
+    for connection in connections.all():
+        install(connection)
+
+
+def get_budget(view_name):
+    return settings.QUERY_BUDGETS.get(view_name, settings.QUERY_BUDGET_DEFAULT)
+
+
+class QueryBudgetMiddleware:
+    # ビュー(URL名)ごとに SQL の件数・合計時間・一番遅い SQL を記録する
+    # - Server-Timing ヘッダーで返すので、ブラウザの開発者ツールでそのまま見られる
+    # - settings.QUERY_BUDGETS の件数を超えたら、QUERY_BUDGET_STRICT なら例外、そうでなければ警告ログ
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        install_all()
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats = QueryStats()
+        token = _current_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_stats.reset(token)
+        return self.process(request, response, stats, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        stats = QueryStats()
+        token = _current_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_stats.reset(token)
+        return self.process(request, response, stats, time.perf_counter() - start)
+
+    def process(self, request, response, stats, total):
+        match = request.resolver_match
+        if match is None:
+            return response
+        view_name = match.view_name
+        response["Server-Timing"] = ", ".join(
+            [
+                f'db;dur={stats.duration * 1000:.1f};desc="{stats.count} queries"',
+                f"total;dur={total * 1000:.1f}",
+            ]
+        )
+        record = {
+            "view": view_name,
+            "method": request.method,
+            "status": response.status_code,
+            "queries": stats.count,
+            "db_ms": round(stats.duration * 1000, 1),
+            "total_ms": round(total * 1000, 1),
+            "slowest_ms": round(stats.slowest_duration * 1000, 1),
+            "slowest_sql": stats.slowest_sql,
+        }
+        logger.info("%(view)s %(queries)d queries", record, extra=record)
+
+        budget = get_budget(view_name)
+        if budget is not None and stats.count > budget:
+            message = f"{view_name}: {stats.count} queries (budget {budget})"
+            if settings.QUERY_BUDGET_STRICT:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message, extra=record)
+        return response
@@ -40,14 +40,23 @@ INSTALLED_APPS = [
     "accounts.apps.AccountsConfig",
     "tweets.apps.TweetsConfig",
     "welcome.apps.WelcomeConfig",
+    "search.apps.SearchConfig",
+    "trends.apps.TrendsConfig",
+    "live.apps.LiveConfig",
+    "tasks.apps.TasksConfig",
+    "notifications.apps.NotificationsConfig",
+    "analytics.apps.AnalyticsConfig",
+    "suggestions.apps.SuggestionsConfig",
 ]
 
 MIDDLEWARE = [
+    "mysite.middleware.QueryBudgetMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "mysite.db_router.ReplicaRoutingMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -77,11 +86,66 @@ WSGI_APPLICATION = "mysite.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/4.0/ref/settings/#databases
 
+# 本番用の SQLite のプロファイル (PRAGMA は mysite/sqlite_backend/base.py が接続のたびに実行する)
+# 本番の設定 (mysite.settings_production) でだけ DATABASES に足す。開発・テストは Django の既定のまま
+# - WAL: 書き込み中も読み込みを止めない。synchronous=NORMAL は WAL なら電源断でも壊れない (直近のコミットは失われうる)
+# - busy_timeout: ロック待ちでいきなり database is locked にせず待つ (ミリ秒)
+# - IMMEDIATE: トランザクションの最初に書き込みのロックを取る (途中で取れずに失敗するのを防ぐ)
+# - CONN_MAX_AGE: リクエストごとに接続を開き直さない。CONN_HEALTH_CHECKS で切れた接続は使い回さない
+SQLITE_PRODUCTION_PROFILE = {
+    "ENGINE": "mysite.sqlite_backend",
+    "CONN_MAX_AGE": 600,
+    "CONN_HEALTH_CHECKS": True,
+    "OPTIONS": {
+        "transaction_mode": "IMMEDIATE",
+        "pragmas": {
+            "journal_mode": "WAL",
+            "synchronous": "NORMAL",
+            "busy_timeout": 5000,
+            "mmap_size": 128 * 1024 * 1024,
+            "cache_size": -32000,
+            # 負の値は KiB 単位 (約 32MB)
+        },
+    },
+}
+
+# ENGINE の mysite.sqlite_backend は、OPTIONS を渡さなければ Django の sqlite3 と同じ
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
+        "ENGINE": "mysite.sqlite_backend",
         "NAME": BASE_DIR / "db.sqlite3",
-    }
+    },
+    # 読み取り用のレプリカ。手元では同じファイルを別の接続で開くだけ (DATABASE_REPLICAS に入れると使われる)
+    # テストではそれぞれ別のメモリ上の DB になるので、プライマリに書いた行はレプリカから見えない (振り分けの確認に使う)
+    "replica": {
+        "ENGINE": "mysite.sqlite_backend",
+        "NAME": BASE_DIR / "db.sqlite3",
+    },
+}
+
+# 読み取り専用のビュー (ReplicaReadMixin) の SQL を送るレプリカの alias。空ならすべて default
+DATABASE_ROUTERS = ["mysite.db_router.ReplicaRouter"]
+DATABASE_REPLICAS = []
+# 書き込んだユーザーは、この秒数の間レプリカを使わずプライマリから読む (レプリカの遅れを隠す)
+# 期限は署名付きクッキーに持つので、書き込みのリクエストの SQL は増えない
+DATABASE_REPLICA_STICKY_SECONDS = 5
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+# timeline には条件付き GET の stamp とページのバージョンを置く。本番ではワーカー (tasks) も更新するので、
+# すべてのプロセスから見える Redis にする (mysite.settings_production)。開発・テストは 1 プロセスなので LocMemCache
+# (DEBUG=False のまま LocMemCache だと check --deploy で警告する: tweets.checks)
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "timeline": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "timeline",
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
 }
 
 
@@ -134,6 +198,123 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 AUTH_USER_MODEL = "accounts.User"
 
 
+# タイムライン
+# フォロワーがこの人数以上のユーザーのツイートは配信(fan-out)せず、読み込み時にまとめて取得する
+TIMELINE_FANOUT_THRESHOLD = 1000
+# フォロー時の遡り配信・再構築時に、1人のタイムラインへ入れる最大件数
+TIMELINE_INBOX_SIZE = 800
+# タイムラインのページ・ツイート・いいね状態のキャッシュ
+TIMELINE_CACHE_ENABLED = True
+TIMELINE_CACHE_ALIAS = "timeline"
+TIMELINE_CACHE_TIMEOUT = 300
+# ツイートのカードの HTML (見ている人によらない部分) のキャッシュ。キーに updated_at を含むので長めでよい
+TWEET_CARD_CACHE_ENABLED = True
+TWEET_CARD_CACHE_TIMEOUT = 60 * 60
+
+# トレンド (trends.counters)。TRENDS_BUCKET_SECONDS ごとの区間で数え、直近 TRENDS_WINDOW_SECONDS を合計する
+TRENDS_BUCKET_SECONDS = 300
+TRENDS_WINDOW_SECONDS = 24 * 60 * 60
+TRENDS_TOP_K = 10
+TRENDS_CACHE_TIMEOUT = 60
+
+# Server-Sent Events (live.stream)。ASGI で動かしたときだけ有効 (mysite/asgi.py)
+# プロセスを複数立てるなら、LIVE_BUS_BACKEND を共有ブローカーを使う live.bus.Bus に替える
+LIVE_BUS_BACKEND = "live.bus.InProcessBus"
+LIVE_LIKE_FLUSH_SECONDS = 1.0
+LIVE_HEARTBEAT_SECONDS = 15
+LIVE_RETRY_SECONDS = 5
+LIVE_QUEUE_SIZE = 1000
+# 1つの接続でいいね数を受け取るツイートの数の上限 (画面に出ている分を ?tweets= で渡す)
+LIVE_MAX_TWEETS = 200
+
+# バックグラウンドタスク (tasks.queue)。python manage.py run_tasks で実行する
+TASKS_EAGER = False
+TASKS_MAX_ATTEMPTS = 5
+TASKS_BACKOFF_SECONDS = 10
+TASKS_BACKOFF_MAX_SECONDS = 60 * 60
+TASKS_LEASE_SECONDS = 5 * 60
+TASKS_BATCH_SIZE = 20
+TASKS_POLL_SECONDS = 1.0
+TASKS_RETENTION_SECONDS = 7 * 24 * 60 * 60
+
+# 通知 (notifications.inbox)。同じツイートへのいいね・フォローは NOTIFICATIONS_WINDOW_SECONDS ごとに1行へまとめる
+NOTIFICATIONS_WINDOW_SECONDS = 60 * 60
+NOTIFICATIONS_RECENT_ACTORS = 20
+
+# アクセス解析 (analytics.rollups)。python manage.py rollup_analytics を定期的に実行して集計表へ足し込む
+ANALYTICS_ROLLUP_BATCH_SIZE = 5000
+ANALYTICS_ROLLUP_LAG_SECONDS = 60
+ANALYTICS_HOURLY_RETENTION_SECONDS = 14 * 24 * 60 * 60
+# ダッシュボードのグラフの長さと移動平均の区間数
+ANALYTICS_HOURS = 48
+ANALYTICS_DAYS = 30
+ANALYTICS_MOVING_AVERAGE_HOURS = 6
+ANALYTICS_MOVING_AVERAGE_DAYS = 7
+
+# おすすめユーザー (suggestions.index)。python manage.py compute_suggestions を定期的に実行して作り直す
+SUGGESTIONS_TOP_K = 20
+SUGGESTIONS_DISPLAY = 3
+SUGGESTIONS_BATCH_SIZE = 1000
+
+TEST_RUNNER = "mysite.test_runner.TestRunner"
+
+
+# SQL の件数の上限 (ビューの URL 名ごと)。mysite.middleware.QueryBudgetMiddleware が見る
+# 超えたら警告ログ。QUERY_BUDGET_STRICT (テストでは True) なら例外にする
+QUERY_BUDGETS = {
+    "welcome:index": 0,
+    "accounts:signup": 11,
+    "accounts:login": 9,
+    "accounts:logout": 4,
+    "accounts:user_profile": 7,
+    "accounts:follow": 13,
+    "accounts:unfollow": 9,
+    "accounts:following_list": 4,
+    "accounts:follower_list": 4,
+    "tweets:home": 6,
+    "tweets:home_feed": 5,
+    "tweets:create": 13,
+    "tweets:detail": 4,
+    "tweets:delete": 14,
+    "tweets:like": 9,
+    "tweets:unlike": 8,
+    "tweets:like_batch": 10,
+    "tweets:hashtag": 4,
+    "tweets:mentions": 5,
+    "search:index": 5,
+    "trends:index": 5,
+    "trends:json": 5,
+    "live:stream": 0,
+    "notifications:index": 4,
+    "notifications:read": 6,
+    "analytics:account": 4,
+    "analytics:tweet": 5,
+    "tweets:like_async": 9,
+    "tweets:unlike_async": 8,
+    "accounts:follow_async": 14,
+    "accounts:unfollow_async": 14,
+}
+QUERY_BUDGET_DEFAULT = None
+QUERY_BUDGET_STRICT = False
+# リクエストごとの記録 (件数・時間・一番遅い SQL) も INFO で出すか。量が多いので、調べるときだけ True にする
+QUERY_BUDGET_LOG_REQUESTS = False
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        # リクエストごとの記録は INFO、上限超えは WARNING
+        "mysite.query_budget": {
+            "handlers": ["console"],
+            "level": "INFO" if QUERY_BUDGET_LOG_REQUESTS else "WARNING",
+        },
+    },
+}
+
+
 # debug_toolbar
 SQL_DEBUG = False  # testの時はここFalseを変える
 
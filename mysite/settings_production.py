@@ -0,0 +1,29 @@
+import os
+
+from .settings import *  # noqa: F401, F403
+from .settings import (
+    CACHES,
+    DATABASES,
+    SQLITE_PRODUCTION_PROFILE,
+    TIMELINE_CACHE_ALIAS,
+)
+
+# 本番用の設定。DJANGO_SETTINGS_MODULE=mysite.settings_production で使う
+# 開発用の mysite.settings との違いだけを書く
+
+DEBUG = False
+
+# SQLite の本番用プロファイル (WAL・PRAGMA・BEGIN IMMEDIATE・接続の使い回し)
+DATABASES = {
+    alias: {**config, **SQLITE_PRODUCTION_PROFILE}
+    for alias, config in DATABASES.items()
+}
+
+# stamp とバージョンは Web のプロセスとワーカー (tasks) の間で共有する (Redis の INCR で数え上げる)
+CACHES = {
+    **CACHES,
+    TIMELINE_CACHE_ALIAS: {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ.get("REDIS_URL", "redis://127.0.0.1:6379/1"),
+    },
+}
@@ -0,0 +1,33 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+# django.db.backends.sqlite3 に、接続のたびに実行する PRAGMA とトランザクションの始め方の設定を足したもの
+# settings.DATABASES の OPTIONS に次を書ける (Django 5.1 の init_command / transaction_mode と同じ考え方)
+#   "pragmas": {"journal_mode": "WAL", ...}  接続を開くたびに PRAGMA name = value を実行する
+#   "transaction_mode": "IMMEDIATE"  atomic() を BEGIN IMMEDIATE で始める
+#     (読んでから書くトランザクションが、途中で書き込みのロックを取れずに database is locked になるのを防ぐ)
+
+TRANSACTION_MODES = ("DEFERRED", "IMMEDIATE", "EXCLUSIVE")
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.pragmas = params.pop("pragmas", {})
+        self.transaction_mode = params.pop("transaction_mode", None)
+        if self.transaction_mode not in (None, *TRANSACTION_MODES):
+            raise ImproperlyConfigured(
+                f"transaction_mode は {', '.join(TRANSACTION_MODES)} のどれかにしてください。"
+            )
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        if self.transaction_mode is None:
+            return super()._start_transaction_under_autocommit()
+        self.cursor().execute(f"BEGIN {self.transaction_mode}")
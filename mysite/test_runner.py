@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+from . import db_router, middleware
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        # キャッシュは本番と同じく有効のまま。テストごとに空にする (mysite.testcases)
+        # バックグラウンドタスクは defer の場で実行する (ワーカーを待たずに結果を確かめられるように)
+        # キューそのものを確かめるテストだけ TASKS_EAGER=False にする
+        settings.TASKS_EAGER = True
+        # テストでは SQL の件数が QUERY_BUDGETS を超えたら例外にして落とす
+        settings.QUERY_BUDGET_STRICT = True
+
+    def setup_databases(self, **kwargs):
+        old_config = super().setup_databases(**kwargs)
+        # テスト用 DB の接続はミドルウェアより先に作られるので、ここで SQL の記録を付けておく
+        # (AsyncClient のテストでは、ORM のクエリがこのスレッドの接続で実行される)
+        middleware.install_all()
+        db_router.install_all()
+        return old_config
@@ -0,0 +1,23 @@
+from django.core.cache import caches
+from django.test import TestCase as DjangoTestCase
+from django.test import TransactionTestCase as DjangoTransactionTestCase
+
+# テストの基底クラス。DB を使うテストはここから TestCase / TransactionTestCase を import する
+# テストごとに DB はロールバックされるが、キャッシュは残ったままになる
+# (SQLite はロールバック後に同じ id を使い回すので、前のテストのページやツイートが返ってきてしまう)
+# そこでキャッシュは本番と同じく有効のまま、テストの前 (setUp より前) にすべて空にする
+
+
+class CacheClearMixin:
+    def _pre_setup(self):
+        super()._pre_setup()
+        for cache in caches.all():
+            cache.clear()
+
+
+class TestCase(CacheClearMixin, DjangoTestCase):
+    pass
+
+
+class TransactionTestCase(CacheClearMixin, DjangoTransactionTestCase):
+    pass
@@ -0,0 +1,216 @@
+import os
+import tempfile
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+
+from accounts.models import User
+from mysite.testcases import TestCase
+from tweets.models import Tweet
+
+from . import settings_production
+from .db_router import PINNED_COOKIE, ReplicaRouter, RoutingState, _current_state
+from .middleware import QueryBudgetExceeded
+from .sqlite_backend.base import DatabaseWrapper
+
+
+class TestQueryBudgetMiddleware(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="tester",
+            email="tester@example.com",
+            password="testpassword",
+        )
+        self.client.login(username="tester", password="testpassword")
+        self.async_client.force_login(self.user)
+        self.url = reverse("tweets:home")
+
+    def test_server_timing_header(self):
+        response = self.client.get(self.url)
+        server_timing = response["Server-Timing"]
+        self.assertIn('desc="5 queries"', server_timing)
+        self.assertIn("db;dur=", server_timing)
+        self.assertIn("total;dur=", server_timing)
+
+    def test_structured_log(self):
+        with self.assertLogs("mysite.query_budget", "INFO") as logs:
+            self.client.get(self.url)
+        record = logs.records[0]
+        self.assertEqual(record.view, "tweets:home")
+        self.assertEqual(record.queries, 5)
+        self.assertEqual(record.status, 200)
+        self.assertIsNotNone(record.slowest_sql)
+
+    async def test_async_view(self):
+        # async ビューから sync_to_async で実行されたクエリも数える
+        tweet = await Tweet.objects.acreate(user=self.user, content="test")
+        url = reverse("tweets:like_async", kwargs={"pk": tweet.id})
+        response = await self.async_client.post(url)
+        self.assertIn('desc="9 queries"', response["Server-Timing"])
+
+    @override_settings(QUERY_BUDGETS={"tweets:home": 2})
+    def test_strict_budget_raises(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get(self.url)
+
+    @override_settings(QUERY_BUDGETS={"tweets:home": 2}, QUERY_BUDGET_STRICT=False)
+    def test_budget_warning(self):
+        with self.assertLogs("mysite.query_budget", "WARNING") as logs:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("5 queries (budget 2)", logs.output[0])
+
+    def test_unresolved_request(self):
+        response = self.client.get("/no-such-page/")
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn("Server-Timing", response)
+
+
+@override_settings(DATABASE_REPLICAS=["replica"])
+class TestReplicaRouting(TestCase):
+    # プライマリ (default) とレプリカ (replica) は別のメモリ上の SQLite。複製はしないので、
+    # どちらから読んだかは見えるツイートで分かる
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="tester", password="testpassword")
+        User.objects.using("replica").bulk_create([self.user])
+        self.tweet = Tweet.objects.create(user=self.user, content="primary")
+        # bulk_create なら検索の索引 (default の接続) に入らない
+        Tweet.objects.using("replica").bulk_create(
+            [Tweet(user_id=self.user.id, content="replica")]
+        )
+        self.client.login(username="tester", password="testpassword")
+        self.profile_url = reverse(
+            "accounts:user_profile", kwargs={"username": "tester"}
+        )
+
+    def get_profile(self):
+        response = self.client.get(self.profile_url)
+        return [tweet.content for tweet in response.context["tweet_list"]]
+
+    def test_read_view_uses_replica(self):
+        self.assertEqual(self.get_profile(), ["replica"])
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas(self):
+        self.assertEqual(self.get_profile(), ["primary"])
+
+    def test_write_view_uses_primary(self):
+        response = self.client.post(
+            reverse("tweets:like", kwargs={"pk": self.tweet.pk})
+        )
+        self.assertEqual(response.json()["like_count"], 1)
+        self.assertFalse(Tweet.objects.using("replica").get().likes.exists())
+
+    def test_sticky_after_write(self):
+        self.client.post(reverse("tweets:like", kwargs={"pk": self.tweet.pk}))
+        self.assertIn(PINNED_COOKIE, self.client.cookies)
+        # 書き込んだ直後は、自分の書き込みが見えるようにプライマリから読む
+        self.assertEqual(self.get_profile(), ["primary"])
+
+    def test_sticky_expires(self):
+        self.client.post(reverse("tweets:like", kwargs={"pk": self.tweet.pk}))
+        later = time.time() + settings.DATABASE_REPLICA_STICKY_SECONDS + 1
+        with mock.patch("time.time", return_value=later):
+            self.assertEqual(self.get_profile(), ["replica"])
+
+    def test_forged_pin_is_ignored(self):
+        self.client.cookies[PINNED_COOKIE] = "1"
+        self.assertEqual(self.get_profile(), ["replica"])
+
+    def test_read_does_not_pin(self):
+        self.get_profile()
+        self.assertNotIn(PINNED_COOKIE, self.client.cookies)
+
+    def test_pin_only_on_actual_write(self):
+        state = RoutingState()
+        token = _current_state.set(state)
+        try:
+            # プライマリを使うだけで何も書かないクエリでは固定しない
+            with transaction.atomic():
+                User.objects.get_or_create(username="tester")
+                list(User.objects.select_for_update())
+            self.assertFalse(state.wrote)
+            Tweet.objects.filter(id=self.tweet.id).update(content="updated")
+            self.assertTrue(state.wrote)
+        finally:
+            _current_state.reset(token)
+
+    def test_router(self):
+        router = ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Tweet))
+        state = RoutingState()
+        state.replica = "replica"
+        token = _current_state.set(state)
+        try:
+            self.assertEqual(router.db_for_read(Tweet), "replica")
+            self.assertIsNone(router.db_for_read(Session))
+            self.assertEqual(router.db_for_write(Tweet), "default")
+            self.assertFalse(state.wrote)
+        finally:
+            _current_state.reset(token)
+        replica_user = User.objects.using("replica").get()
+        self.assertTrue(router.allow_relation(self.tweet, replica_user))
+
+
+class TestSQLiteBackend(SimpleTestCase):
+    # テスト用 DB はメモリ上 (WAL にならない) なので、一時ファイルの DB に別の接続を開いて確かめる
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.settings_dict = {
+            **settings.DATABASES["default"],
+            **settings.SQLITE_PRODUCTION_PROFILE,
+            "NAME": os.path.join(directory.name, "profile.sqlite3"),
+            "TIME_ZONE": None,
+            "AUTOCOMMIT": True,
+            "ATOMIC_REQUESTS": False,
+        }
+
+    def open(self, settings_dict):
+        wrapper = DatabaseWrapper(settings_dict, alias="profile")
+        wrapper.ensure_connection()
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def pragma(self, wrapper, name):
+        with wrapper.cursor() as cursor:
+            cursor.execute(f"PRAGMA {name}")
+            return cursor.fetchone()[0]
+
+    def test_pragmas(self):
+        wrapper = self.open(self.settings_dict)
+        self.assertEqual(self.pragma(wrapper, "journal_mode"), "wal")
+        self.assertEqual(self.pragma(wrapper, "synchronous"), 1)
+        # NORMAL
+        self.assertEqual(self.pragma(wrapper, "busy_timeout"), 5000)
+        self.assertEqual(self.pragma(wrapper, "cache_size"), -32000)
+
+    def test_begin_immediate(self):
+        wrapper = self.open(self.settings_dict)
+        wrapper.force_debug_cursor = True
+        wrapper._start_transaction_under_autocommit()
+        self.assertEqual(wrapper.queries[-1]["sql"], "BEGIN IMMEDIATE")
+        wrapper.connection.rollback()
+
+    def test_invalid_transaction_mode(self):
+        self.settings_dict["OPTIONS"] = {"transaction_mode": "LATER"}
+        with self.assertRaises(ImproperlyConfigured):
+            DatabaseWrapper(self.settings_dict, alias="profile").get_connection_params()
+
+    def test_production_profile_is_opt_in(self):
+        # 開発用の設定には足さず、本番用の設定モジュールでだけ使う
+        self.assertEqual(settings.DATABASES["default"]["OPTIONS"], {})
+        self.assertEqual(settings.DATABASES["default"]["CONN_MAX_AGE"], 0)
+        for config in settings_production.DATABASES.values():
+            self.assertEqual(config["CONN_MAX_AGE"], 600)
+            self.assertTrue(config["CONN_HEALTH_CHECKS"])
+            self.assertEqual(config["OPTIONS"]["transaction_mode"], "IMMEDIATE")
+        self.assertFalse(settings_production.DEBUG)
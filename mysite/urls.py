@@ -21,6 +21,11 @@ urlpatterns = [
     path("admin/", admin.site.urls),
     path("accounts/", include("accounts.urls")),
     path("tweets/", include("tweets.urls")),
+    path("search/", include("search.urls")),
+    path("trends/", include("trends.urls")),
+    path("live/", include("live.urls")),
+    path("notifications/", include("notifications.urls")),
+    path("analytics/", include("analytics.urls")),
     path("", include("welcome.urls")),
 ]
 
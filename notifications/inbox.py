@@ -0,0 +1,115 @@
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from accounts.models import User
+from tweets import timeline_cache
+from tweets.pagination import paginate
+
+from .models import Notification
+
+# 通知の書き込み (notify) と既読 (mark_read)、受信箱 (inbox)
+# 未読の数は User.unread_notifications_count に持ち、バッジの表示で COUNT しない
+# (未読の「行」の数。0 → 1 人になった行で +1、既読にした行の数だけ -1)
+
+DISPLAY_ACTORS = 3
+
+
+def current_window(at=None):
+    return int(at if at is not None else time.time()) // (
+        settings.NOTIFICATIONS_WINDOW_SECONDS
+    )
+
+
+def _unread_changed(user_id, delta):
+    User.objects.filter(id=user_id).update(
+        unread_notifications_count=Greatest(F("unread_notifications_count") + delta, 0)
+    )
+    # バッジはどのページにも出るので、条件付き GET の ETag も変える (tweets.conditional)
+    timeline_cache.touch([("notifications", user_id)])
+
+
+def notify(recipient_id, kind, actor_id, target=0, tweet_id=None, at=None):
+    # 1件の出来事をまとめ行へ足す。数えたら True (自分自身と、最近数えた人は数えない)
+    if recipient_id == actor_id:
+        return False
+    lookup = {
+        "recipient_id": recipient_id,
+        "kind": kind,
+        "target": target,
+        "window": current_window(at),
+    }
+    with transaction.atomic():
+        row = Notification.objects.select_for_update().filter(**lookup).first()
+        if row is None:
+            try:
+                # 同じ行を同時に作ろうとしたら notification_unique に当たるので、取り直して足す
+                with transaction.atomic():
+                    Notification.objects.create(
+                        tweet_id=tweet_id,
+                        actor_count=1,
+                        actor_ids=[actor_id],
+                        unread_count=1,
+                        **lookup,
+                    )
+            except IntegrityError:
+                row = Notification.objects.select_for_update().get(**lookup)
+            else:
+                _unread_changed(recipient_id, 1)
+                return True
+        if actor_id in row.actor_ids:
+            return False
+        row.actor_ids = [actor_id, *row.actor_ids][
+            : settings.NOTIFICATIONS_RECENT_ACTORS
+        ]
+        row.actor_count += 1
+        row.unread_count += 1
+        row.updated_at = timezone.now()
+        row.save(
+            update_fields=["actor_ids", "actor_count", "unread_count", "updated_at"]
+        )
+        if row.unread_count == 1:
+            _unread_changed(recipient_id, 1)
+    return True
+
+
+def mark_read(user, ids=None):
+    # ids を省略したらすべて。既読にした行の数を返す
+    with transaction.atomic():
+        notifications = Notification.objects.filter(recipient=user, unread_count__gt=0)
+        if ids is not None:
+            notifications = notifications.filter(id__in=ids)
+        marked = notifications.update(unread_count=0)
+        if ids is None:
+            # すべて既読にしたときは 0 に揃える (カウンタがずれていても直る)
+            User.objects.filter(id=user.id).update(unread_notifications_count=0)
+            timeline_cache.touch([("notifications", user.id)])
+        elif marked:
+            _unread_changed(user.id, -marked)
+    return marked
+
+
+def inbox(user, cursor=None):
+    # 新しくできた行の順 (created_at は人が加わっても変わらないので、カーソルの前後で行が移らない)
+    # 表示する人の名前はページ全体で1回のクエリで取る
+    page = paginate(
+        Notification.objects.filter(recipient=user).select_related("tweet"), cursor
+    )
+    actor_ids = {
+        actor_id
+        for notification in page.object_list
+        for actor_id in notification.actor_ids[:DISPLAY_ACTORS]
+    }
+    actors = User.objects.only("id", "username").in_bulk(actor_ids)
+    for notification in page.object_list:
+        notification.actors = [
+            actors[actor_id]
+            for actor_id in notification.actor_ids[:DISPLAY_ACTORS]
+            if actor_id in actors
+        ]
+        notification.others = notification.actor_count - len(notification.actors)
+    return page
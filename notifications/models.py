@@ -0,0 +1,61 @@
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+
+class Notification(models.Model):
+    # 「○○さん 他 N 人があなたのツイートにいいねしました」の1行
+    # いいね・フォローの1件ごとには作らず、(受け取る人, 種類, 対象, NOTIFICATIONS_WINDOW_SECONDS の区間) ごとに1行へまとめる
+    LIKE = "like"
+    FOLLOW = "follow"
+    KIND_CHOICES = [(LIKE, "いいね"), (FOLLOW, "フォロー")]
+
+    recipient = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name="notifications",
+        on_delete=models.CASCADE,
+    )
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    target = models.BigIntegerField(default=0)
+    # まとめる単位。いいねはツイートの id、フォローは 0
+    tweet = models.ForeignKey(
+        "tweets.Tweet",
+        related_name="+",
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+    )
+    window = models.IntegerField()
+    # UNIX 時刻 // NOTIFICATIONS_WINDOW_SECONDS
+    actor_count = models.PositiveIntegerField(default=0)
+    actor_ids = models.JSONField(default=list)
+    # 最近の人から NOTIFICATIONS_RECENT_ACTORS 人まで (表示と、同じ人の重複を数えないために使う)
+    unread_count = models.PositiveIntegerField(default=0)
+    # 最後に既読にしてから増えた人数。0 なら既読
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(default=timezone.now)
+    # 新しい人が加わるたびに更新する (表示用)。受信箱は変わらない created_at, id の降順で並べる
+    # (updated_at で並べると、ページをめくる間に人が加わった行が前のページへ移り、重複や抜けが出る)
+
+    class Meta:
+        verbose_name_plural = "通知"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["recipient", "kind", "target", "window"],
+                name="notification_unique",
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["recipient", "created_at", "id"],
+                name="notification_inbox_idx",
+            ),
+        ]
+        # 受信箱のキーセットページング (recipient で絞って created_at, id の降順) 用
+
+    def __str__(self):
+        return f"{self.recipient} {self.kind}:{self.target} × {self.actor_count}"
+
+    @property
+    def is_read(self):
+        return self.unread_count == 0
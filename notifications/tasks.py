@@ -0,0 +1,37 @@
+from accounts.models import FriendShip
+from tasks.queue import task
+from tweets.models import Like
+
+from . import inbox
+from .models import Notification
+
+# いいね・フォローのリクエストからは defer するだけにして、まとめ行の書き込みはワーカーで行う
+# at は出来事の時刻 (ワーカーが遅れても、いつの区間にまとめるかは変わらない)
+
+
+@task
+def notify_likes(actor_id, likes, at):
+    # likes: [[tweet_id, author_id], ...]。実行までに取り消された (ツイートごと消された) いいねは飛ばす
+    liked = set(
+        Like.objects.filter(
+            user_id=actor_id, tweet_id__in=[tweet_id for tweet_id, _ in likes]
+        ).values_list("tweet_id", flat=True)
+    )
+    for tweet_id, author_id in likes:
+        if tweet_id in liked:
+            inbox.notify(
+                author_id,
+                Notification.LIKE,
+                actor_id,
+                target=tweet_id,
+                tweet_id=tweet_id,
+                at=at,
+            )
+
+
+@task
+def notify_follow(follower_id, following_id, at):
+    if FriendShip.objects.filter(
+        follower_id=follower_id, following_id=following_id
+    ).exists():
+        inbox.notify(following_id, Notification.FOLLOW, follower_id, at=at)
@@ -0,0 +1,207 @@
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from accounts import follows
+from accounts.models import User
+from mysite.testcases import TestCase
+from tasks import queue
+from tweets import likes
+from tweets.models import Tweet
+
+from . import inbox
+from .models import Notification
+
+
+class TestNotify(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(
+            username="author", password="testpassword"
+        )
+        self.fans = [
+            User.objects.create_user(username=f"fan{i}", password="testpassword")
+            for i in range(5)
+        ]
+        self.tweet = Tweet.objects.create(user=self.author, content="testpost")
+
+    def unread(self):
+        return User.objects.get(id=self.author.id).unread_notifications_count
+
+    def test_likes_are_coalesced(self):
+        for fan in self.fans:
+            likes.set_like(fan, self.tweet.id, True)
+        notification = Notification.objects.get()
+        self.assertEqual(notification.kind, Notification.LIKE)
+        self.assertEqual(notification.tweet, self.tweet)
+        self.assertEqual(notification.actor_count, 5)
+        self.assertEqual(notification.actor_ids[0], self.fans[-1].id)
+        # 行が1つなので未読も1
+        self.assertEqual(self.unread(), 1)
+
+    def test_same_actor_is_counted_once(self):
+        likes.set_like(self.fans[0], self.tweet.id, True)
+        likes.set_like(self.fans[0], self.tweet.id, False)
+        likes.set_like(self.fans[0], self.tweet.id, True)
+        self.assertEqual(Notification.objects.get().actor_count, 1)
+
+    def test_windows(self):
+        at = 1_700_000_000
+        window = inbox.current_window(at)
+        inbox.notify(self.author.id, Notification.FOLLOW, self.fans[0].id, at=at)
+        next_at = (window + 1) * 3600
+        inbox.notify(self.author.id, Notification.FOLLOW, self.fans[1].id, at=next_at)
+        self.assertEqual(Notification.objects.count(), 2)
+        self.assertEqual(self.unread(), 2)
+
+    def test_no_self_notification(self):
+        likes.set_like(self.author, self.tweet.id, True)
+        follows.follow(self.author, self.author)
+        self.assertFalse(Notification.objects.exists())
+
+    def test_follow(self):
+        follows.follow(self.fans[0], self.author)
+        follows.follow(self.fans[1], self.author)
+        notification = Notification.objects.get()
+        self.assertEqual(notification.kind, Notification.FOLLOW)
+        self.assertIsNone(notification.tweet)
+        self.assertEqual(notification.actor_count, 2)
+
+    def test_batch(self):
+        other = Tweet.objects.create(user=self.author, content="testpost2")
+        likes.apply_batch(self.fans[0], {self.tweet.id: True, other.id: True})
+        self.assertEqual(Notification.objects.count(), 2)
+        self.assertEqual(self.unread(), 2)
+
+    def test_mark_read(self):
+        other = Tweet.objects.create(user=self.author, content="testpost2")
+        likes.set_like(self.fans[0], self.tweet.id, True)
+        likes.set_like(self.fans[0], other.id, True)
+        first = Notification.objects.get(target=self.tweet.id)
+        self.assertEqual(inbox.mark_read(self.author, [first.id]), 1)
+        self.assertEqual(self.unread(), 1)
+        # 既読の行に新しい人が加わったら、また未読になる
+        likes.set_like(self.fans[1], self.tweet.id, True)
+        self.assertEqual(self.unread(), 2)
+        first.refresh_from_db()
+        self.assertEqual(first.unread_count, 1)
+        self.assertEqual(inbox.mark_read(self.author), 2)
+        self.assertEqual(self.unread(), 0)
+        self.assertTrue(all(n.is_read for n in Notification.objects.all()))
+
+    def test_deleted_tweet(self):
+        likes.set_like(self.fans[0], self.tweet.id, True)
+        self.tweet.delete()
+        self.assertFalse(Notification.objects.exists())
+
+    @override_settings(TASKS_EAGER=False)
+    def test_unliked_before_worker(self):
+        likes.set_like(self.fans[0], self.tweet.id, True)
+        likes.set_like(self.fans[0], self.tweet.id, False)
+        queue.run_pending()
+        self.assertFalse(Notification.objects.exists())
+
+
+class TestNotificationViews(TestCase):
+    def setUp(self):
+        self.url = reverse("notifications:index")
+        self.user = User.objects.create_user(
+            username="testuser", password="testpassword"
+        )
+        self.client.login(username="testuser", password="testpassword")
+        self.fans = [
+            User.objects.create_user(username=f"fan{i}", password="testpassword")
+            for i in range(5)
+        ]
+        self.tweets = [
+            Tweet.objects.create(user=self.user, content=f"testpost{i}")
+            for i in range(25)
+        ]
+
+    def test_inbox(self):
+        for fan in self.fans:
+            likes.set_like(fan, self.tweets[0].id, True)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, "notifications/inbox.html")
+        notification = response.context["notification_list"][0]
+        self.assertEqual(
+            [actor.username for actor in notification.actors], ["fan4", "fan3", "fan2"]
+        )
+        self.assertEqual(notification.others, 2)
+        self.assertContains(response, "他 2 人")
+
+    def test_pagination(self):
+        for tweet in self.tweets:
+            likes.set_like(self.fans[0], tweet.id, True)
+        response = self.client.get(self.url)
+        first = list(response.context["notification_list"])
+        self.assertEqual(len(first), 20)
+        self.assertEqual(first[0].tweet, self.tweets[-1])
+        # session, user, 通知のページ, 人の名前
+        with self.assertNumQueries(4):
+            response = self.client.get(
+                self.url, {"cursor": response.context["next_cursor"]}
+            )
+        self.assertEqual(len(response.context["notification_list"]), 5)
+        self.assertIsNone(response.context["next_cursor"])
+
+    def test_pagination_while_coalescing(self):
+        for tweet in self.tweets:
+            likes.set_like(self.fans[0], tweet.id, True)
+        response = self.client.get(self.url)
+        first = [n.id for n in response.context["notification_list"]]
+        # ページをめくる間に、1 ページ目と 2 ページ目の行へ人が加わる
+        likes.set_like(self.fans[1], self.tweets[0].id, True)
+        likes.set_like(self.fans[1], self.tweets[-1].id, True)
+        response = self.client.get(
+            self.url, {"cursor": response.context["next_cursor"]}
+        )
+        second = [n.id for n in response.context["notification_list"]]
+        self.assertFalse(set(first) & set(second))
+        self.assertCountEqual(
+            first + second,
+            Notification.objects.filter(recipient=self.user).values_list(
+                "id", flat=True
+            ),
+        )
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {"cursor": "invalid"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_badge_without_count(self):
+        likes.set_like(self.fans[0], self.tweets[0].id, True)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("tweets:home"))
+        self.assertContains(response, '<span class="badge bg-danger">1</span>')
+        self.assertFalse(any("COUNT(" in q["sql"] for q in queries))
+
+    def test_mark_read(self):
+        likes.set_like(self.fans[0], self.tweets[0].id, True)
+        likes.set_like(self.fans[0], self.tweets[1].id, True)
+        notification = Notification.objects.get(target=self.tweets[0].id)
+        response = self.client.post(
+            reverse("notifications:read"), {"id": [notification.id]}
+        )
+        self.assertRedirects(response, self.url)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.unread_notifications_count, 1)
+
+        self.client.post(reverse("notifications:read"))
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.unread_notifications_count, 0)
+
+    def test_mark_read_of_other_user(self):
+        other = User.objects.create_user(username="other", password="testpassword")
+        tweet = Tweet.objects.create(user=other, content="testpost")
+        likes.set_like(self.fans[0], tweet.id, True)
+        notification = Notification.objects.get()
+        self.client.post(reverse("notifications:read"), {"id": [notification.id]})
+        notification.refresh_from_db()
+        self.assertFalse(notification.is_read)
+
+    def test_login_required(self):
+        self.client.logout()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 302)
@@ -0,0 +1,9 @@
+from django.urls import path
+
+from . import views
+
+app_name = "notifications"
+urlpatterns = [
+    path("", views.NotificationListView.as_view(), name="index"),
+    path("read/", views.MarkReadView.as_view(), name="read"),
+]
@@ -0,0 +1,38 @@
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.http import Http404
+from django.shortcuts import redirect
+from django.views import View
+from django.views.generic import ListView
+
+from tweets.pagination import InvalidCursor
+
+from . import inbox
+
+
+class NotificationListView(LoginRequiredMixin, ListView):
+    template_name = "notifications/inbox.html"
+    context_object_name = "notification_list"
+
+    def get_queryset(self):
+        try:
+            self.page = inbox.inbox(self.request.user, self.request.GET.get("cursor"))
+        except InvalidCursor:
+            raise Http404("無効なカーソルです。")
+        return self.page.object_list
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["next_cursor"] = self.page.next_cursor
+        return context
+
+
+class MarkReadView(LoginRequiredMixin, View):
+    # id を送ればその通知だけ、送らなければすべてを既読にする
+    def post(self, request, **kwargs):
+        ids = request.POST.getlist("id")
+        try:
+            ids = [int(i) for i in ids] if ids else None
+        except ValueError:
+            raise Http404("無効な通知です。")
+        inbox.mark_read(request.user, ids)
+        return redirect("notifications:index")
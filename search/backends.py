@@ -0,0 +1,150 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+
+from .tokenizer import index_text, parse_query
+
+# 検索の索引。DB ごとに実装を分け、get_backend() で接続中の DB に合わせて選ぶ
+# どちらも search.tokenizer で区切ったトークンを空白でつないで入れるので、DB 側の形態素解析には頼らない
+# テーブルは search/migrations/0001_initial.py で作る
+
+SQLITE_TABLE = "search_tweet_fts"
+POSTGRES_TABLE = "search_tweetdocument"
+
+
+class SearchBackend:
+    def index(self, tweets, replace=True):
+        # 追加・更新 (同じツイートを何度入れてもよい)。新しいツイートだけなら replace=False で少し速い
+        raise NotImplementedError
+
+    def remove(self, tweet_ids):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def search(self, query, before=None, limit=20):
+        # 一致したツイートの id を新しい順に返す。before を渡すとその id より古いものだけ
+        raise NotImplementedError
+
+
+class SQLiteBackend(SearchBackend):
+    # FTS5 の仮想テーブル。rowid にツイートの id を入れる
+    def index(self, tweets, replace=True):
+        rows = [(tweet.id, index_text(tweet.content)) for tweet in tweets]
+        if not rows:
+            return
+        # FTS5 には UPSERT がないので、消してから入れる
+        if replace:
+            self.remove([tweet_id for tweet_id, _ in rows])
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {SQLITE_TABLE} (rowid, body) VALUES (%s, %s)", rows
+            )
+
+    def remove(self, tweet_ids):
+        if not tweet_ids:
+            return
+        placeholders = ", ".join(["%s"] * len(tweet_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {SQLITE_TABLE} WHERE rowid IN ({placeholders})",
+                list(tweet_ids),
+            )
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SQLITE_TABLE}")
+
+    def match_expression(self, terms):
+        # トークンは単語の文字だけなので (tokenizer.TOKEN_RE)、そのまま " で囲める
+        parts = []
+        for kind, value in terms:
+            if kind == "prefix":
+                parts.append(f'"{value}"*')
+            else:
+                parts.append('"' + " ".join(value) + '"')
+        return " AND ".join(parts)
+
+    def search(self, query, before=None, limit=20):
+        terms = parse_query(query)
+        if not terms:
+            return []
+        sql = f"SELECT rowid FROM {SQLITE_TABLE} WHERE {SQLITE_TABLE} MATCH %s"
+        params = [self.match_expression(terms)]
+        if before is not None:
+            sql += " AND rowid < %s"
+            params.append(before)
+        sql += " ORDER BY rowid DESC LIMIT %s"
+        params.append(limit)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [row[0] for row in cursor.fetchall()]
+
+
+class PostgresBackend(SearchBackend):
+    # tsvector の列と GIN インデックスを持つテーブル。辞書は 'simple' (トークンをそのまま使う)
+    def index(self, tweets, replace=True):
+        rows = [(tweet.id, index_text(tweet.content)) for tweet in tweets]
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {POSTGRES_TABLE} (tweet_id, document) "
+                "VALUES (%s, to_tsvector('simple', %s)) "
+                "ON CONFLICT (tweet_id) DO UPDATE SET document = EXCLUDED.document",
+                rows,
+            )
+
+    def remove(self, tweet_ids):
+        if not tweet_ids:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {POSTGRES_TABLE} WHERE tweet_id = ANY(%s)",
+                [list(tweet_ids)],
+            )
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"TRUNCATE {POSTGRES_TABLE}")
+
+    def tsquery(self, terms):
+        # <-> は「隣り合っている」。FTS5 のフレーズと同じ意味になる
+        parts = []
+        for kind, value in terms:
+            if kind == "prefix":
+                parts.append(f"'{value}':*")
+            else:
+                parts.append("(" + " <-> ".join(f"'{token}'" for token in value) + ")")
+        return " & ".join(parts)
+
+    def search(self, query, before=None, limit=20):
+        terms = parse_query(query)
+        if not terms:
+            return []
+        sql = (
+            f"SELECT tweet_id FROM {POSTGRES_TABLE} "
+            "WHERE document @@ to_tsquery('simple', %s)"
+        )
+        params = [self.tsquery(terms)]
+        if before is not None:
+            sql += " AND tweet_id < %s"
+            params.append(before)
+        sql += " ORDER BY tweet_id DESC LIMIT %s"
+        params.append(limit)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [row[0] for row in cursor.fetchall()]
+
+
+BACKENDS = {
+    "sqlite": SQLiteBackend,
+    "postgresql": PostgresBackend,
+}
+
+
+def get_backend():
+    try:
+        return BACKENDS[connection.vendor]()
+    except KeyError:
+        raise ImproperlyConfigured(f"検索は {connection.vendor} に対応していません。")
@@ -0,0 +1,47 @@
+from tweets.models import Tweet
+from tweets.pagination import DEFAULT_PAGE_SIZE, InvalidCursor, KeysetPage
+
+from .backends import get_backend
+
+REBUILD_BATCH_SIZE = 500
+
+
+def decode_cursor(cursor):
+    # 検索結果は id の降順なので、カーソルは最後に表示したツイートの id だけ
+    try:
+        return int(cursor)
+    except (TypeError, ValueError) as e:
+        raise InvalidCursor(cursor) from e
+
+
+def search_tweets(query, cursor=None, per_page=DEFAULT_PAGE_SIZE):
+    before = None if cursor is None else decode_cursor(cursor)
+    # 1件多く取得して、次のページがあるかどうかを COUNT なしで判定する
+    tweet_ids = get_backend().search(query, before, per_page + 1)
+    next_cursor = None
+    if len(tweet_ids) > per_page:
+        tweet_ids = tweet_ids[:per_page]
+        next_cursor = str(tweet_ids[-1])
+    tweets = Tweet.objects.select_related("user").in_bulk(tweet_ids)
+    # 索引だけ残っていて削除済みのツイートは飛ばす
+    return KeysetPage(
+        [tweets[tweet_id] for tweet_id in tweet_ids if tweet_id in tweets], next_cursor
+    )
+
+
+def rebuild(batch_size=REBUILD_BATCH_SIZE):
+    # 空にしてから入れ直すので、消す処理はいらない
+    backend = get_backend()
+    backend.clear()
+    indexed = 0
+    batch = []
+    for tweet in Tweet.objects.only("id", "content").iterator(chunk_size=batch_size):
+        batch.append(tweet)
+        if len(batch) >= batch_size:
+            backend.index(batch, replace=False)
+            indexed += len(batch)
+            batch = []
+    if batch:
+        backend.index(batch, replace=False)
+        indexed += len(batch)
+    return indexed
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from search import index
+
+
+class Command(BaseCommand):
+    help = "ツイートの全文検索の索引を作り直します。"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=index.REBUILD_BATCH_SIZE,
+            help="1回に索引するツイート数",
+        )
+
+    def handle(self, *args, **options):
+        # 作り直している間も、検索には古い索引が見えるように1つのトランザクションで行う
+        with transaction.atomic():
+            indexed = index.rebuild(options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"{indexed} 件のツイートを索引しました。"))
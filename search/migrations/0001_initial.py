@@ -0,0 +1,43 @@
+from django.db import migrations
+
+# 検索の索引は DB ごとに作りが違うので、モデルではなく SQL で作る (search/backends.py)
+
+
+def create_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE search_tweet_fts USING fts5(body, tokenize='unicode61')"
+        )
+    elif vendor == "postgresql":
+        schema_editor.execute(
+            "CREATE TABLE search_tweetdocument ("
+            " tweet_id bigint PRIMARY KEY REFERENCES tweets_tweet (id)"
+            " ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,"
+            " document tsvector NOT NULL)"
+        )
+        schema_editor.execute(
+            "CREATE INDEX search_tweetdocument_gin"
+            " ON search_tweetdocument USING GIN (document)"
+        )
+
+
+def drop_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        schema_editor.execute("DROP TABLE IF EXISTS search_tweet_fts")
+    elif vendor == "postgresql":
+        schema_editor.execute("DROP TABLE IF EXISTS search_tweetdocument")
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ("tweets", "0004_tweet_like_count"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,21 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from tweets.models import Tweet
+
+from .backends import get_backend
+
+# ツイートの保存・削除と同じトランザクションで索引を更新する
+# (bulk_create や QuerySet.update ではシグナルが飛ばないので、そのときは rebuild_search_index を使う)
+
+
+@receiver(post_save, sender=Tweet)
+def index_tweet(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and "content" not in update_fields:
+        return
+    get_backend().index([instance], replace=not created)
+
+
+@receiver(post_delete, sender=Tweet)
+def remove_tweet(sender, instance, **kwargs):
+    get_backend().remove([instance.id])
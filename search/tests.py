@@ -0,0 +1,147 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.urls import reverse
+
+from accounts.models import User
+from mysite.testcases import TestCase
+from tweets.models import Tweet
+
+from .backends import PostgresBackend, SQLiteBackend, get_backend
+from .index import search_tweets
+from .tokenizer import parse_query, tokenize
+
+
+class TestTokenizer(TestCase):
+    def test_japanese_bigrams(self):
+        self.assertEqual(tokenize("東京タワー"), ["東京", "京タ", "タワ", "ワー", "ー"])
+
+    def test_words_and_normalization(self):
+        # 全角英数・半角カナは揃え、大文字小文字は区別しない
+        self.assertEqual(tokenize("Ｄｊａｎｇｏで ｶﾅ"), ["django", "で", "カナ", "ナ"])
+
+    def test_parse_query(self):
+        self.assertEqual(
+            parse_query("猫 東京タワー Django"),
+            [
+                ("prefix", "猫"),
+                ("phrase", ["東京", "京タ", "タワ", "ワー"]),
+                ("phrase", ["django"]),
+            ],
+        )
+
+    def test_symbols_are_ignored(self):
+        self.assertEqual(parse_query('" OR * ()'), [("phrase", ["or"])])
+
+    def test_postgres_query(self):
+        self.assertEqual(
+            PostgresBackend().tsquery(parse_query("猫 東京")),
+            "'猫':* & ('東京')",
+        )
+        self.assertEqual(
+            SQLiteBackend().match_expression(parse_query("猫 京タワ")),
+            '"猫"* AND "京タ タワ"',
+        )
+
+
+class TestSearchIndex(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="tester", password="testpassword")
+
+    def search(self, query):
+        return [tweet.content for tweet in search_tweets(query)]
+
+    def test_index_on_save(self):
+        Tweet.objects.create(user=self.user, content="今日は東京タワーに行った")
+        Tweet.objects.create(user=self.user, content="京都タワーも見たい")
+        Tweet.objects.create(user=self.user, content="Django is great")
+
+        self.assertEqual(self.search("東京タワー"), ["今日は東京タワーに行った"])
+        self.assertEqual(self.search("タワー"), ["京都タワーも見たい", "今日は東京タワーに行った"])
+        self.assertEqual(self.search("京"), ["京都タワーも見たい", "今日は東京タワーに行った"])
+        self.assertEqual(self.search("都"), ["京都タワーも見たい"])
+        self.assertEqual(self.search("DJANGO great"), ["Django is great"])
+        self.assertEqual(self.search("東京 django"), [])
+        self.assertEqual(self.search("!!"), [])
+
+    def test_phrase_is_contiguous(self):
+        # 「東京」と「タワー」が離れていれば「東京タワー」には一致しない
+        Tweet.objects.create(user=self.user, content="東京の夜景とスカイタワー")
+        self.assertEqual(self.search("東京タワー"), [])
+        self.assertEqual(self.search("東京 タワー"), ["東京の夜景とスカイタワー"])
+
+    def test_update_and_delete(self):
+        tweet = Tweet.objects.create(user=self.user, content="りんご")
+        tweet.content = "みかん"
+        tweet.save()
+        self.assertEqual(self.search("りんご"), [])
+        self.assertEqual(self.search("みかん"), ["みかん"])
+
+        tweet.delete()
+        self.assertEqual(self.search("みかん"), [])
+
+    def test_cascade_delete(self):
+        Tweet.objects.create(user=self.user, content="りんご")
+        self.user.delete()
+        self.assertEqual(get_backend().search("りんご"), [])
+
+    def test_pagination(self):
+        tweets = [
+            Tweet.objects.create(user=self.user, content=f"猫の写真 {i}") for i in range(5)
+        ]
+        first = search_tweets("猫", per_page=2)
+        self.assertEqual([t.id for t in first], [tweets[4].id, tweets[3].id])
+        second = search_tweets("猫", first.next_cursor, per_page=2)
+        self.assertEqual([t.id for t in second], [tweets[2].id, tweets[1].id])
+        last = search_tweets("猫", second.next_cursor, per_page=2)
+        self.assertEqual([t.id for t in last], [tweets[0].id])
+        self.assertFalse(last.has_next)
+
+
+class TestSearchView(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="tester", password="testpassword")
+        self.client.login(username="tester", password="testpassword")
+        self.url = reverse("search:index")
+
+    def test_success_get(self):
+        tweet = Tweet.objects.create(user=self.user, content="東京タワーに行った")
+        response = self.client.get(self.url, {"q": "東京"})
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, "search/search.html")
+        self.assertEqual(list(response.context["tweet_list"]), [tweet])
+        self.assertEqual(response.context["query"], "東京")
+
+    def test_empty_query(self):
+        Tweet.objects.create(user=self.user, content="東京タワーに行った")
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context["tweet_list"]), [])
+
+    def test_query_count(self):
+        for i in range(30):
+            Tweet.objects.create(user=self.user, content=f"猫の写真 {i}")
+        # session, user, 検索, ツイート, いいね状態
+        with self.assertNumQueries(5):
+            response = self.client.get(self.url, {"q": "猫"})
+        self.assertEqual(len(response.context["tweet_list"]), 20)
+        self.assertIsNotNone(response.context["next_cursor"])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {"q": "猫", "cursor": "abc"})
+        self.assertEqual(response.status_code, 404)
+
+
+class TestRebuildSearchIndex(TestCase):
+    def test_rebuild(self):
+        user = User.objects.create_user(username="tester", password="testpassword")
+        # bulk_create ではシグナルが飛ばないので索引されない
+        Tweet.objects.bulk_create(
+            [Tweet(user=user, content=f"一括投稿 {i}") for i in range(7)]
+        )
+        self.assertEqual(get_backend().search("一括"), [])
+
+        out = StringIO()
+        call_command("rebuild_search_index", batch_size=3, stdout=out)
+        self.assertIn("7 件", out.getvalue())
+        self.assertEqual(len(get_backend().search("一括")), 7)
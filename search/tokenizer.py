@@ -0,0 +1,59 @@
+import re
+import unicodedata
+
+# 日本語には単語の区切りがないので、漢字・かな・カナ(とハングル)の連続は2文字ずつ(bigram)に区切って索引する
+# 英数字は単語ごとにそのまま索引する
+# 例: "東京タワーに行った" → 東京 京タ タワ ワー ーに に行 行っ った た
+# 連続の最後の1文字も索引しておき、1文字だけの検索語は前方一致で探す
+
+# ひらがな・カタカナ, CJK 統合漢字(拡張A), CJK 互換漢字, ハングル
+CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af"
+TOKEN_RE = re.compile(rf"[{CJK}]+|[^\W{CJK}]+")
+CJK_RE = re.compile(rf"[{CJK}]")
+NGRAM_SIZE = 2
+
+
+def normalize(text):
+    # 全角英数・半角カナなどを揃え、大文字小文字を区別しない
+    return unicodedata.normalize("NFKC", text).lower()
+
+
+def _runs(text):
+    for match in TOKEN_RE.finditer(normalize(text)):
+        run = match.group()
+        yield run, bool(CJK_RE.match(run))
+
+
+def ngrams(run):
+    return [run[i : i + NGRAM_SIZE] for i in range(len(run) - NGRAM_SIZE + 1)]
+
+
+def tokenize(text):
+    # 索引する側の区切り方
+    tokens = []
+    for run, is_cjk in _runs(text):
+        if is_cjk:
+            tokens.extend(ngrams(run))
+            tokens.append(run[-1])
+        else:
+            tokens.append(run)
+    return tokens
+
+
+def index_text(text):
+    return " ".join(tokenize(text))
+
+
+def parse_query(text):
+    # 検索語を (種類, トークン) の並びにする。全部を AND でつなぐ
+    # - ("phrase", [...]): トークンが索引の中で連続していること (bigram を並べたもの)
+    # - ("prefix", "猫"): 1文字だけの日本語。その文字で始まるトークンを探す
+    terms = []
+    for run, is_cjk in _runs(text):
+        if is_cjk and len(run) < NGRAM_SIZE:
+            terms.append(("prefix", run))
+        elif is_cjk:
+            terms.append(("phrase", ngrams(run)))
+        else:
+            terms.append(("phrase", [run]))
+    return terms
@@ -0,0 +1,37 @@
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.http import Http404
+from django.views.generic import ListView
+
+from tweets import timeline_cache
+from tweets.models import Tweet
+from tweets.pagination import DEFAULT_PAGE_SIZE, InvalidCursor, KeysetPage
+
+from . import index
+
+
+class SearchView(LoginRequiredMixin, ListView):
+    model = Tweet
+    template_name = "search/search.html"
+    context_object_name = "tweet_list"
+    page_size = DEFAULT_PAGE_SIZE
+
+    def get_queryset(self):
+        self.query = self.request.GET.get("q", "").strip()
+        if not self.query:
+            self.page = KeysetPage([], None)
+            return []
+        try:
+            self.page = index.search_tweets(
+                self.query, self.request.GET.get("cursor"), self.page_size
+            )
+        except InvalidCursor:
+            raise Http404("無効なカーソルです。")
+        return timeline_cache.annotate_viewer_state(
+            self.request.user, self.page.object_list
+        )
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["query"] = self.query
+        context["next_cursor"] = self.page.next_cursor
+        return context
@@ -10,20 +10,88 @@ const getCookie = (name) => {
 }
 const csrftoken = getCookie('csrftoken')
 
-const changeLike = async (id) => {
+// 連打されたいいねはすぐには送らず、少し待ってから最後の状態だけをまとめて送る
+const LIKE_BATCH_DELAY = 300
+const pendingLikes = new Map()  // tweet_id => "like" | "unlike"
+const likedBeforePending = new Map()  // tweet_id => 押し始める前 (サーバー側) の状態
+let likeBatchTimer = null
+
+const changeLike = (id) => {
     // buttonのid ( = "tweet-{{tweet.id}}" )
     const like_button = document.querySelector("#" + id)
-    const url = like_button.dataset.url;
+    const is_liked = like_button.dataset.liked !== "true"
+    if (!likedBeforePending.has(like_button.dataset.tweetId)) {
+        likedBeforePending.set(like_button.dataset.tweetId, !is_liked)
+    }
+    // 返事を待たずに見た目だけ先に切り替える
+    changeIcon(like_button, is_liked)
+    pendingLikes.set(like_button.dataset.tweetId, is_liked ? "like" : "unlike")
+    clearTimeout(likeBatchTimer)
+    likeBatchTimer = setTimeout(sendLikes, LIKE_BATCH_DELAY)
+}
+
+const sendLikes = async () => {
+    const operations = [...pendingLikes].map(([tweet_id, action]) => ({ tweet_id: Number(tweet_id), action }))
+    const likedBefore = new Map(likedBeforePending)
+    pendingLikes.clear()
+    likedBeforePending.clear()
+    if (operations.length === 0) {
+        return
+    }
+    const url = document.querySelector('meta[name="like-batch-url"]').content
     const data = {
         method: "POST",
         headers: {
             'Content-Type': 'application/json',
             "X-CSRFToken": csrftoken,
-        }
+        },
+        body: JSON.stringify({ operations }),
     };
-    const response = await fetch(url, data);
-    const tweet_data = await response.json();
-    changeStyle(tweet_data, like_button);
+    let batch_data
+    try {
+        const response = await fetch(url, data);
+        if (!response.ok) {
+            throw new Error(`like batch: ${response.status}`)
+        }
+        batch_data = await response.json();
+    } catch (error) {
+        // 送れなかったので、押す前の見た目に戻す
+        revertLikes(operations.map(({ tweet_id }) => tweet_id), likedBefore)
+        return
+    }
+    // 消されていたツイートも元に戻す
+    revertLikes(batch_data.missing, likedBefore)
+    for (const tweet_data of batch_data.results) {
+        // 送信中にまた押されたツイートは、次の送信の結果で上書きされるのでここでは触らない
+        if (pendingLikes.has(String(tweet_data.tweet_id))) {
+            continue
+        }
+        const like_button = document.querySelector("#tweet-" + tweet_data.tweet_id)
+        changeStyle(tweet_data, like_button);
+    }
+}
+
+const revertLikes = (tweet_ids, likedBefore) => {
+    for (const tweet_id of tweet_ids) {
+        // 送信中にまた押されたツイートは次の送信に任せる (サーバー側は変わっていないので、戻す先だけ引き継ぐ)
+        if (pendingLikes.has(String(tweet_id))) {
+            likedBeforePending.set(String(tweet_id), likedBefore.get(String(tweet_id)))
+            continue
+        }
+        const like_button = document.querySelector("#tweet-" + tweet_id)
+        if (like_button) {
+            changeIcon(like_button, likedBefore.get(String(tweet_id)))
+        }
+    }
+}
+
+const changeIcon = (like_button, is_liked) => {
+    like_button.dataset.liked = is_liked ? "true" : "false"
+    if (is_liked) {
+        like_button.innerHTML = '<i class="fa-solid fa-heart fa-lg" style="color:red;"></i>';
+    } else {
+        like_button.innerHTML = '<i class="fa-regular fa-heart fa-lg"></i>';
+    }
 }
 
 const changeStyle = (tweet_data, like_button) => {
@@ -32,14 +100,53 @@ const changeStyle = (tweet_data, like_button) => {
     if (tweet_data.is_liked) {
         unlike_url = tweet_data.unlike_url;
         like_button.setAttribute("data-url", unlike_url);
-        like_button.innerHTML = '<i class="fa-solid fa-heart fa-lg" style="color:red;"></i>';
-        like_count.textContent = tweet_data.like_count;
     } else {
         like_url = tweet_data.like_url;
         like_button.setAttribute("data-url", like_url);
-        like_button.innerHTML = '<i class="fa-regular fa-heart fa-lg"></i>';
-        like_count.textContent = tweet_data.like_count;
+    }
+    changeIcon(like_button, tweet_data.is_liked)
+    like_count.textContent = tweet_data.like_count;
+
+}
+
+// 他の人のいいね数の増減と、フォロー中の人の新しいツイートをサーバーから受け取る (Server-Sent Events)
+// いいね数はツイートごとにまとめた増減で届くので、表示中の数に足すだけ (取り直さない)
+const applyLikeDeltas = (deltas) => {
+    for (const [tweet_id, delta] of Object.entries(deltas)) {
+        for (const like_count of document.querySelectorAll(".count_" + tweet_id)) {
+            like_count.textContent = Math.max(Number(like_count.textContent) + delta, 0)
+        }
+    }
+}
 
+let newTweetCount = 0
+
+const showNewTweets = () => {
+    const notice = document.querySelector("#new-tweets")
+    if (!notice) {
+        return
     }
+    newTweetCount += 1
+    notice.querySelector(".new-tweets-count").textContent = newTweetCount
+    notice.hidden = false
+}
 
+// いいね数は画面に出ているツイートの分だけ受け取る (無限スクロールで増えたらつなぎ直す)
+let liveSource = null
+
+const startLiveUpdates = () => {
+    const meta = document.querySelector('meta[name="live-stream-url"]')
+    if (!meta || !("EventSource" in window)) {
+        return
+    }
+    const tweet_ids = new Set([...document.querySelectorAll("[data-tweet-id]")].map((button) => button.dataset.tweetId))
+    if (liveSource) {
+        liveSource.close()
+    }
+    liveSource = new EventSource(meta.content + "?tweets=" + [...tweet_ids].join(","))
+    liveSource.addEventListener("likes", (event) => applyLikeDeltas(JSON.parse(event.data).deltas))
+    liveSource.addEventListener("tweet", showNewTweets)
 }
+
+window.addEventListener("DOMContentLoaded", startLiveUpdates)
+document.addEventListener("tweets-added", startLiveUpdates)
@@ -0,0 +1,42 @@
+// ホームの無限スクロール
+// #tweet-list-more が画面に入ったら次のページ(カードのHTML)を取得して #tweet-list に追加する
+let loading = false
+
+const loadMore = async (more, observer) => {
+    if (loading) {
+        return
+    }
+    loading = true
+    const url = more.dataset.url + "?cursor=" + encodeURIComponent(more.dataset.cursor)
+    const response = await fetch(url, { headers: { "Accept": "application/json" } })
+    loading = false
+    if (!response.ok) {
+        return
+    }
+    const page = await response.json()
+    document.querySelector("#tweet-list").insertAdjacentHTML("beforeend", page.html)
+    // 追加したツイートのいいね数も受け取れるように、like.js にストリームをつなぎ直させる
+    document.dispatchEvent(new Event("tweets-added"))
+    if (page.has_next) {
+        more.dataset.cursor = page.next_cursor
+        more.querySelector("a").setAttribute("href", "?cursor=" + page.next_cursor)
+        // まだ画面内に残っている場合にもう一度発火させる
+        observer.unobserve(more)
+        observer.observe(more)
+    } else {
+        more.remove()
+    }
+}
+
+window.addEventListener("DOMContentLoaded", () => {
+    const more = document.querySelector("#tweet-list-more")
+    if (!more || !("IntersectionObserver" in window)) {
+        return
+    }
+    const observer = new IntersectionObserver((entries) => {
+        if (entries.some((entry) => entry.isIntersecting)) {
+            loadMore(more, observer)
+        }
+    })
+    observer.observe(more)
+})
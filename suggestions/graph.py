@@ -0,0 +1,74 @@
+import itertools
+
+import numpy as np
+
+from accounts.models import FriendShip, User
+
+# フォローのグラフを CSR (indptr, indices) の配列で持ち、「フォローしている人がフォローしている人」を数える
+# ユーザーは id の昇順に 0, 1, 2, ... と番号を振り、i 番目の人がフォローしている人は indices[indptr[i]:indptr[i + 1]]
+
+CHUNK_SIZE = 10000
+
+
+class FollowGraph:
+    def __init__(self, user_ids, edges):
+        # user_ids: 昇順の id の配列。edges: (フォローする人, される人) の id の組の配列 (shape は (辺の数, 2))
+        self.user_ids = user_ids
+        n = len(user_ids)
+        edges = edges.reshape(-1, 2)
+        index = np.searchsorted(user_ids, edges)
+        # 読み込みの間に作られたユーザーの辺は入れない
+        known = (index < n) & (user_ids[np.minimum(index, max(n - 1, 0))] == edges)
+        index = index[known.all(axis=1)]
+        src, dst = index[:, 0], index[:, 1]
+        order = np.lexsort((dst, src))
+        self.indices = dst[order]
+        self.indptr = np.concatenate(([0], np.cumsum(np.bincount(src, minlength=n))))
+        self.follower_counts = np.bincount(dst, minlength=n)
+
+    @classmethod
+    def load(cls):
+        # id だけを CHUNK_SIZE 行ずつ読み、モデルのインスタンスは作らない
+        user_ids = np.fromiter(
+            User.objects.order_by("id")
+            .values_list("id", flat=True)
+            .iterator(chunk_size=CHUNK_SIZE),
+            dtype=np.int64,
+        )
+        edges = np.fromiter(
+            itertools.chain.from_iterable(
+                FriendShip.objects.values_list("follower_id", "following_id").iterator(
+                    chunk_size=CHUNK_SIZE
+                )
+            ),
+            dtype=np.int64,
+        )
+        return cls(user_ids, edges)
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def following(self, i):
+        return self.indices[self.indptr[i] : self.indptr[i + 1]]
+
+    def suggest(self, i, k):
+        # i 番目の人へのおすすめ上位 k 人。(ユーザー id の配列, 共通のフォローの数の配列)
+        followed = self.following(i)
+        starts = self.indptr[followed]
+        lengths = self.indptr[followed + 1] - starts
+        # フォローしている人それぞれがフォローしている人の区間を、1つの配列に並べる
+        offsets = np.arange(lengths.sum()) - np.repeat(
+            np.cumsum(lengths) - lengths, lengths
+        )
+        second = self.indices[np.repeat(starts, lengths) + offsets]
+        candidates, scores = np.unique(second, return_counts=True)
+        # 自分と、もうフォローしている人は除く
+        keep = ~np.isin(candidates, followed, assume_unique=True) & (candidates != i)
+        candidates, scores = candidates[keep], scores[keep]
+        if len(candidates) > k:
+            # 上位 k 番目と同じ数の人までに絞ってから並べる (同じ数の人の順番はフォロワー数と id で決める)
+            threshold = np.partition(scores, len(scores) - k)[len(scores) - k]
+            top = scores >= threshold
+            candidates, scores = candidates[top], scores[top]
+        order = np.lexsort((candidates, -self.follower_counts[candidates], -scores))[:k]
+        return self.user_ids[candidates[order]], scores[order]
@@ -0,0 +1,75 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from accounts.models import FriendShip, User
+from tweets import timeline_cache
+
+from .graph import FollowGraph
+from .models import Suggestion
+
+# おすすめユーザーの表 (Suggestion) の作り直しと読み込み
+# 作り直しはフォローのグラフを一度だけ読み込み (suggestions.graph)、SUGGESTIONS_BATCH_SIZE 人ずつ入れ替える
+
+
+def rebuild(top_k=None, batch_size=None):
+    # (ユーザー数, おすすめの行数) を返す
+    top_k = top_k or settings.SUGGESTIONS_TOP_K
+    batch_size = batch_size or settings.SUGGESTIONS_BATCH_SIZE
+    graph = FollowGraph.load()
+    written = 0
+    for start in range(0, len(graph), batch_size):
+        end = min(start + batch_size, len(graph))
+        rows = []
+        for i in range(start, end):
+            user_id = int(graph.user_ids[i])
+            suggested_ids, scores = graph.suggest(i, top_k)
+            rows.extend(
+                Suggestion(
+                    user_id=user_id,
+                    suggested_id=int(suggested_id),
+                    score=int(score),
+                    rank=rank,
+                )
+                for rank, (suggested_id, score) in enumerate(zip(suggested_ids, scores))
+            )
+        with transaction.atomic():
+            # 読み込んだ後に消されたユーザーの行は入れない
+            existing = set(
+                User.objects.filter(
+                    id__in={row.user_id for row in rows}
+                    | {row.suggested_id for row in rows}
+                ).values_list("id", flat=True)
+            )
+            Suggestion.objects.filter(
+                user_id__gte=graph.user_ids[start], user_id__lte=graph.user_ids[end - 1]
+            ).delete()
+            written += len(
+                Suggestion.objects.bulk_create(
+                    [
+                        row
+                        for row in rows
+                        if row.user_id in existing and row.suggested_id in existing
+                    ],
+                    batch_size=1000,
+                )
+            )
+    # ホーム・プロフィールの条件付き GET の ETag を変える (tweets.conditional)
+    timeline_cache.touch([("suggestions", 0)])
+    return len(graph), written
+
+
+def suggestions_for(user, limit=None):
+    # 表を user で絞って rank 順に読むだけの1回のクエリ。作り直した後にフォローした人は除く
+    return list(
+        Suggestion.objects.filter(user=user)
+        .exclude(
+            Exists(
+                FriendShip.objects.filter(
+                    follower=user, following_id=OuterRef("suggested_id")
+                )
+            )
+        )
+        .select_related("suggested")
+        .order_by("rank")[: limit or settings.SUGGESTIONS_DISPLAY]
+    )
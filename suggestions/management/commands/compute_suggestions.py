@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from suggestions import index
+
+
+class Command(BaseCommand):
+    help = "フォローのグラフからおすすめユーザーの表を作り直します。"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top-k", type=int, default=None)
+        parser.add_argument("--batch-size", type=int, default=None)
+
+    def handle(self, *args, **options):
+        users, written = index.rebuild(options["top_k"], options["batch_size"])
+        self.stdout.write(f"{users} 人のおすすめを {written} 件作りました。")
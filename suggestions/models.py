@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.db import models
+
+
+class Suggestion(models.Model):
+    # 「おすすめユーザー」の上位 SUGGESTIONS_TOP_K 人。python manage.py compute_suggestions が丸ごと作り直す
+    # 表示するときは user で絞って rank 順に読むだけ (フォローのグラフをたどらない)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name="suggestions",
+        on_delete=models.CASCADE,
+    )
+    suggested = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name="+",
+        on_delete=models.CASCADE,
+    )
+    score = models.PositiveIntegerField()
+    # user がフォローしている人のうち、suggested をフォローしている人数
+    rank = models.PositiveSmallIntegerField()
+    # 0 から。score の多い順 (同じならフォロワーの多い順)
+
+    class Meta:
+        verbose_name_plural = "おすすめユーザー"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "rank"], name="suggestion_user_rank_unique"
+            ),
+        ]
+        # 表示 (user で絞って rank 順に先頭から) はこの制約のインデックスだけで読める
+
+    def __str__(self):
+        return f"{self.user} → {self.suggested} ({self.score})"
@@ -0,0 +1,135 @@
+from io import StringIO
+
+import numpy as np
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+
+from accounts import follows
+from accounts.models import User
+from mysite.testcases import TestCase
+
+from . import index
+from .graph import FollowGraph
+from .models import Suggestion
+
+
+class TestFollowGraph(TestCase):
+    def graph(self, edges):
+        return FollowGraph(
+            np.array([10, 20, 30, 40, 50]), np.array(edges, dtype=np.int64)
+        )
+
+    def test_csr(self):
+        graph = self.graph([(10, 30), (10, 20), (30, 40)])
+        np.testing.assert_array_equal(graph.indptr, [0, 2, 2, 3, 3, 3])
+        np.testing.assert_array_equal(graph.indices, [1, 2, 3])
+        np.testing.assert_array_equal(graph.following(0), [1, 2])
+
+    def test_unknown_users_are_skipped(self):
+        graph = self.graph([(10, 20), (10, 99), (99, 10), (60, 10)])
+        np.testing.assert_array_equal(graph.indices, [1])
+
+    def test_suggest(self):
+        # 10 は 20, 30 をフォロー。50 は2人から、40 は1人からフォローされている
+        graph = self.graph(
+            [(10, 20), (10, 30), (20, 50), (30, 50), (30, 40), (20, 10), (30, 20)]
+        )
+        user_ids, scores = graph.suggest(0, 5)
+        np.testing.assert_array_equal(user_ids, [50, 40])
+        np.testing.assert_array_equal(scores, [2, 1])
+
+    def test_suggest_top_k_and_ties(self):
+        # 同じ数ならフォロワーの多い順、それも同じなら id 順
+        graph = self.graph([(10, 20), (20, 30), (20, 40), (20, 50), (30, 50)])
+        user_ids, _ = graph.suggest(0, 2)
+        np.testing.assert_array_equal(user_ids, [50, 30])
+
+    def test_no_follows(self):
+        user_ids, scores = self.graph([(20, 30)]).suggest(0, 5)
+        self.assertEqual(len(user_ids), 0)
+        self.assertEqual(len(scores), 0)
+
+
+class TestSuggestions(TestCase):
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(username=f"testuser{i}", password="testpassword")
+            for i in range(5)
+        ]
+        user0, user1, user2, user3, user4 = self.users
+        follows.follow(user0, user1)
+        follows.follow(user0, user2)
+        follows.follow(user1, user3)
+        follows.follow(user2, user3)
+        follows.follow(user2, user4)
+
+    def test_rebuild(self):
+        self.assertEqual(index.rebuild(batch_size=2), (5, 2))
+        self.assertEqual(
+            list(
+                Suggestion.objects.filter(user=self.users[0])
+                .order_by("rank")
+                .values_list("suggested__username", "score")
+            ),
+            [("testuser3", 2), ("testuser4", 1)],
+        )
+        # 作り直すと前回の行は入れ替わる
+        follows.unfollow(self.users[0], self.users[2])
+        index.rebuild()
+        self.assertEqual(
+            list(
+                Suggestion.objects.filter(user=self.users[0]).values_list(
+                    "suggested__username", flat=True
+                )
+            ),
+            ["testuser3"],
+        )
+
+    def test_suggestions_for(self):
+        index.rebuild()
+        with self.assertNumQueries(1):
+            suggestions = index.suggestions_for(self.users[0])
+            self.assertEqual(
+                [s.suggested.username for s in suggestions], ["testuser3", "testuser4"]
+            )
+        # 作り直す前でも、フォローした人は出さない
+        follows.follow(self.users[0], self.users[3])
+        self.assertEqual(
+            [s.suggested for s in index.suggestions_for(self.users[0])],
+            [self.users[4]],
+        )
+
+    def test_command(self):
+        out = StringIO()
+        call_command("compute_suggestions", top_k=1, stdout=out)
+        self.assertIn("5 人のおすすめを 1 件作りました。", out.getvalue())
+
+    @override_settings(SUGGESTIONS_DISPLAY=1)
+    def test_home_and_profile(self):
+        index.rebuild()
+        self.client.login(username="testuser0", password="testpassword")
+        response = self.client.get(reverse("tweets:home"))
+        self.assertEqual(
+            [s.suggested for s in response.context["suggestion_list"]],
+            [self.users[3]],
+        )
+        self.assertContains(response, "フォロー中の 2 人がフォロー")
+        self.assertContains(
+            response, reverse("accounts:follow", args=[self.users[3].username])
+        )
+
+        url = reverse("accounts:user_profile", args=[self.users[1].username])
+        response = self.client.get(url)
+        self.assertEqual(
+            [s.suggested for s in response.context["suggestion_list"]],
+            [self.users[3]],
+        )
+
+    def test_etag_changes_on_rebuild(self):
+        self.client.login(username="testuser0", password="testpassword")
+        etag = self.client.get(reverse("tweets:home"))["ETag"]
+        index.rebuild()
+        response = self.client.get(reverse("tweets:home"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "おすすめユーザー")
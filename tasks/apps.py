@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+from django.utils.module_loading import autodiscover_modules
+
+
+class TasksConfig(AppConfig):
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "tasks"
+
+    def ready(self):
+        # 各アプリの tasks.py を読み込んで、@task の登録を済ませておく (ワーカーが名前から関数を引けるように)
+        autodiscover_modules("tasks")
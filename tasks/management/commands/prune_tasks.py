@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from tasks import queue
+
+
+class Command(BaseCommand):
+    help = "保存期間 (TASKS_RETENTION_SECONDS) を過ぎた完了済み・失敗済みのタスクを削除します。"
+
+    def handle(self, *args, **options):
+        deleted = queue.prune()
+        self.stdout.write(f"{deleted} 件のタスクを削除しました。")
@@ -0,0 +1,32 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from tasks import queue
+
+
+class Command(BaseCommand):
+    help = "バックグラウンドタスクを実行するワーカーです。--once を付けなければ止めるまで待ち続けます。"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="今実行できるタスクを全部実行したら終了する")
+        parser.add_argument("--batch-size", type=int, default=settings.TASKS_BATCH_SIZE)
+        parser.add_argument(
+            "--poll",
+            type=float,
+            default=settings.TASKS_POLL_SECONDS,
+            help="タスクが無いときに次に見に行くまでの秒数",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            results = queue.run_pending(options["batch_size"])
+            if any(results.values()) or options["once"]:
+                self.stdout.write(
+                    "完了 {done} 件、再試行待ち {pending} 件、失敗 {failed} 件".format(**results)
+                )
+            if options["once"]:
+                return
+            if not any(results.values()):
+                time.sleep(options["poll"])
@@ -0,0 +1,46 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Task(models.Model):
+    # リクエストの後でやればよい処理の待ち行列 (tasks.queue)。外部のブローカーは使わず DB の表だけで回す
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "待ち"),
+        (RUNNING, "実行中"),
+        (DONE, "完了"),
+        (FAILED, "失敗"),
+    ]
+
+    name = models.CharField(max_length=200)
+    # @task で登録した名前 (モジュール名.関数名)
+    args = models.JSONField(default=list)
+    kwargs = models.JSONField(default=dict)
+    # 引数は JSON にできるもの (id など) だけにする。モデルのインスタンスは渡さない
+    key = models.CharField(max_length=200, null=True, blank=True, unique=True)
+    # 冪等キー。同じキーの defer は2回目から何もしない (古い完了済みを prune_tasks で消すまで)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField()
+    run_after = models.DateTimeField(default=timezone.now)
+    # 失敗したら、この時刻まで次の実行を待つ (指数バックオフ)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    # 実行中のワーカーが落ちても、この時刻を過ぎたら別のワーカーが拾い直す
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = "バックグラウンドタスク"
+        indexes = [
+            models.Index(
+                fields=["status", "run_after"], name="task_status_run_after_idx"
+            ),
+        ]
+        # ワーカーが次に実行するもの (status, run_after の順) を探すのに使う
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
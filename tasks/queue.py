@@ -0,0 +1,177 @@
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from mysite.middleware import unbudgeted
+
+from .models import Task
+
+# バックグラウンドタスク
+#   @task
+#   def fan_out_tweet(tweet_id): ...
+#   fan_out_tweet.defer(tweet.id, key=f"fan_out:{tweet.id}")
+# - defer は Task の行を1つ入れるだけ。呼び出し側と同じトランザクションなので、ロールバックされたら消える
+# - 実行は python manage.py run_tasks (ワーカー)。失敗したら指数バックオフで TASKS_MAX_ATTEMPTS 回まで
+# - 何度実行されても結果が同じになるように書く (ワーカーが途中で落ちると、同じタスクがもう一度走る)
+# - settings.TASKS_EAGER なら defer の場で実行する (テスト用。Task の行は入れる)
+
+logger = logging.getLogger(__name__)
+
+REGISTRY = {}
+
+
+class UnknownTask(Exception):
+    pass
+
+
+class TaskFunction:
+    def __init__(self, func, name, max_attempts):
+        self.func = func
+        self.name = name
+        self.max_attempts = max_attempts
+        self.__doc__ = func.__doc__
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def defer(self, *args, key=None, delay=None, **kwargs):
+        # 戻り値は Task (同じキーで入れ済みのときは None)
+        fields = {
+            "name": self.name,
+            "args": list(args),
+            "kwargs": kwargs,
+            "max_attempts": self.max_attempts or settings.TASKS_MAX_ATTEMPTS,
+            "run_after": timezone.now() + timedelta(seconds=delay or 0),
+        }
+        if key is None:
+            task_row = Task.objects.create(**fields)
+        else:
+            try:
+                # 同じキーがあれば key の UNIQUE 制約に当たる。外側のトランザクションを壊さないようにセーブポイントで囲む
+                with transaction.atomic():
+                    task_row = Task.objects.create(key=key, **fields)
+            except IntegrityError:
+                return None
+        if settings.TASKS_EAGER:
+            run_now(task_row)
+        return task_row
+
+
+def task(func=None, *, name=None, max_attempts=None):
+    def decorate(func):
+        task_function = TaskFunction(
+            func, name or f"{func.__module__}.{func.__name__}", max_attempts
+        )
+        REGISTRY[task_function.name] = task_function
+        return task_function
+
+    if func is not None:
+        return decorate(func)
+    return decorate
+
+
+def run_now(task_row):
+    # TASKS_EAGER (テスト) 用。行を入れるところまではワーカーがあるときと同じにして、その場で実行する
+    # 失敗は例外のまま呼び出し側へ返す。実行の分の SQL はリクエストの件数 (QUERY_BUDGETS) に数えない
+    with unbudgeted():
+        REGISTRY[task_row.name].func(*task_row.args, **task_row.kwargs)
+        Task.objects.filter(id=task_row.id).update(
+            status=Task.DONE, attempts=1, finished_at=timezone.now()
+        )
+    task_row.status = Task.DONE
+    task_row.attempts = 1
+
+
+def backoff(attempts):
+    # 1回目の失敗で TASKS_BACKOFF_SECONDS、以降は倍々 (上限 TASKS_BACKOFF_MAX_SECONDS)
+    seconds = settings.TASKS_BACKOFF_SECONDS * 2 ** (attempts - 1)
+    return timedelta(seconds=min(seconds, settings.TASKS_BACKOFF_MAX_SECONDS))
+
+
+def claim(batch_size, now=None):
+    # 実行できるタスクを batch_size 件まで取り、実行中にする
+    # PostgreSQL では SKIP LOCKED で他のワーカーが取ったものを飛ばす
+    # (SQLite は BEGIN IMMEDIATE で書き込みのトランザクションが1つずつになるので、同じタスクを2人が取ることはない)
+    now = now or timezone.now()
+    with transaction.atomic():
+        ids = list(
+            Task.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status=Task.PENDING, run_after__lte=now)
+                | Q(status=Task.RUNNING, locked_until__lt=now)
+            )
+            .order_by("run_after", "id")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            return []
+        Task.objects.filter(id__in=ids).update(
+            status=Task.RUNNING,
+            attempts=F("attempts") + 1,
+            locked_until=now + timedelta(seconds=settings.TASKS_LEASE_SECONDS),
+        )
+    return list(Task.objects.filter(id__in=ids).order_by("run_after", "id"))
+
+
+def execute(task_row):
+    # 1件実行して、結果を行に書く。タスクの中の書き込みは、失敗したらまとめてロールバックする
+    try:
+        task_function = REGISTRY.get(task_row.name)
+        if task_function is None:
+            raise UnknownTask(task_row.name)
+        with transaction.atomic():
+            task_function.func(*task_row.args, **task_row.kwargs)
+    except Exception:
+        logger.exception("タスク %s (%s) が失敗しました。", task_row.id, task_row.name)
+        now = timezone.now()
+        if task_row.attempts >= task_row.max_attempts:
+            status, run_after, finished_at = Task.FAILED, task_row.run_after, now
+        else:
+            status, run_after, finished_at = (
+                Task.PENDING,
+                now + backoff(task_row.attempts),
+                None,
+            )
+        Task.objects.filter(id=task_row.id).update(
+            status=status,
+            run_after=run_after,
+            finished_at=finished_at,
+            locked_until=None,
+            last_error=traceback.format_exc(),
+        )
+        return status
+    Task.objects.filter(id=task_row.id).update(
+        status=Task.DONE, finished_at=timezone.now(), locked_until=None
+    )
+    return Task.DONE
+
+
+def run_pending(batch_size=None, limit=None):
+    # 今実行できるタスクが無くなるまで (または limit 件まで) 実行し、状態ごとの件数を返す
+    batch_size = batch_size or settings.TASKS_BATCH_SIZE
+    results = {Task.DONE: 0, Task.PENDING: 0, Task.FAILED: 0}
+    done = 0
+    while limit is None or done < limit:
+        size = batch_size if limit is None else min(batch_size, limit - done)
+        batch = claim(size)
+        if not batch:
+            break
+        for task_row in batch:
+            results[execute(task_row)] += 1
+        done += len(batch)
+    return results
+
+
+def prune(now=None):
+    # 保存期間 (TASKS_RETENTION_SECONDS) を過ぎた完了済み・失敗済みのタスクを消す
+    now = now or timezone.now()
+    deleted, _ = Task.objects.filter(
+        status__in=[Task.DONE, Task.FAILED],
+        finished_at__lt=now - timedelta(seconds=settings.TASKS_RETENTION_SECONDS),
+    ).delete()
+    return deleted
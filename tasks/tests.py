@@ -0,0 +1,228 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import transaction
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts import follows
+from accounts.models import User
+from mysite.testcases import TestCase
+from tweets import tasks as tweet_tasks
+from tweets.models import Like, TimelineEntry, Tweet
+
+from . import queue
+from .models import Task
+
+calls = []
+
+
+@queue.task(max_attempts=3)
+def record(value):
+    calls.append(value)
+
+
+@queue.task(max_attempts=2)
+def fail(value):
+    calls.append(value)
+    raise ValueError(value)
+
+
+@override_settings(TASKS_EAGER=False, TASKS_BACKOFF_SECONDS=10)
+class TestQueue(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_defer_and_run(self):
+        task = record.defer("a")
+        self.assertEqual(task.name, "tasks.tests.record")
+        self.assertEqual(task.status, Task.PENDING)
+        self.assertEqual(calls, [])
+
+        results = queue.run_pending()
+        self.assertEqual(results, {"done": 1, "pending": 0, "failed": 0})
+        self.assertEqual(calls, ["a"])
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.DONE)
+        self.assertEqual(task.attempts, 1)
+        self.assertIsNotNone(task.finished_at)
+
+    def test_idempotency_key(self):
+        self.assertIsNotNone(record.defer("a", key="same"))
+        self.assertIsNone(record.defer("b", key="same"))
+        queue.run_pending()
+        self.assertEqual(calls, ["a"])
+        self.assertIsNone(record.defer("c", key="same"))
+        self.assertEqual(Task.objects.count(), 1)
+
+    @override_settings(TASKS_EAGER=True)
+    def test_eager(self):
+        task = record.defer("a", key="same")
+        self.assertEqual(calls, ["a"])
+        self.assertEqual(Task.objects.get().status, Task.DONE)
+        self.assertEqual(task.status, Task.DONE)
+        self.assertIsNone(record.defer("b", key="same"))
+        self.assertEqual(calls, ["a"])
+        # 失敗はその場で例外になる
+        with self.assertRaises(ValueError):
+            fail.defer("x")
+
+    def test_delay(self):
+        record.defer("a", delay=60)
+        self.assertEqual(queue.run_pending()["done"], 0)
+        self.assertEqual(
+            queue.claim(10, now=timezone.now() + timedelta(seconds=61))[0].args, ["a"]
+        )
+
+    def test_order_and_limit(self):
+        for value in "abc":
+            record.defer(value)
+        queue.run_pending(batch_size=1, limit=2)
+        self.assertEqual(calls, ["a", "b"])
+
+    def test_retry_with_backoff(self):
+        task = fail.defer("x")
+        start = timezone.now()
+        with self.assertLogs("tasks.queue", "ERROR"):
+            results = queue.run_pending()
+        self.assertEqual(results, {"done": 0, "pending": 1, "failed": 0})
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.PENDING)
+        self.assertIn("ValueError: x", task.last_error)
+        self.assertGreaterEqual(task.run_after, start + timedelta(seconds=10))
+        # 待ち時間が過ぎるまでは実行しない
+        self.assertEqual(queue.run_pending()["pending"], 0)
+
+        [claimed] = queue.claim(10, now=task.run_after)
+        with self.assertLogs("tasks.queue", "ERROR"):
+            self.assertEqual(queue.execute(claimed), Task.FAILED)
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.FAILED)
+        self.assertEqual(task.attempts, 2)
+        self.assertEqual(calls, ["x", "x"])
+
+    def test_backoff(self):
+        with override_settings(TASKS_BACKOFF_MAX_SECONDS=50):
+            self.assertEqual(
+                [queue.backoff(n).total_seconds() for n in range(1, 5)],
+                [10, 20, 40, 50],
+            )
+
+    def test_unknown_task(self):
+        Task.objects.create(name="tasks.tests.missing", max_attempts=1)
+        with self.assertLogs("tasks.queue", "ERROR"):
+            self.assertEqual(queue.run_pending()["failed"], 1)
+        self.assertIn("UnknownTask", Task.objects.get().last_error)
+
+    def test_expired_lease(self):
+        # 実行中のまま止まったワーカーのタスクは、期限が過ぎたら拾い直す
+        task = record.defer("a")
+        now = timezone.now()
+        self.assertEqual(len(queue.claim(10, now=now)), 1)
+        self.assertEqual(queue.claim(10, now=now), [])
+        task.refresh_from_db()
+        [claimed] = queue.claim(10, now=task.locked_until + timedelta(seconds=1))
+        self.assertEqual(claimed.attempts, 2)
+
+    def test_rollback(self):
+        # defer は呼び出し側のトランザクションの中で行を入れるので、一緒にロールバックされる
+        try:
+            with transaction.atomic():
+                record.defer("a")
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertFalse(Task.objects.exists())
+
+    def test_prune(self):
+        record.defer("a")
+        fail.defer("b")
+        record.defer("c")
+        with self.assertLogs("tasks.queue", "ERROR"):
+            queue.run_pending()
+        later = timezone.now() + timedelta(days=8)
+        self.assertEqual(queue.prune(now=later), 2)
+        self.assertEqual(Task.objects.get().args, ["b"])
+
+    def test_command(self):
+        record.defer("a")
+        fail.defer("b")
+        out = StringIO()
+        with self.assertLogs("tasks.queue", "ERROR"):
+            call_command("run_tasks", once=True, stdout=out)
+        self.assertIn("完了 1 件、再試行待ち 1 件、失敗 0 件", out.getvalue())
+
+        out = StringIO()
+        call_command("prune_tasks", stdout=out)
+        self.assertIn("0 件のタスクを削除しました。", out.getvalue())
+
+
+@override_settings(TASKS_EAGER=False)
+class TestDeferredWork(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(
+            username="testuser1", password="testpassword"
+        )
+        self.user2 = User.objects.create_user(
+            username="testuser2", password="testpassword"
+        )
+        self.client.login(username="testuser1", password="testpassword")
+
+    def test_fan_out(self):
+        follows.follow(self.user2, self.user1)
+        self.client.post(reverse("tweets:create"), {"content": "あとで配信"})
+        tweet = Tweet.objects.get()
+        self.assertFalse(TimelineEntry.objects.filter(owner=self.user2).exists())
+        self.assertTrue(Task.objects.filter(key=f"fan_out:{tweet.id}").exists())
+
+        queue.run_pending()
+        self.assertEqual(
+            list(
+                TimelineEntry.objects.filter(owner=self.user2).values_list(
+                    "tweet_id", flat=True
+                )
+            ),
+            [tweet.id],
+        )
+
+    def test_fan_out_of_deleted_tweet(self):
+        tweet = Tweet.objects.create(user=self.user2, content="すぐ消す")
+        tweet_tasks.fan_out_tweet.defer(tweet.id)
+        tweet.delete()
+        self.assertEqual(queue.run_pending()["done"], 1)
+
+    def test_follow_then_unfollow(self):
+        # ワーカーが遅れても、実行する時点のフォロー関係に合わせる
+        Tweet.objects.create(user=self.user2, content="testpost")
+        url = {"username": self.user2.username}
+        self.client.post(reverse("accounts:follow", kwargs=url))
+        self.client.post(reverse("accounts:unfollow", kwargs=url))
+        # バックフィル・フォロー通知・タイムラインからの削除
+        self.assertEqual(Task.objects.count(), 3)
+        queue.run_pending()
+        self.assertFalse(TimelineEntry.objects.filter(owner=self.user1).exists())
+
+        self.client.post(reverse("accounts:follow", kwargs=url))
+        queue.run_pending()
+        self.assertTrue(TimelineEntry.objects.filter(owner=self.user1).exists())
+
+    def test_counters_after_user_delete(self):
+        user3 = User.objects.create_user(username="testuser3", password="testpassword")
+        follows.follow(user3, self.user1)
+        follows.follow(self.user2, user3)
+        tweet = Tweet.objects.create(user=self.user1, content="testpost")
+        Like.objects.create(user=user3, tweet=tweet)
+        Tweet.objects.filter(id=tweet.id).update(like_count=1)
+
+        user3.delete()
+        self.user1.refresh_from_db()
+        self.assertEqual(self.user1.followers_count, 1)
+        queue.run_pending()
+        self.user1.refresh_from_db()
+        self.user2.refresh_from_db()
+        tweet.refresh_from_db()
+        self.assertEqual(self.user1.followers_count, 0)
+        self.assertEqual(self.user2.following_count, 0)
+        self.assertEqual(tweet.like_count, 0)
@@ -0,0 +1,113 @@
+import heapq
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Sum
+from django.urls import reverse
+from django.utils import timezone
+
+from tweets.models import Tweet
+
+from .models import TrendCounter
+
+# トレンドの集計。イベントのたびに今の区間のカウンタを1回の UPSERT で増やし、
+# ランキングは直近 TRENDS_WINDOW_SECONDS の区間を合計して heapq で上位 K 件だけ取り出す
+# 結果は区間が変わるか TRENDS_CACHE_TIMEOUT が過ぎるまでキャッシュする
+
+
+def current_bucket(now=None):
+    now = now or timezone.now()
+    return int(now.timestamp()) // settings.TRENDS_BUCKET_SECONDS
+
+
+def window_buckets():
+    return max(settings.TRENDS_WINDOW_SECONDS // settings.TRENDS_BUCKET_SECONDS, 1)
+
+
+def record(kind, deltas, now=None):
+    # deltas: {key: 増減}。何件あっても INSERT ... ON CONFLICT DO UPDATE の1回で足し込む
+    rows = [(kind, str(key), delta) for key, delta in deltas.items() if delta]
+    if not rows:
+        return
+    bucket = current_bucket(now)
+    table = connection.ops.quote_name(TrendCounter._meta.db_table)
+    key = connection.ops.quote_name("key")
+    count = connection.ops.quote_name("count")
+    values = ", ".join(["(%s, %s, %s, %s)"] * len(rows))
+    sql = (
+        f"INSERT INTO {table} (kind, {key}, bucket, {count}) VALUES {values} "
+        f"ON CONFLICT (kind, bucket, {key}) "
+        f"DO UPDATE SET {count} = {table}.{count} + excluded.{count}"
+    )
+    params = [value for k, name, delta in rows for value in (k, name, bucket, delta)]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def record_likes(deltas, now=None):
+    record(TrendCounter.LIKE, deltas, now)
+
+
+def record_hashtags(names, now=None):
+    record(TrendCounter.HASHTAG, {name: 1 for name in names}, now)
+
+
+def top(kind, k=None, now=None):
+    # [(key, 合計), ...] を合計の多い順に。合計が 0 以下のものは入れない
+    end = current_bucket(now)
+    totals = (
+        TrendCounter.objects.filter(
+            kind=kind, bucket__gt=end - window_buckets(), bucket__lte=end
+        )
+        .values_list("key")
+        .annotate(total=Sum("count"))
+        .order_by("key")
+    )
+    return heapq.nlargest(
+        k or settings.TRENDS_TOP_K,
+        ((key, total) for key, total in totals if total > 0),
+        key=lambda item: item[1],
+    )
+
+
+def trending(k=None, now=None):
+    # JSON にそのまま出せる形にしてキャッシュする。キーに区間を含めるので、区間が変われば作り直す
+    k = k or settings.TRENDS_TOP_K
+    cache_key = f"trends:{k}:{current_bucket(now)}"
+    if (cached := cache.get(cache_key)) is not None:
+        return cached
+
+    hashtags = [
+        {
+            "name": name,
+            "count": total,
+            "url": reverse("tweets:hashtag", kwargs={"name": name}),
+        }
+        for name, total in top(TrendCounter.HASHTAG, k, now)
+    ]
+    liked = top(TrendCounter.LIKE, k, now)
+    found = Tweet.objects.select_related("user").in_bulk([int(key) for key, _ in liked])
+    tweets = [
+        {
+            "id": tweet.id,
+            "username": tweet.user.username,
+            "content": tweet.content,
+            "like_count": tweet.like_count,
+            "count": total,
+            "url": tweet.get_absolute_url(),
+        }
+        for key, total in liked
+        if (tweet := found.get(int(key)))
+        # 削除済みのツイートは飛ばす
+    ]
+    result = {"hashtags": hashtags, "tweets": tweets}
+    cache.set(cache_key, result, settings.TRENDS_CACHE_TIMEOUT)
+    return result
+
+
+def prune(now=None):
+    # 集計の範囲から外れた区間を消す。戻り値は消した行数
+    start = current_bucket(now) - window_buckets()
+    deleted, _ = TrendCounter.objects.filter(bucket__lte=start).delete()
+    return deleted
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from trends import counters
+
+
+class Command(BaseCommand):
+    help = "集計の範囲 (TRENDS_WINDOW_SECONDS) から外れたトレンドのカウンタを削除します。"
+
+    def handle(self, *args, **options):
+        deleted = counters.prune()
+        self.stdout.write(f"{deleted} 件のカウンタを削除しました。")
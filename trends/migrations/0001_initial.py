@@ -0,0 +1,45 @@
+# Generated by Django 4.1.13 on 2026-10-18 08:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name="TrendCounter",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[("like", "いいね"), ("hashtag", "ハッシュタグ")], max_length=16
+                    ),
+                ),
+                ("key", models.CharField(max_length=100)),
+                ("bucket", models.IntegerField()),
+                ("count", models.IntegerField(default=0)),
+            ],
+            options={
+                "verbose_name_plural": "トレンドのカウンタ",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="trendcounter",
+            constraint=models.UniqueConstraint(
+                fields=("kind", "bucket", "key"), name="trend_counter_unique"
+            ),
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import models
+
+
+class TrendCounter(models.Model):
+    # 「いいね数 (ツイートごと)」「投稿数 (ハッシュタグごと)」を TRENDS_BUCKET_SECONDS ごとの区間に分けて数える
+    # Like や Tweet を GROUP BY せず、この小さな表の直近の区間だけを足し合わせてランキングを作る (trends.counters)
+    LIKE = "like"
+    HASHTAG = "hashtag"
+    KIND_CHOICES = [(LIKE, "いいね"), (HASHTAG, "ハッシュタグ")]
+
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    key = models.CharField(max_length=100)
+    # いいねはツイートの id、ハッシュタグは正規化した名前
+    bucket = models.IntegerField()
+    # UNIX 時刻 // TRENDS_BUCKET_SECONDS
+    count = models.IntegerField(default=0)
+    # いいねの取り消しで負になる区間もある (合計で見る)
+
+    class Meta:
+        verbose_name_plural = "トレンドのカウンタ"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["kind", "bucket", "key"], name="trend_counter_unique"
+            ),
+        ]
+        # (kind, bucket) の範囲で直近の区間だけを読むのにも使う
+
+    def __str__(self):
+        return f"{self.kind}:{self.key}@{self.bucket} = {self.count}"
@@ -0,0 +1,155 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import User
+from mysite.testcases import TestCase
+from tweets import likes
+from tweets.models import Tweet
+
+from . import counters
+from .models import TrendCounter
+
+
+class TestCounters(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="tester", password="testpassword")
+        self.now = timezone.now()
+
+    def test_record_upserts_into_bucket(self):
+        with self.assertNumQueries(1):
+            counters.record_hashtags(["django", "東京"], self.now)
+        counters.record_hashtags(["django"], self.now)
+        self.assertEqual(
+            dict(
+                TrendCounter.objects.filter(kind=TrendCounter.HASHTAG).values_list(
+                    "key", "count"
+                )
+            ),
+            {"django": 2, "東京": 1},
+        )
+        self.assertEqual(TrendCounter.objects.count(), 2)
+
+    def test_record_nothing(self):
+        with self.assertNumQueries(0):
+            counters.record_hashtags([], self.now)
+            counters.record_likes({1: 0}, self.now)
+
+    def test_top_sums_window(self):
+        old = self.now - timedelta(days=2)
+        earlier = self.now - timedelta(hours=3)
+        counters.record(TrendCounter.HASHTAG, {"old": 50}, old)
+        counters.record(TrendCounter.HASHTAG, {"a": 3, "b": 2}, earlier)
+        counters.record(TrendCounter.HASHTAG, {"b": 2, "c": 1}, self.now)
+        self.assertEqual(
+            counters.top(TrendCounter.HASHTAG, 2, self.now), [("b", 4), ("a", 3)]
+        )
+        self.assertEqual(
+            counters.top(TrendCounter.HASHTAG, 10, self.now),
+            [("b", 4), ("a", 3), ("c", 1)],
+        )
+
+    def test_like_and_unlike(self):
+        tweet = Tweet.objects.create(user=self.user, content="test")
+        likes.set_like(self.user, tweet.id, True)
+        # いいね済みなら数えない
+        likes.set_like(self.user, tweet.id, True)
+        self.assertEqual(counters.top(TrendCounter.LIKE), [(str(tweet.id), 1)])
+        likes.set_like(self.user, tweet.id, False)
+        self.assertEqual(counters.top(TrendCounter.LIKE), [])
+
+    def test_like_batch(self):
+        tweets = [
+            Tweet.objects.create(user=self.user, content=f"{i}") for i in range(3)
+        ]
+        likes.apply_batch(self.user, {tweet.id: True for tweet in tweets})
+        likes.apply_batch(self.user, {tweets[0].id: False})
+        self.assertEqual(
+            sorted(counters.top(TrendCounter.LIKE)),
+            sorted([(str(tweets[1].id), 1), (str(tweets[2].id), 1)]),
+        )
+
+    def test_trending(self):
+        other = User.objects.create_user(username="other", password="testpassword")
+        tweet1 = Tweet.objects.create(user=self.user, content="一番人気")
+        tweet2 = Tweet.objects.create(user=self.user, content="二番目")
+        deleted = Tweet.objects.create(user=self.user, content="削除")
+        for user in (self.user, other):
+            likes.set_like(user, tweet1.id, True)
+        likes.set_like(self.user, tweet2.id, True)
+        likes.set_like(self.user, deleted.id, True)
+        deleted.delete()
+        counters.record_hashtags(["django"])
+
+        result = counters.trending()
+        self.assertEqual(
+            result["hashtags"],
+            [
+                {
+                    "name": "django",
+                    "count": 1,
+                    "url": reverse("tweets:hashtag", kwargs={"name": "django"}),
+                }
+            ],
+        )
+        self.assertEqual(
+            [(tweet["id"], tweet["count"]) for tweet in result["tweets"]],
+            [(tweet1.id, 2), (tweet2.id, 1)],
+        )
+        self.assertEqual(result["tweets"][0]["username"], "tester")
+
+    def test_trending_is_cached(self):
+        counters.trending()
+        with self.assertNumQueries(0):
+            counters.trending()
+
+    def test_prune(self):
+        counters.record_hashtags(["old"], self.now - timedelta(days=2))
+        counters.record_hashtags(["new"], self.now)
+        out = StringIO()
+        call_command("prune_trend_counters", stdout=out)
+        self.assertIn("1 件", out.getvalue())
+        self.assertEqual(
+            list(TrendCounter.objects.values_list("key", flat=True)), ["new"]
+        )
+
+
+class TestTrendsViews(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="tester", password="testpassword")
+        self.client.login(username="tester", password="testpassword")
+
+    def test_create_tweet_counts_hashtags(self):
+        self.client.post(reverse("tweets:create"), {"content": "#Django と #django"})
+        self.client.post(reverse("tweets:create"), {"content": "#python"})
+        self.assertEqual(
+            counters.top(TrendCounter.HASHTAG), [("django", 1), ("python", 1)]
+        )
+
+    def test_index(self):
+        tweet = Tweet.objects.create(user=self.user, content="人気のツイート")
+        self.client.post(reverse("tweets:like", kwargs={"pk": tweet.pk}))
+        counters.record_hashtags(["django"])
+        # session, user, ハッシュタグの集計, いいねの集計, ツイート
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse("trends:index"))
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, "trends/trends.html")
+        self.assertContains(response, "#django")
+        self.assertContains(response, "人気のツイート")
+
+    def test_json(self):
+        counters.record_hashtags(["django"])
+        response = self.client.get(reverse("trends:json"))
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["hashtags"][0]["name"], "django")
+        self.assertEqual(data["tweets"], [])
+
+    def test_login_required(self):
+        self.client.logout()
+        response = self.client.get(reverse("trends:json"))
+        self.assertEqual(response.status_code, 302)
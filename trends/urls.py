@@ -0,0 +1,9 @@
+from django.urls import path
+
+from . import views
+
+app_name = "trends"
+urlpatterns = [
+    path("", views.TrendsView.as_view(), name="index"),
+    path("json/", views.TrendsJsonView.as_view(), name="json"),
+]
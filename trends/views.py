@@ -0,0 +1,20 @@
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.http import JsonResponse
+from django.views import View
+from django.views.generic import TemplateView
+
+from . import counters
+
+
+class TrendsView(LoginRequiredMixin, TemplateView):
+    template_name = "trends/trends.html"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["trends"] = counters.trending()
+        return context
+
+
+class TrendsJsonView(LoginRequiredMixin, View):
+    def get(self, request, **kwargs):
+        return JsonResponse(counters.trending())
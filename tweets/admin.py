@@ -1,7 +1,11 @@
 from django.contrib import admin
 
-from .models import Like, Tweet
+from .models import Hashtag, Like, TimelineEntry, Tweet
 
 admin.site.register(Tweet)
 
 admin.site.register(Like)
+
+admin.site.register(TimelineEntry)
+
+admin.site.register(Hashtag)
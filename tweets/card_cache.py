@@ -0,0 +1,83 @@
+from django.conf import settings
+from django.template.loader import get_template, render_to_string
+from django.utils.safestring import mark_safe
+
+from . import timeline_cache
+from .models import Tweet
+
+# ツイートのカードの HTML のうち、見ている人によらない部分 (ユーザー名・本文のリンク・URL・日時) をキャッシュする
+# - キーは (ツイートの id, updated_at, 作者のバージョン)。本文が変われば updated_at が変わり、
+#   ユーザー名が変われば作者のバージョンが変わる (author_changed) ので、古いカードは参照されなくなる
+# - いいねボタンといいね数 (tweets/like.html) は見ている人やいいねで変わるので、毎回描画して間に差し込む
+# - バックエンドはタイムラインと同じ (settings.TIMELINE_CACHE_ALIAS)
+
+CARD_TEMPLATE = "tweets/tweet_card.html"
+LIKE_TEMPLATE = "tweets/like.html"
+# カードのテンプレートで、いいねボタンを差し込む位置の目印
+# 本文やユーザー名はエスケープされるので、この文字列がカードの中に現れることはない
+LIKE_SLOT = "<!-- like -->"
+
+
+def enabled():
+    return settings.TWEET_CARD_CACHE_ENABLED
+
+
+def _key(tweet, author_version):
+    return f"card:{tweet.id}:{tweet.updated_at.timestamp()}:{author_version}"
+
+
+def _author_versions(tweets):
+    author_ids = sorted({tweet.user_id for tweet in tweets})
+    versions = timeline_cache.versions(
+        [("user", author_id) for author_id in author_ids]
+    )
+    return dict(zip(author_ids, versions))
+
+
+def author_changed(user):
+    # ユーザー名 (とプロフィールへのリンク) はカードの中にあるので、その人のカードを描き直させる
+    # キャッシュしたツイート本体の user も古いので捨て、ページの ETag も変える ("user" の stamp)
+    timeline_cache.touch([("user", user.id)])
+    timeline_cache.forget_versions("user", [user.id])
+    timeline_cache.forget_tweets(
+        list(Tweet.objects.filter(user=user).values_list("id", flat=True))
+    )
+
+
+def render_fragment(tweet):
+    # いいねボタンの前と後ろの HTML を返す
+    html = render_to_string(CARD_TEMPLATE, {"tweet": tweet, "like_slot": LIKE_SLOT})
+    before, after = html.split(LIKE_SLOT)
+    return before, after
+
+
+def get_fragments(tweets):
+    if not enabled():
+        return {tweet.id: render_fragment(tweet) for tweet in tweets}
+    cache = timeline_cache.get_cache()
+    author_versions = _author_versions(tweets)
+    keys = {tweet.id: _key(tweet, author_versions[tweet.user_id]) for tweet in tweets}
+    found = cache.get_many(keys.values())
+    fragments = {}
+    missing = {}
+    for tweet in tweets:
+        key = keys[tweet.id]
+        if key in found:
+            fragments[tweet.id] = found[key]
+        else:
+            fragments[tweet.id] = missing[key] = render_fragment(tweet)
+    if missing:
+        cache.set_many(missing, settings.TWEET_CARD_CACHE_TIMEOUT)
+    return fragments
+
+
+def render_cards(tweets):
+    # tweet.is_liked は描画の前に付けておく (timeline_cache.annotate_viewer_state)
+    tweets = list(tweets)
+    fragments = get_fragments(tweets)
+    like_template = get_template(LIKE_TEMPLATE)
+    parts = []
+    for tweet in tweets:
+        before, after = fragments[tweet.id]
+        parts += [before, like_template.render({"tweet": tweet}), after]
+    return mark_safe("".join(parts))
@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Tags, Warning, register
+
+
+@register(Tags.caches, deploy=True)
+def check_timeline_cache(app_configs, **kwargs):
+    # stamp とバージョンはワーカー (tasks) や他の Web プロセスも更新するので、プロセスごとのキャッシュでは
+    # 更新が届かず、古いページや 304 を返し続ける。開発 (DEBUG) は 1 プロセスなので LocMemCache でよい
+    if settings.DEBUG:
+        return []
+    if isinstance(caches[settings.TIMELINE_CACHE_ALIAS], LocMemCache):
+        return [
+            Warning(
+                f"TIMELINE_CACHE_ALIAS ({settings.TIMELINE_CACHE_ALIAS!r}) が LocMemCache になっています。",
+                hint="Redis・Memcached など、すべてのプロセスから見えるキャッシュにしてください"
+                " (mysite.settings_production)。",
+                id="tweets.W001",
+            )
+        ]
+    return []
@@ -0,0 +1,50 @@
+import hashlib
+import time
+
+from django.contrib.messages import get_messages
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from . import timeline_cache
+
+# タイムラインやプロフィールの条件付き GET (If-None-Match / If-Modified-Since)
+# ETag と Last-Modified は timeline_cache の stamp (最後に変わった時刻) だけから作るので、
+# 変わっていなければ一覧を読み込まずに 304 を返せる
+
+
+class ConditionalGetMixin:
+    # LoginRequiredMixin の後に置く (ログインしていなければここまで来ない)
+
+    def get_stamp_pairs(self):
+        # このページの内容が変わったら必ず更新される stamp の (kind, key) の一覧
+        raise NotImplementedError
+
+    def dispatch(self, request, *args, **kwargs):
+        # メッセージ (messages) はページに一度だけ出すものなので、あるときは 304 にしない
+        if request.method not in ("GET", "HEAD") or len(get_messages(request)):
+            return super().dispatch(request, *args, **kwargs)
+        pairs = self.get_stamp_pairs()
+        if pairs is None:
+            return super().dispatch(request, *args, **kwargs)
+
+        values = timeline_cache.stamps(pairs)
+        raw = repr((request.user.id, pairs, values)).encode()
+        etag = quote_etag(hashlib.md5(raw).hexdigest())
+        # 最後の変更と同じ秒のうちは Last-Modified を出さない
+        # (秒単位なので、同じ秒にもう一度変わると If-Modified-Since では見分けられない)
+        latest = int(max(values))
+        last_modified = latest if int(time.time()) > latest else None
+
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = super().dispatch(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        response.headers["ETag"] = etag
+        if last_modified is not None:
+            response.headers["Last-Modified"] = http_date(last_modified)
+        # ログインユーザーごとのページなので共有キャッシュには置かせず、毎回問い合わせさせる
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
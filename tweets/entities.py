@@ -0,0 +1,85 @@
+import re
+import unicodedata
+
+from accounts.models import User
+
+from .models import Hashtag, Mention, TweetHashtag
+
+# ツイート本文からハッシュタグ (#東京) とメンション (@username) を取り出して、検索用のテーブルに入れる
+# 投稿時 (TweetCreateView) と backfill_tweet_entities コマンドから呼ぶ
+
+# 直前が英数字や & のときはタグにしない (URL の #fragment や &#123; を拾わないため)
+HASHTAG_RE = re.compile(r"(?<![\w&])[#＃](\w+)")
+# ユーザー名に使える文字は UnicodeUsernameValidator と同じ。末尾の . は文の終わりとみなす
+MENTION_RE = re.compile(r"(?<![\w@.])[@＠]([\w.@+-]+)")
+HASHTAG_MAX_LENGTH = Hashtag._meta.get_field("name").max_length
+
+
+def normalize_hashtag(name):
+    return unicodedata.normalize("NFKC", name).lower()
+
+
+def _unique(values):
+    return list(dict.fromkeys(values))
+
+
+def extract_hashtags(content):
+    names = (normalize_hashtag(name) for name in HASHTAG_RE.findall(content))
+    return _unique(name for name in names if len(name) <= HASHTAG_MAX_LENGTH)
+
+
+def extract_mentions(content):
+    return _unique(username.rstrip(".") for username in MENTION_RE.findall(content))
+
+
+def save_entities(tweets):
+    # 複数のツイートをまとめて処理する。タグもメンションもなければクエリは打たない
+    # 何度呼んでも同じ結果になる (すでにある行は ignore_conflicts で飛ばす)
+    # 戻り値は見つかったタグ・メンションの数 (すでに保存済みのものも数える)
+    hashtags = {tweet.id: extract_hashtags(tweet.content) for tweet in tweets}
+    mentions = {tweet.id: extract_mentions(tweet.content) for tweet in tweets}
+    found = 0
+
+    names = _unique(name for names in hashtags.values() for name in names)
+    if names:
+        Hashtag.objects.bulk_create(
+            [Hashtag(name=name) for name in names], ignore_conflicts=True
+        )
+        hashtag_ids = dict(
+            Hashtag.objects.filter(name__in=names).values_list("name", "id")
+        )
+        rows = TweetHashtag.objects.bulk_create(
+            [
+                TweetHashtag(
+                    tweet=tweet,
+                    hashtag_id=hashtag_ids[name],
+                    tweet_created_at=tweet.created_at,
+                )
+                for tweet in tweets
+                for name in hashtags[tweet.id]
+            ],
+            ignore_conflicts=True,
+        )
+        found += len(rows)
+
+    usernames = _unique(name for names in mentions.values() for name in names)
+    if usernames:
+        # いないユーザーへのメンションは無視する
+        user_ids = dict(
+            User.objects.filter(username__in=usernames).values_list("username", "id")
+        )
+        rows = Mention.objects.bulk_create(
+            [
+                Mention(
+                    tweet=tweet,
+                    user_id=user_ids[username],
+                    tweet_created_at=tweet.created_at,
+                )
+                for tweet in tweets
+                for username in mentions[tweet.id]
+                if username in user_ids
+            ],
+            ignore_conflicts=True,
+        )
+        found += len(rows)
+    return found
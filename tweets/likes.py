@@ -0,0 +1,170 @@
+import time
+
+from asgiref.sync import sync_to_async
+from django.db import connection, transaction
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Subquery, When
+from django.db.models.constants import OnConflict
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from live import events as live
+from notifications import tasks as notification_tasks
+from trends import counters as trends
+
+from . import timeline_cache
+from .models import Like, Tweet
+
+# いいねの追加・取り消しと Tweet.like_count の増減は必ず同じトランザクションで行う
+
+BATCH_MAX_OPERATIONS = 100
+
+
+def actual_like_count():
+    # Like を数え直す式 (Tweet の UPDATE や annotate に使う)
+    return Coalesce(
+        Subquery(
+            Like.objects.filter(tweet=OuterRef("pk"))
+            .order_by()
+            .values("tweet")
+            .annotate(n=Count("id"))
+            .values("n")
+        ),
+        0,
+    )
+
+
+def _insert_likes(user_id, tweet_ids):
+    # INSERT ... SELECT ... ON CONFLICT DO NOTHING RETURNING (SQLite では INSERT OR IGNORE)
+    # - すでにいいね済みなら like_unique に当たって何もしない
+    # - 無いツイートは SELECT に出てこないので何も入らない (存在確認のための SELECT を別に打たない)
+    # 戻り値は実際に行が入ったツイートの id。同時に同じいいねを入れた別のリクエストと二重には数えない
+    # (RETURNING は PostgreSQL と SQLite 3.35 以降)
+    if not tweet_ids:
+        return []
+    like_table = connection.ops.quote_name(Like._meta.db_table)
+    tweet_table = connection.ops.quote_name(Tweet._meta.db_table)
+    fields = [Like._meta.get_field(name) for name in ("tweet", "user")]
+    placeholders = ", ".join(["%s"] * len(tweet_ids))
+    sql = " ".join(
+        [
+            connection.ops.insert_statement(on_conflict=OnConflict.IGNORE),
+            f"{like_table} (tweet_id, user_id, created_at)",
+            f"SELECT id, %s, %s FROM {tweet_table} WHERE id IN ({placeholders})",
+            connection.ops.on_conflict_suffix_sql(
+                fields, OnConflict.IGNORE, None, None
+            ),
+            "RETURNING tweet_id",
+        ]
+    )
+    created_at = connection.ops.adapt_datetimefield_value(timezone.now())
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [user_id, created_at, *tweet_ids])
+        return [tweet_id for tweet_id, in cursor.fetchall()]
+
+
+def _delete_likes(user_id, tweet_ids):
+    # DELETE ... RETURNING。実際に消えた行のツイートの id を返す (_insert_likes と同じく二重に数えない)
+    if not tweet_ids:
+        return []
+    like_table = connection.ops.quote_name(Like._meta.db_table)
+    placeholders = ", ".join(["%s"] * len(tweet_ids))
+    sql = (
+        f"DELETE FROM {like_table} WHERE user_id = %s AND tweet_id IN ({placeholders})"
+        " RETURNING tweet_id"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [user_id, *tweet_ids])
+        return [tweet_id for tweet_id, in cursor.fetchall()]
+
+
+def set_like(user, tweet_id, is_liked):
+    # いいね・取り消しの共通処理。何度呼んでも結果が同じ(冪等)になる
+    # ツイートが無ければ None、あれば更新後のいいね数を返す
+    with transaction.atomic():
+        if is_liked:
+            changed = len(_insert_likes(user.id, [tweet_id]))
+            delta = 1
+        else:
+            changed, _ = Like.objects.filter(user=user, tweet_id=tweet_id).delete()
+            delta = -1
+        if changed:
+            # カウンタがずれていても負にはしない (ずれは reconcile_like_counts で直す)
+            Tweet.objects.filter(id=tweet_id).update(
+                like_count=Greatest(F("like_count") + delta, 0)
+            )
+            trends.record_likes({tweet_id: delta})
+        row = (
+            Tweet.objects.filter(id=tweet_id)
+            .values_list("like_count", "user_id")
+            .first()
+        )
+        if changed and is_liked:
+            # ツイートした人への通知はワーカーで書く (同じトランザクションで defer する)
+            notification_tasks.notify_likes.defer(
+                user.id, [[tweet_id, row[1]]], int(time.time())
+            )
+    if row is None:
+        return None
+    like_count, author_id = row
+    timeline_cache.like_changed(user, tweet_id, is_liked, author_id)
+    if changed:
+        live.likes_changed(user, {tweet_id: delta})
+    return like_count
+
+
+async def aset_like(user, tweet_id, is_liked):
+    # async ビュー用。transaction.atomic は await をまたげないので、トランザクションごと1回でスレッドへ渡す
+    return await sync_to_async(set_like)(user, tweet_id, is_liked)
+
+
+def apply_batch(user, operations):
+    # operations: {tweet_id: True(いいね) / False(取り消し)}。同じツイートへの連打は呼び出し側で最後の1件にまとめておく
+    # ツイートの件数によらず、クエリ数は一定 (INSERT・DELETE・UPDATE・結果の読み込み)
+    # 増減・トレンド・通知は、INSERT / DELETE が実際に変えた行だけから作る
+    # (前もって読んだ状態から作ると、同時に届いた別のバッチと二重に数えてしまう)
+    with transaction.atomic():
+        liked = _insert_likes(
+            user.id, [tweet_id for tweet_id, is_liked in operations.items() if is_liked]
+        )
+        unliked = _delete_likes(
+            user.id,
+            [tweet_id for tweet_id, is_liked in operations.items() if not is_liked],
+        )
+        deltas = {tweet_id: 1 for tweet_id in liked}
+        deltas.update((tweet_id, -1) for tweet_id in unliked)
+        if deltas:
+            # ツイートごとの増減を CASE 式にして、1回の UPDATE でまとめて反映する
+            Tweet.objects.filter(id__in=deltas).update(
+                like_count=Case(
+                    *(
+                        When(id=tweet_id, then=Greatest(F("like_count") + delta, 0))
+                        for tweet_id, delta in deltas.items()
+                    ),
+                    default=F("like_count"),
+                    output_field=IntegerField(),
+                )
+            )
+            trends.record_likes(deltas)
+        rows = list(
+            Tweet.objects.filter(id__in=operations).values_list(
+                "id", "like_count", "user_id"
+            )
+        )
+        like_counts = {tweet_id: like_count for tweet_id, like_count, _ in rows}
+        if liked:
+            authors = {tweet_id: author_id for tweet_id, _, author_id in rows}
+            notification_tasks.notify_likes.defer(
+                user.id,
+                [[tweet_id, authors[tweet_id]] for tweet_id in liked],
+                int(time.time()),
+            )
+    timeline_cache.likes_changed(
+        user,
+        {tweet_id: operations[tweet_id] for tweet_id in like_counts},
+        [author_id for _, _, author_id in rows],
+    )
+    live.likes_changed(user, deltas)
+    return {
+        tweet_id: (operations[tweet_id], like_count)
+        for tweet_id, like_count in like_counts.items()
+    }
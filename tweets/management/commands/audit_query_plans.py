@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tweets import query_plans
+
+
+class Command(BaseCommand):
+    help = "よく通るクエリの実行計画 (EXPLAIN QUERY PLAN) を表示し、全件スキャンや ORDER BY のための並べ替えがあれば失敗します。"
+
+    def handle(self, *args, **options):
+        try:
+            results = query_plans.audit()
+        except query_plans.UnsupportedDatabase as e:
+            raise CommandError(str(e))
+
+        failed = 0
+        for query, plan, found, allowed in results:
+            status = "NG" if found else "OK"
+            self.stdout.write(f"[{status}] {query.name}")
+            for detail in plan:
+                self.stdout.write(f"    {detail}")
+            if allowed:
+                self.stdout.write(f"    (許容: {query.reason})")
+            if found:
+                failed += 1
+        if failed:
+            raise CommandError(f"{failed} 件のクエリがインデックスを使えていません。")
+        self.stdout.write(f"{len(results)} 件のクエリを確認しました。")
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from tweets import entities
+from tweets.models import Tweet
+
+
+class Command(BaseCommand):
+    help = "既存のツイートからハッシュタグとメンションを取り出して保存します (何度実行しても同じ結果になります)。"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=500, help="1回に読み込むツイート数")
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        # 全件をメモリに載せないよう、iterator で chunk_size 件ずつ読みながら処理する
+        tweets = (
+            Tweet.objects.only("id", "content", "created_at")
+            .order_by("id")
+            .iterator(chunk_size=chunk_size)
+        )
+        processed = found = 0
+        chunk = []
+        for tweet in tweets:
+            chunk.append(tweet)
+            if len(chunk) >= chunk_size:
+                found += entities.save_entities(chunk)
+                processed += len(chunk)
+                chunk = []
+                self.stdout.write(f"{processed} 件処理しました。")
+        if chunk:
+            found += entities.save_entities(chunk)
+            processed += len(chunk)
+        self.stdout.write(
+            self.style.SUCCESS(f"{processed} 件のツイートを処理しました (タグ・メンション {found} 件)。")
+        )
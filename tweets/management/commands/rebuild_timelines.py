@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.models import User
+from tweets import timeline
+
+
+class Command(BaseCommand):
+    help = "全ユーザー(または指定ユーザー)のホームタイムラインを FriendShip から作り直します。"
+
+    def add_arguments(self, parser):
+        parser.add_argument("usernames", nargs="*", help="対象のユーザー名 (省略時は全員)")
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by("id")
+        if options["usernames"]:
+            users = users.filter(username__in=options["usernames"])
+            missing = set(options["usernames"]) - set(
+                users.values_list("username", flat=True)
+            )
+            if missing:
+                raise CommandError(f"ユーザーが見つかりません: {', '.join(sorted(missing))}")
+
+        total = 0
+        for user in users.iterator(chunk_size=500):
+            total += timeline.rebuild(user)
+        self.stdout.write(self.style.SUCCESS(f"{total} 件のタイムラインを書き込みました。"))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from tweets.likes import actual_like_count
+from tweets.models import Tweet
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = "Tweet.like_count と Like の実件数がずれているツイートを修正します。"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run", action="store_true", help="修正せずに、ずれている件数だけ表示する"
+        )
+
+    def handle(self, *args, **options):
+        actual = actual_like_count()
+        drifted = (
+            Tweet.objects.annotate(actual=actual)
+            .exclude(like_count=F("actual"))
+            .order_by("id")
+        )
+
+        fixed = 0
+        last_id = 0
+        # 読みながら同じテーブルへ書き込むので、iterator ではなく id で区切って少しずつ処理する
+        while ids := list(
+            drifted.filter(id__gt=last_id).values_list("id", flat=True)[:BATCH_SIZE]
+        ):
+            if not options["dry_run"]:
+                # 集計から書き込みまでの間に増減した分も拾えるよう、UPDATE の中で数え直す
+                Tweet.objects.filter(id__in=ids).update(like_count=actual)
+            fixed += len(ids)
+            last_id = ids[-1]
+
+        verb = "見つかりました" if options["dry_run"] else "修正しました"
+        self.stdout.write(self.style.SUCCESS(f"{fixed} 件のいいね数のずれが{verb}。"))
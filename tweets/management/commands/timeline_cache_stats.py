@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from tweets import timeline_cache
+
+
+class Command(BaseCommand):
+    help = "タイムラインキャッシュのヒット・ミス回数を表示します。"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reset", action="store_true", help="表示した後に回数をリセットする")
+
+    def handle(self, *args, **options):
+        for namespace, counts in timeline_cache.stats().items():
+            self.stdout.write(
+                f"{namespace}: hit={counts['hits']} miss={counts['misses']} "
+                f"hit_rate={counts['hit_rate']:.1%}"
+            )
+        if options["reset"]:
+            timeline_cache.reset_stats()
@@ -0,0 +1,19 @@
+# Generated by Django 4.1.13 on 2026-10-18 07:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tweets", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="tweet",
+            index=models.Index(
+                fields=["created_at", "id"], name="tweet_created_at_id_idx"
+            ),
+        ),
+    ]
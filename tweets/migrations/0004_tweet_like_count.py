@@ -0,0 +1,34 @@
+# Generated by Django 4.1.13 on 2026-10-18 07:27
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_like_count(apps, schema_editor):
+    Like = apps.get_model("tweets", "Like")
+    Tweet = apps.get_model("tweets", "Tweet")
+    counts = (
+        Like.objects.filter(tweet=OuterRef("pk"))
+        .order_by()
+        .values("tweet")
+        .annotate(n=Count("id"))
+        .values("n")
+    )
+    Tweet.objects.update(like_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tweets", "0003_timelineentry"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tweet",
+            name="like_count",
+            field=models.PositiveIntegerField(default=0, verbose_name="いいね数"),
+        ),
+        migrations.RunPython(fill_like_count, migrations.RunPython.noop),
+    ]
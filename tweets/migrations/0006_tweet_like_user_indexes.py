@@ -0,0 +1,25 @@
+# Generated by Django 4.1.13 on 2026-10-18 08:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tweets", "0005_hashtag_mention"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="like",
+            index=models.Index(
+                fields=["user", "created_at", "id"], name="like_user_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="tweet",
+            index=models.Index(
+                fields=["user", "created_at", "id"], name="tweet_user_created_idx"
+            ),
+        ),
+    ]
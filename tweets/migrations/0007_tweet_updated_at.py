@@ -0,0 +1,30 @@
+# Generated by Django 4.1.13 on 2026-10-18 08:31
+
+from django.db import migrations, models
+from django.db.models import F
+from django.utils import timezone
+
+
+def copy_created_at(apps, schema_editor):
+    # 既存のツイートは作成後に変わっていないので、作成日時をそのまま使う
+    Tweet = apps.get_model("tweets", "Tweet")
+    Tweet.objects.update(updated_at=F("created_at"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tweets", "0006_tweet_like_user_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tweet",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True, default=timezone.now, verbose_name="更新日"
+            ),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copy_created_at, migrations.RunPython.noop),
+    ]
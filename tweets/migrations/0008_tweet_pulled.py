@@ -0,0 +1,29 @@
+# Generated by Django 4.1.13 on 2026-10-18 12:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_pulled(apps, schema_editor):
+    # これまでは今のフォロワー数で決めていたので、いま pull の作者のツイートは配信されていない
+    Tweet = apps.get_model("tweets", "Tweet")
+    Tweet.objects.filter(
+        user__followers_count__gte=settings.TIMELINE_FANOUT_THRESHOLD
+    ).update(pulled=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0002_follow_counts"),
+        ("tweets", "0007_tweet_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tweet",
+            name="pulled",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(mark_pulled, migrations.RunPython.noop),
+    ]
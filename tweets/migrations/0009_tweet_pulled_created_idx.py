@@ -0,0 +1,21 @@
+# Generated by Django 4.1.13 on 2026-10-18 10:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tweets", "0008_tweet_pulled"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="tweet",
+            index=models.Index(
+                condition=models.Q(("pulled", True)),
+                fields=["created_at", "id"],
+                name="tweet_pulled_created_idx",
+            ),
+        ),
+    ]
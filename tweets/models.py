@@ -9,9 +9,29 @@ class Tweet(models.Model):
     )
     content = models.TextField(verbose_name="内容", max_length=140)
     created_at = models.DateTimeField(verbose_name="作成日", auto_now_add=True)
+    like_count = models.PositiveIntegerField(verbose_name="いいね数", default=0)
+    # Like の件数を毎回 COUNT しないための非正規化カラム (tweets.likes で増減させる)
+    updated_at = models.DateTimeField(verbose_name="更新日", auto_now=True)
+    # カードの HTML のキャッシュのキーに使う (tweets.card_cache)。like_count の増減では変わらない
+    pulled = models.BooleanField(default=False)
+    # 投稿した時点で作者のフォロワーが多く、フォロワーのタイムラインへ配信せずに読み込み時に混ぜるツイート (tweets.timeline)
 
     class Meta:
         verbose_name_plural = "ツイート"
+        indexes = [
+            models.Index(fields=["created_at", "id"], name="tweet_created_at_id_idx"),
+            models.Index(
+                fields=["user", "created_at", "id"], name="tweet_user_created_idx"
+            ),
+            models.Index(
+                fields=["created_at", "id"],
+                condition=models.Q(pulled=True),
+                name="tweet_pulled_created_idx",
+            ),
+        ]
+        # タイムラインのキーセットページング (created_at, id) 用
+        # プロフィールのツイート一覧 (user で絞って created_at, id の降順) 用
+        # ホームに読み込み時に混ぜるツイート (pulled だけを created_at, id の降順) 用 (tweets.timeline.pulled_tweets)
 
     def __str__(self):
         return f"{self.user.username} : {self.content}"
@@ -35,6 +55,113 @@ class Like(models.Model):
         constraints = [
             models.UniqueConstraint(fields=["tweet", "user"], name="like_unique"),
         ]
+        indexes = [
+            models.Index(
+                fields=["user", "created_at", "id"], name="like_user_created_idx"
+            ),
+        ]
+        # like_unique は tweet が先頭なので、user で絞るクエリ (いいね一覧、ユーザー削除の CASCADE) 用
 
     def __str__(self):
         return f"{self.tweet.content} by {self.user.username}"
+
+
+class TimelineEntry(models.Model):
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name="timeline_entries",
+        on_delete=models.CASCADE,
+    )
+    tweet = models.ForeignKey(
+        Tweet, related_name="timeline_entries", on_delete=models.CASCADE
+    )
+    author = models.ForeignKey(
+        settings.AUTH_USER_MODEL, related_name="+", on_delete=models.CASCADE
+    )
+    tweet_created_at = models.DateTimeField()
+    # author と tweet_created_at はツイートからの複製
+    # JOINせずに「誰のツイートか」で消したり、作成日時順に並べたりするために持っておく
+
+    class Meta:
+        verbose_name_plural = "タイムライン"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["owner", "tweet"], name="timeline_entry_unique"
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["owner", "tweet_created_at", "tweet"],
+                name="timeline_owner_created_idx",
+            ),
+            models.Index(fields=["owner", "author"], name="timeline_owner_author_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.owner} ← {self.tweet_id}"
+
+
+class Hashtag(models.Model):
+    # 小文字・NFKC に揃えた名前 (tweets.entities.normalize_hashtag)
+    name = models.CharField(verbose_name="名前", max_length=100, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name_plural = "ハッシュタグ"
+
+    def __str__(self):
+        return f"#{self.name}"
+
+    def get_absolute_url(self):
+        return reverse("tweets:hashtag", kwargs={"name": self.name})
+
+
+class TweetHashtag(models.Model):
+    # ハッシュタグごとのタイムライン用。TimelineEntry と同じく作成日時を持たせ、インデックスだけで並べる
+    tweet = models.ForeignKey(
+        Tweet, related_name="tweet_hashtags", on_delete=models.CASCADE
+    )
+    hashtag = models.ForeignKey(
+        Hashtag, related_name="tweet_hashtags", on_delete=models.CASCADE
+    )
+    tweet_created_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name_plural = "ツイートのハッシュタグ"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["hashtag", "tweet"], name="tweet_hashtag_unique"
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["hashtag", "tweet_created_at", "tweet"],
+                name="tweet_hashtag_created_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.hashtag} ← {self.tweet_id}"
+
+
+class Mention(models.Model):
+    tweet = models.ForeignKey(Tweet, related_name="mentions", on_delete=models.CASCADE)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, related_name="mentions", on_delete=models.CASCADE
+    )
+    tweet_created_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name_plural = "メンション"
+        constraints = [
+            models.UniqueConstraint(fields=["user", "tweet"], name="mention_unique"),
+        ]
+        indexes = [
+            models.Index(
+                fields=["user", "tweet_created_at", "tweet"],
+                name="mention_user_created_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"@{self.user} ← {self.tweet_id}"
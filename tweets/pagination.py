@@ -0,0 +1,83 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+from django.http import Http404
+
+DEFAULT_PAGE_SIZE = 20
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def encode_cursor(created_at, pk):
+    raw = f"{created_at.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, pk = base64.urlsafe_b64decode(padded).decode().split("|")
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursor(cursor) from e
+
+
+def keyset_queryset(queryset, cursor=None, fields=("created_at", "id")):
+    # (created_at, id) の降順で、カーソルより後ろの行だけに絞り込む
+    # OFFSET を使わないので、何ページ目でもインデックスを範囲検索するだけで済む
+    time_field, pk_field = fields
+    queryset = queryset.order_by(f"-{time_field}", f"-{pk_field}")
+    if cursor is None:
+        return queryset
+    created_at, pk = decode_cursor(cursor)
+    # created_at <= c で範囲検索させてから、同時刻の行を id で切る
+    # (created_at, id) < (c, pk) をそのまま OR で書くとインデックスが範囲検索に使われない
+    return queryset.filter(**{f"{time_field}__lte": created_at}).filter(
+        Q(**{f"{time_field}__lt": created_at}) | Q(**{f"{pk_field}__lt": pk})
+    )
+
+
+def paginate(
+    queryset, cursor=None, per_page=DEFAULT_PAGE_SIZE, fields=("created_at", "id")
+):
+    # 1件多く取得して、次のページがあるかどうかを COUNT なしで判定する
+    rows = list(keyset_queryset(queryset, cursor, fields)[: per_page + 1])
+    return page_from_rows(rows, per_page, fields)
+
+
+def paginate_or_404(queryset, cursor=None, per_page=DEFAULT_PAGE_SIZE, **kwargs):
+    # Django の Paginator と同じく、不正なページ指定は 404 にする
+    try:
+        return paginate(queryset, cursor, per_page, **kwargs)
+    except InvalidCursor:
+        raise Http404("無効なカーソルです。")
+
+
+def page_from_rows(rows, per_page, fields=("created_at", "id")):
+    time_field, pk_field = fields
+    if len(rows) <= per_page:
+        return KeysetPage(rows, None)
+    rows = rows[:per_page]
+    last = rows[-1]
+    return KeysetPage(
+        rows, encode_cursor(getattr(last, time_field), getattr(last, pk_field))
+    )
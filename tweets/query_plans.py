@@ -0,0 +1,165 @@
+from django.db import connection
+from django.db.models import Sum
+from django.utils import timezone
+
+from accounts.models import FriendShip, User
+from trends import counters as trends
+from trends.models import TrendCounter
+
+from . import timeline
+from .models import Like, Mention, TimelineEntry, Tweet, TweetHashtag
+from .pagination import DEFAULT_PAGE_SIZE, encode_cursor, keyset_queryset
+
+# よく通るクエリの実行計画 (SQLite の EXPLAIN QUERY PLAN) を確かめる。audit_query_plans コマンドから使う
+# - SCAN (テーブルやインデックスを頭から全部読む) と、ORDER BY のための TEMP B-TREE (読んだ行を全部並べ替える) を問題にする
+# - GROUP BY のための TEMP B-TREE は、範囲を絞ってから集計しているなら許す (トレンドの集計)
+# 実行計画は値ではなく形で決まるので、id などは仮の値でよい
+
+USER_ID = 1
+LIMIT = DEFAULT_PAGE_SIZE + 1
+
+
+class UnsupportedDatabase(Exception):
+    pass
+
+
+class HotQuery:
+    def __init__(self, name, build, allow=(), reason=None):
+        self.name = name
+        self.build = build
+        # 許す問題 ("scan" / "sort") と、その理由
+        self.allow = allow
+        self.reason = reason
+
+
+def _cursor():
+    return encode_cursor(timezone.now(), 1)
+
+
+def _user():
+    return User(id=USER_ID)
+
+
+HOT_QUERIES = [
+    HotQuery(
+        "home_entries",
+        lambda: keyset_queryset(
+            TimelineEntry.objects.filter(owner_id=USER_ID).select_related(
+                "tweet__user"
+            ),
+            _cursor(),
+            fields=("tweet_created_at", "tweet_id"),
+        )[:LIMIT],
+    ),
+    HotQuery(
+        "home_pulled",
+        lambda: timeline.pulled_tweets(_user(), _cursor())[:LIMIT],
+    ),
+    HotQuery(
+        "profile_tweets",
+        lambda: keyset_queryset(
+            Tweet.objects.filter(user_id=USER_ID).select_related("user"), _cursor()
+        )[:LIMIT],
+    ),
+    HotQuery(
+        "liked_tweet_ids",
+        lambda: Like.objects.filter(
+            user_id=USER_ID, tweet_id__in=[1, 2, 3]
+        ).values_list("tweet_id", flat=True),
+    ),
+    HotQuery(
+        "likes_by_user",
+        lambda: keyset_queryset(Like.objects.filter(user_id=USER_ID), _cursor())[
+            :LIMIT
+        ],
+    ),
+    HotQuery(
+        "following_list",
+        lambda: keyset_queryset(
+            FriendShip.objects.select_related("following").filter(follower_id=USER_ID),
+            _cursor(),
+        )[:LIMIT],
+    ),
+    HotQuery(
+        "follower_list",
+        lambda: keyset_queryset(
+            FriendShip.objects.select_related("follower").filter(following_id=USER_ID),
+            _cursor(),
+        )[:LIMIT],
+    ),
+    HotQuery(
+        "fan_out_followers",
+        lambda: FriendShip.objects.filter(following_id=USER_ID).values_list(
+            "follower_id", flat=True
+        ),
+    ),
+    HotQuery(
+        "is_following",
+        lambda: FriendShip.objects.filter(
+            following_id=USER_ID, follower_id=USER_ID + 1
+        )[:1],
+    ),
+    HotQuery(
+        "hashtag_timeline",
+        lambda: keyset_queryset(
+            TweetHashtag.objects.filter(hashtag__name="django").select_related(
+                "tweet__user"
+            ),
+            _cursor(),
+            fields=("tweet_created_at", "tweet_id"),
+        )[:LIMIT],
+    ),
+    HotQuery(
+        "mention_timeline",
+        lambda: keyset_queryset(
+            Mention.objects.filter(user_id=USER_ID).select_related("tweet__user"),
+            _cursor(),
+            fields=("tweet_created_at", "tweet_id"),
+        )[:LIMIT],
+    ),
+    HotQuery(
+        "trending_likes",
+        lambda: TrendCounter.objects.filter(
+            kind=TrendCounter.LIKE,
+            bucket__gt=trends.current_bucket() - trends.window_buckets(),
+            bucket__lte=trends.current_bucket(),
+        )
+        .values_list("key")
+        .annotate(total=Sum("count"))
+        .order_by("key"),
+    ),
+]
+
+
+def explain(queryset):
+    # EXPLAIN QUERY PLAN の各行の説明だけを返す (先頭の id, parent, notused は捨てる)
+    return [line.split(" ", 3)[3] for line in queryset.explain().splitlines()]
+
+
+def problems(plan):
+    found = []
+    for detail in plan:
+        if detail.startswith("SCAN ") and detail != "SCAN CONSTANT ROW":
+            found.append(("scan", detail))
+        elif detail.startswith("USE TEMP B-TREE") and "ORDER BY" in detail:
+            found.append(("sort", detail))
+    return found
+
+
+def audit(queries=None):
+    # [(HotQuery, 実行計画, 許さない問題, 許した問題), ...]
+    if connection.vendor != "sqlite":
+        raise UnsupportedDatabase(f"{connection.vendor} の実行計画には対応していません。")
+    results = []
+    for query in HOT_QUERIES if queries is None else queries:
+        plan = explain(query.build())
+        found = problems(plan)
+        results.append(
+            (
+                query,
+                plan,
+                [problem for problem in found if problem[0] not in query.allow],
+                [problem for problem in found if problem[0] in query.allow],
+            )
+        )
+    return results
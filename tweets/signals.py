@@ -0,0 +1,31 @@
+from django.db.models.signals import post_save, pre_delete
+from django.dispatch import receiver
+
+from accounts.models import User
+
+from . import card_cache, timeline
+from .models import Tweet
+
+# ツイートの書き換え・削除はビュー以外 (管理画面、ユーザーの削除の CASCADE、QuerySet.delete) からも起こるので、
+# タイムラインのキャッシュの無効化はシグナルで行う
+
+
+@receiver(pre_delete, sender=Tweet)
+def tweet_deleting(sender, instance, **kwargs):
+    # 消えた後では配信先 (TimelineEntry) が読めないので、消す前に呼ぶ
+    timeline.tweet_changed(instance)
+
+
+@receiver(post_save, sender=Tweet)
+def tweet_saved(sender, instance, created, **kwargs):
+    # 作成は tweets.views.TweetCreateView と配信 (fan_out) で扱う
+    if not created:
+        timeline.tweet_changed(instance)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields, **kwargs):
+    # ユーザー名が変わりうる保存だけ (ログインで last_login だけを保存するときなどは除く)
+    if created or (update_fields is not None and "username" not in update_fields):
+        return
+    card_cache.author_changed(instance)
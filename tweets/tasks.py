@@ -0,0 +1,45 @@
+from accounts.models import FriendShip, User
+from tasks.queue import task
+
+from . import timeline
+from .likes import actual_like_count
+from .models import Tweet
+
+# リクエストの後 (ワーカー) で実行する処理。どれも実行する時点の状態を見直すので、何度・どの順で走ってもよい
+
+
+@task
+def fan_out_tweet(tweet_id):
+    tweet = Tweet.objects.select_related("user").filter(id=tweet_id).first()
+    if tweet is None:
+        # 実行までに消された
+        return
+    timeline.fan_out(tweet)
+
+
+@task
+def backfill_timeline(follower_id, following_id):
+    # 実行までにフォローを外していたら入れない (remove_author_timeline と順番が入れ替わっても正しくなる)
+    if not FriendShip.objects.filter(
+        follower_id=follower_id, following_id=following_id
+    ).exists():
+        return
+    users = User.objects.in_bulk([follower_id, following_id])
+    timeline.backfill(users[follower_id], users[following_id])
+
+
+@task
+def remove_author_timeline(follower_id, following_id):
+    if FriendShip.objects.filter(
+        follower_id=follower_id, following_id=following_id
+    ).exists():
+        return
+    users = User.objects.in_bulk([follower_id, following_id])
+    if len(users) == 2:
+        timeline.remove_author(users[follower_id], users[following_id])
+
+
+@task
+def reconcile_like_counts(tweet_ids):
+    # UPDATE の中で Like を数え直す (reconcile_like_counts コマンドの、対象を絞った版)
+    Tweet.objects.filter(id__in=tweet_ids).update(like_count=actual_like_count())
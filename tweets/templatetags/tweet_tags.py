@@ -0,0 +1,41 @@
+import re
+
+from django import template
+from django.urls import reverse
+from django.utils.html import escape, format_html
+from django.utils.safestring import mark_safe
+
+from .. import card_cache
+from ..entities import HASHTAG_RE, MENTION_RE, normalize_hashtag
+
+register = template.Library()
+
+ENTITY_RE = re.compile(f"{HASHTAG_RE.pattern}|{MENTION_RE.pattern}")
+
+
+@register.filter
+def linkify(content):
+    # 本文の #タグ と @ユーザー名 をリンクにする。それ以外の部分はエスケープする
+    parts = []
+    position = 0
+    for match in ENTITY_RE.finditer(content):
+        hashtag, username = match.groups()
+        start = match.start()
+        if hashtag:
+            end = match.end()
+            url = reverse("tweets:hashtag", kwargs={"name": normalize_hashtag(hashtag)})
+        else:
+            username = username.rstrip(".")
+            end = start + 1 + len(username)
+            url = reverse("tweets:mentions", kwargs={"username": username})
+        parts.append(escape(content[position:start]))
+        parts.append(format_html('<a href="{}">{}</a>', url, content[start:end]))
+        position = end
+    parts.append(escape(content[position:]))
+    return mark_safe("".join(parts))
+
+
+@register.simple_tag
+def tweet_cards(tweets):
+    # ツイートのカードを並べる。見ている人によらない部分はキャッシュから出す (tweets.card_cache)
+    return card_cache.render_cards(tweets)
@@ -1,9 +1,32 @@
-from django.test import TestCase
+import threading
+import time
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.test import AsyncClient, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 
+from accounts import follows
 from accounts.models import User
+from mysite.testcases import TestCase, TransactionTestCase
 
-from .models import Like, Tweet
+from . import (
+    card_cache,
+    checks,
+    entities,
+    likes,
+    query_plans,
+    timeline_cache,
+    viewer_state,
+)
+from .models import Hashtag, Like, Mention, TimelineEntry, Tweet, TweetHashtag
+from .pagination import encode_cursor, keyset_queryset
 
 
 class TestHomeView(TestCase):
@@ -29,6 +52,292 @@ class TestHomeView(TestCase):
         # https://docs.djangoproject.com/ja/3.1/topics/testing/tools/#django.test.TransactionTestCase.assertQuerysetEqual
 
 
+class TestHomeViewPagination(TestCase):
+    def setUp(self):
+        self.url = reverse("tweets:home")
+        self.user = User.objects.create_user(
+            username="testuser",
+            password="testpassword",
+        )
+        self.client.login(username="testuser", password="testpassword")
+        Tweet.objects.bulk_create(
+            Tweet(user=self.user, content=f"testpost{i}") for i in range(100)
+        )
+        # bulk_create だと created_at が同時刻になり得るので、id での並びも確認できる
+
+    def test_pages_do_not_overlap(self):
+        seen = []
+        cursor = None
+        while True:
+            response = self.client.get(self.url, {"cursor": cursor} if cursor else {})
+            self.assertEqual(response.status_code, 200)
+            seen += [tweet.id for tweet in response.context["tweet_list"]]
+            cursor = response.context["next_cursor"]
+            if cursor is None:
+                break
+        expected = Tweet.objects.order_by("-created_at", "-id")
+        self.assertEqual(seen, [tweet.id for tweet in expected])
+
+    def test_failure_get_with_invalid_cursor(self):
+        response = self.client.get(self.url, {"cursor": "invalid"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_query_count_does_not_depend_on_depth(self):
+        tweets = list(Tweet.objects.order_by("-created_at", "-id"))
+        counts = []
+        for tweet in (tweets[0], tweets[50], tweets[-21]):
+            cursor = encode_cursor(tweet.created_at, tweet.id)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(self.url, {"cursor": cursor})
+            self.assertEqual(len(response.context["tweet_list"]), 20)
+            counts.append(len(queries))
+        self.assertEqual(len(set(counts)), 1)
+
+    def test_query_plan_does_not_depend_on_depth(self):
+        tweets = list(Tweet.objects.order_by("-created_at", "-id"))
+        plans = set()
+        for tweet in (tweets[0], tweets[50], tweets[-1]):
+            cursor = encode_cursor(tweet.created_at, tweet.id)
+            plan = keyset_queryset(Tweet.objects.all(), cursor)[:21].explain()
+            self.assertIn("tweet_created_at_id_idx", plan)
+            self.assertNotIn("TEMP B-TREE", plan)
+            self.assertNotIn(
+                "OFFSET", str(keyset_queryset(Tweet.objects.all(), cursor)[:21].query)
+            )
+            plans.add(plan)
+        self.assertEqual(len(plans), 1)
+
+
+class TestHomeFeedView(TestCase):
+    def setUp(self):
+        self.url = reverse("tweets:home_feed")
+        self.user = User.objects.create_user(
+            username="testuser",
+            password="testpassword",
+        )
+        self.client.login(username="testuser", password="testpassword")
+        Tweet.objects.bulk_create(
+            Tweet(user=self.user, content=f"testpost{i}") for i in range(25)
+        )
+
+    def test_success_get(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(data["has_next"])
+        self.assertEqual(data["html"].count('class="card"'), 20)
+
+        response = self.client.get(self.url, {"cursor": data["next_cursor"]})
+        data = response.json()
+        self.assertFalse(data["has_next"])
+        self.assertIsNone(data["next_cursor"])
+        self.assertEqual(data["html"].count('class="card"'), 5)
+
+
+class TestHomeViewerState(TestCase):
+    def setUp(self):
+        self.url = reverse("tweets:home")
+        self.user = User.objects.create_user(
+            username="testuser",
+            password="testpassword",
+        )
+        self.client.login(username="testuser", password="testpassword")
+
+    def create_tweets(self, n):
+        Tweet.objects.bulk_create(
+            Tweet(user=self.user, content=f"testpost{i}") for i in range(n)
+        )
+        tweets = Tweet.objects.filter(user=self.user)
+        Like.objects.bulk_create(
+            Like(tweet=tweet, user=self.user) for tweet in tweets if tweet.id % 2
+        )
+
+    def test_liked_tweet_ids(self):
+        self.create_tweets(4)
+        ids = list(Tweet.objects.values_list("id", flat=True))
+        with self.assertNumQueries(1):
+            liked = viewer_state.liked_tweet_ids(self.user, ids)
+        self.assertIsInstance(liked, frozenset)
+        self.assertEqual(liked, {i for i in ids if i % 2})
+
+    def test_query_count_does_not_depend_on_tweet_count(self):
+        for n in (10, 100, 1000):
+            with self.subTest(n=n):
+                Tweet.objects.all().delete()
+                self.create_tweets(n)
+                # session, user, timeline entries, pulled tweets, liked ids, suggestions
+                with self.assertNumQueries(6):
+                    response = self.client.get(self.url)
+                for tweet in response.context["tweet_list"]:
+                    self.assertEqual(tweet.is_liked, bool(tweet.id % 2))
+
+
+class TestHomeTimeline(TestCase):
+    def setUp(self):
+        self.url = reverse("tweets:home")
+        self.user1 = User.objects.create_user(
+            username="testuser1",
+            password="testpassword",
+        )
+        self.user2 = User.objects.create_user(
+            username="testuser2",
+            password="testpassword",
+        )
+        self.user3 = User.objects.create_user(
+            username="testuser3",
+            password="testpassword",
+        )
+        follows.follow(self.user1, self.user2)
+        self.client.login(username="testuser2", password="testpassword")
+
+    def get_home(self, username):
+        self.client.login(username=username, password="testpassword")
+        response = self.client.get(self.url)
+        return [tweet.content for tweet in response.context["tweet_list"]]
+
+    def test_fan_out_on_create(self):
+        self.client.post(reverse("tweets:create"), {"content": "testpost"})
+        tweet = Tweet.objects.get(content="testpost")
+        self.assertTrue(
+            TimelineEntry.objects.filter(owner=self.user1, tweet=tweet).exists()
+        )
+        self.assertEqual(self.get_home("testuser1"), ["testpost"])
+        self.assertEqual(self.get_home("testuser3"), [])
+
+    @override_settings(TIMELINE_FANOUT_THRESHOLD=1)
+    def test_pull_tweets_of_popular_user(self):
+        self.client.post(reverse("tweets:create"), {"content": "testpost"})
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(self.get_home("testuser1"), ["testpost"])
+        self.assertEqual(self.get_home("testuser3"), [])
+
+    @override_settings(TIMELINE_FANOUT_THRESHOLD=2)
+    def test_pulled_is_decided_when_posted(self):
+        # pull で投稿したツイートは、後でフォロワーが減っても読み込み時に混ぜる
+        follows.follow(self.user3, self.user2)
+        self.client.post(reverse("tweets:create"), {"content": "pulled"})
+        self.assertTrue(Tweet.objects.get(content="pulled").pulled)
+        follows.unfollow(self.user3, self.user2)
+        self.assertEqual(self.get_home("testuser1"), ["pulled"])
+
+        # フォロワーが減った後のツイートは配信する
+        self.client.login(username="testuser2", password="testpassword")
+        self.client.post(reverse("tweets:create"), {"content": "pushed"})
+        call_command("rebuild_timelines", stdout=StringIO())
+        self.assertEqual(
+            list(TimelineEntry.objects.values_list("owner", "tweet__content")),
+            [(self.user1.id, "pushed")],
+        )
+        self.assertEqual(self.get_home("testuser1"), ["pushed", "pulled"])
+
+    def test_backfill_on_follow(self):
+        Tweet.objects.create(user=self.user3, content="testpost")
+        self.client.login(username="testuser1", password="testpassword")
+        self.client.post(
+            reverse("accounts:follow", kwargs={"username": self.user3.username})
+        )
+        self.assertEqual(self.get_home("testuser1"), ["testpost"])
+
+    def test_cleanup_on_unfollow(self):
+        self.client.post(reverse("tweets:create"), {"content": "testpost"})
+        self.client.login(username="testuser1", password="testpassword")
+        self.client.post(
+            reverse("accounts:unfollow", kwargs={"username": self.user2.username})
+        )
+        self.assertFalse(TimelineEntry.objects.filter(owner=self.user1).exists())
+        self.assertEqual(self.get_home("testuser1"), [])
+
+    def test_rebuild_timelines_command(self):
+        Tweet.objects.create(user=self.user2, content="testpost")
+        Tweet.objects.create(user=self.user3, content="not followed")
+        call_command("rebuild_timelines", stdout=StringIO())
+        self.assertEqual(
+            list(TimelineEntry.objects.values_list("owner", "tweet__content")),
+            [(self.user1.id, "testpost")],
+        )
+
+
+class TestTimelineCache(TestCase):
+    def setUp(self):
+        self.url = reverse("tweets:home")
+        self.user1 = User.objects.create_user(
+            username="testuser1",
+            password="testpassword",
+        )
+        self.user2 = User.objects.create_user(
+            username="testuser2",
+            password="testpassword",
+        )
+        follows.follow(self.user1, self.user2)
+        self.client.login(username="testuser2", password="testpassword")
+        self.client.post(reverse("tweets:create"), {"content": "testpost1"})
+        self.post = Tweet.objects.get(content="testpost1")
+        self.client.login(username="testuser1", password="testpassword")
+
+    def get_home(self):
+        response = self.client.get(self.url)
+        return [
+            (tweet.content, tweet.like_count, tweet.is_liked)
+            for tweet in response.context["tweet_list"]
+        ]
+
+    def test_hit_does_not_query_timeline(self):
+        self.assertEqual(self.get_home(), [("testpost1", 0, False)])
+        # session, user, おすすめユーザー
+        with self.assertNumQueries(3):
+            self.assertEqual(self.get_home(), [("testpost1", 0, False)])
+        stats = timeline_cache.stats()
+        self.assertEqual(stats["page"]["hits"], 1)
+        self.assertEqual(stats["page"]["misses"], 1)
+        self.assertEqual(stats["liked"]["hits"], 1)
+
+    def test_invalidate_on_create(self):
+        self.get_home()
+        self.client.login(username="testuser2", password="testpassword")
+        self.client.post(reverse("tweets:create"), {"content": "testpost2"})
+        self.client.login(username="testuser1", password="testpassword")
+        self.assertEqual(
+            self.get_home(), [("testpost2", 0, False), ("testpost1", 0, False)]
+        )
+
+    def test_invalidate_on_delete(self):
+        self.get_home()
+        self.client.login(username="testuser2", password="testpassword")
+        self.client.post(reverse("tweets:delete", kwargs={"pk": self.post.pk}))
+        self.client.login(username="testuser1", password="testpassword")
+        self.assertEqual(self.get_home(), [])
+
+    def test_invalidate_outside_views(self):
+        # 管理画面やユーザーの削除 (CASCADE) でも無効にする (tweets.signals)
+        self.get_home()
+        self.post.content = "書き直した"
+        self.post.save()
+        self.assertEqual(self.get_home(), [("書き直した", 0, False)])
+        self.user2.delete()
+        self.assertEqual(self.get_home(), [])
+
+    def test_invalidate_on_like(self):
+        self.get_home()
+        self.client.post(reverse("tweets:like", kwargs={"pk": self.post.pk}))
+        self.assertEqual(self.get_home(), [("testpost1", 1, True)])
+        self.client.post(reverse("tweets:unlike", kwargs={"pk": self.post.pk}))
+        self.assertEqual(self.get_home(), [("testpost1", 0, False)])
+
+    def test_invalidate_on_unfollow(self):
+        self.get_home()
+        self.client.post(
+            reverse("accounts:unfollow", kwargs={"username": self.user2.username})
+        )
+        self.assertEqual(self.get_home(), [])
+
+    def test_stats_command(self):
+        self.get_home()
+        out = StringIO()
+        call_command("timeline_cache_stats", "--reset", stdout=out)
+        self.assertIn("page: hit=0 miss=1", out.getvalue())
+        self.assertEqual(timeline_cache.stats()["page"]["misses"], 0)
+
+
 class TestTweetCreateView(TestCase):
     def setUp(self):
         self.url = reverse("tweets:create")
@@ -109,6 +418,13 @@ class TestTweetDetailView(TestCase):
         )
         # getのテストでpostの内容を見たいときは、setUpの時にデータを作っておいてあげればいい
 
+    def test_like_count_without_aggregate(self):
+        Tweet.objects.filter(id=self.post.id).update(like_count=3)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertContains(response, "いいね 3")
+        self.assertFalse(any("COUNT(" in q["sql"] for q in queries))
+
 
 class TestTweetDeleteView(TestCase):
     def setUp(self):
@@ -185,6 +501,27 @@ class TestFavoriteView(TestCase):
             Like.objects.filter(tweet=self.post, user=self.user1).count(), 1
         )
 
+    @override_settings(TASKS_EAGER=False)
+    def test_query_count(self):
+        # session, user, savepoint, INSERT ... SELECT, UPDATE, トレンドのカウンタ, いいね数の読み込み,
+        # 通知のタスク, release
+        with self.assertNumQueries(9):
+            self.client.post(self.url)
+        # いいね済みなら INSERT が空振りするので UPDATE もカウンタも増やさない
+        with self.assertNumQueries(6):
+            self.client.post(self.url)
+
+    def test_like_count_is_stored(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url)
+        self.assertEqual(response.json()["like_count"], 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+        self.assertFalse(any("COUNT(" in q["sql"] for q in queries))
+
+        response = self.client.post(self.url)
+        self.assertEqual(response.json()["like_count"], 1)
+
 
 class TestUnfavoriteView(TestCase):
     def setUp(self):
@@ -210,7 +547,632 @@ class TestUnfavoriteView(TestCase):
         self.assertEqual(response.status_code, 404)
         self.assertTrue(Like.objects.filter(tweet=self.post, user=self.user1).exists())
 
+    def test_like_count_is_stored(self):
+        Tweet.objects.filter(id=self.post.id).update(like_count=1)
+        response = self.client.post(self.url)
+        self.assertEqual(response.json()["like_count"], 0)
+        response = self.client.post(self.url)
+        self.assertEqual(response.json()["like_count"], 0)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 0)
+
     def test_failure_post_with_unfavorited_tweet(self):
         Like.objects.filter(tweet=self.post, user=self.user1).delete()
         response = self.client.post(self.url)
         self.assertEqual(response.status_code, 200)
+
+
+class TestAsyncLikeView(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(
+            username="testuser1",
+            password="testpassword",
+        )
+        self.user2 = User.objects.create_user(
+            username="testuser2",
+            password="testpassword",
+        )
+        self.post = Tweet.objects.create(user=self.user2, content="testpost")
+        self.async_client.force_login(self.user1)
+        self.like_url = reverse("tweets:like_async", kwargs={"pk": self.post.id})
+        self.unlike_url = reverse("tweets:unlike_async", kwargs={"pk": self.post.id})
+
+    async def test_like_and_unlike(self):
+        response = await self.async_client.post(self.like_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["is_liked"], True)
+        self.assertEqual(response.json()["like_count"], 1)
+        self.assertTrue(
+            await Like.objects.filter(tweet=self.post, user=self.user1).aexists()
+        )
+
+        # 2回目は何も変わらない
+        response = await self.async_client.post(self.like_url)
+        self.assertEqual(response.json()["like_count"], 1)
+
+        response = await self.async_client.post(self.unlike_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["is_liked"], False)
+        self.assertEqual(response.json()["like_count"], 0)
+        self.assertFalse(await Like.objects.aexists())
+
+    async def test_not_exist_tweet(self):
+        url = reverse("tweets:like_async", kwargs={"pk": 10000})
+        response = await self.async_client.post(url)
+        self.assertEqual(response.status_code, 404)
+
+    async def test_login_required(self):
+        response = await AsyncClient().post(self.like_url)
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(await Like.objects.aexists())
+
+
+class TestLikeConcurrency(TransactionTestCase):
+    # 同じツイートへのいいね・取り消しを複数スレッドから同時に送っても、
+    # like_unique 違反にならず、like_count が Like の実件数と一致することを確かめる
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(username=f"testuser{i}") for i in range(8)
+        ]
+        self.post = Tweet.objects.create(user=self.users[0], content="testpost")
+
+    def run_concurrently(self, jobs):
+        barrier = threading.Barrier(len(jobs))
+        errors = []
+
+        def run(job):
+            try:
+                barrier.wait()
+                job()
+            except Exception as e:  # noqa: B902
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=(job,)) for job in jobs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def retry_locked(self, func):
+        # SQLite は書き込みが1本ずつなので、ロック待ちで失敗したものはやり直す
+        def job():
+            for _ in range(50):
+                try:
+                    return func()
+                except OperationalError as e:
+                    if "locked" not in str(e):
+                        raise
+                    time.sleep(0.01)
+            raise AssertionError("database is locked")
+
+        return job
+
+    def test_like_from_many_users(self):
+        self.run_concurrently(
+            [
+                self.retry_locked(
+                    lambda user=user: likes.set_like(user, self.post.id, True)
+                )
+                for user in self.users
+                for _ in range(3)
+            ]
+        )
+        self.post.refresh_from_db()
+        self.assertEqual(Like.objects.filter(tweet=self.post).count(), 8)
+        self.assertEqual(self.post.like_count, 8)
+
+    def test_toggle_from_same_user(self):
+        user = self.users[1]
+        self.run_concurrently(
+            [
+                self.retry_locked(
+                    lambda is_liked=i % 2 == 0: likes.set_like(
+                        user, self.post.id, is_liked
+                    )
+                )
+                for i in range(16)
+            ]
+        )
+        self.post.refresh_from_db()
+        self.assertEqual(
+            self.post.like_count, Like.objects.filter(tweet=self.post).count()
+        )
+        self.assertLessEqual(self.post.like_count, 1)
+
+    def test_batches_from_same_user(self):
+        # 同じいいねを含むバッチが同時に届いても、増やすのは実際に行を入れた1回だけ
+        user = self.users[1]
+        other = Tweet.objects.create(user=self.users[0], content="testpost2")
+        operations = {self.post.id: True, other.id: True}
+        self.run_concurrently(
+            [
+                self.retry_locked(lambda: likes.apply_batch(user, operations))
+                for _ in range(8)
+            ]
+        )
+        for tweet in (self.post, other):
+            tweet.refresh_from_db()
+            self.assertEqual(tweet.like_count, 1)
+        self.assertEqual(Like.objects.filter(user=user).count(), 2)
+
+
+class TestLikeBatchView(TestCase):
+    def setUp(self):
+        self.url = reverse("tweets:like_batch")
+        self.user = User.objects.create_user(
+            username="testuser", password="testpassword"
+        )
+        self.client.login(username="testuser", password="testpassword")
+        self.posts = Tweet.objects.bulk_create(
+            Tweet(user=self.user, content=f"testpost{i}") for i in range(20)
+        )
+        self.posts = list(Tweet.objects.order_by("id"))
+
+    def post_batch(self, operations):
+        return self.client.post(
+            self.url, {"operations": operations}, content_type="application/json"
+        )
+
+    def test_success_post(self):
+        likes.set_like(self.user, self.posts[1].id, True)
+        response = self.post_batch(
+            [
+                {"tweet_id": self.posts[0].id, "action": "like"},
+                {"tweet_id": self.posts[1].id, "action": "unlike"},
+                {"tweet_id": self.posts[2].id, "action": "like"},
+                {"tweet_id": self.posts[2].id, "action": "unlike"},
+                {"tweet_id": 10000, "action": "like"},
+            ]
+        )
+        self.assertEqual(response.status_code, 200)
+        results = {r["tweet_id"]: r for r in response.json()["results"]}
+        self.assertEqual(response.json()["missing"], [10000])
+        self.assertTrue(results[self.posts[0].id]["is_liked"])
+        self.assertEqual(results[self.posts[0].id]["like_count"], 1)
+        self.assertFalse(results[self.posts[1].id]["is_liked"])
+        self.assertEqual(results[self.posts[1].id]["like_count"], 0)
+        self.assertFalse(results[self.posts[2].id]["is_liked"])
+        self.assertEqual(
+            list(Like.objects.values_list("tweet_id", flat=True)), [self.posts[0].id]
+        )
+        self.assertEqual(
+            list(Tweet.objects.order_by("id").values_list("like_count", flat=True)),
+            [1] + [0] * 19,
+        )
+
+    def test_query_count_does_not_depend_on_batch_size(self):
+        counts = []
+        for posts in (self.posts[:1], self.posts[1:]):
+            operations = [{"tweet_id": p.id, "action": "like"} for p in posts]
+            with CaptureQueriesContext(connection) as queries:
+                self.post_batch(operations)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(Like.objects.count(), 20)
+
+    def test_failure_post_with_invalid_action(self):
+        response = self.post_batch([{"tweet_id": self.posts[0].id, "action": "x"}])
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(
+            self.url, "not json", content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Like.objects.exists())
+
+    def test_failure_post_with_too_many_operations(self):
+        operations = [{"tweet_id": self.posts[0].id, "action": "like"}] * 101
+        response = self.post_batch(operations)
+        self.assertEqual(response.status_code, 400)
+
+
+class TestReconcileLikeCounts(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="testuser", password="testpassword"
+        )
+        self.post1 = Tweet.objects.create(user=self.user, content="testpost1")
+        self.post2 = Tweet.objects.create(user=self.user, content="testpost2")
+        Like.objects.create(tweet=self.post1, user=self.user)
+        Tweet.objects.filter(id=self.post2.id).update(like_count=5)
+
+    def test_repair_drift(self):
+        call_command("reconcile_like_counts", "--dry-run", stdout=StringIO())
+        self.assertEqual(Tweet.objects.get(id=self.post2.id).like_count, 5)
+
+        out = StringIO()
+        call_command("reconcile_like_counts", stdout=out)
+        self.assertIn("2 件", out.getvalue())
+        self.assertEqual(Tweet.objects.get(id=self.post1.id).like_count, 1)
+        self.assertEqual(Tweet.objects.get(id=self.post2.id).like_count, 0)
+
+
+class TestEntities(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(
+            username="testuser1", password="testpassword"
+        )
+        self.user2 = User.objects.create_user(
+            username="testuser2", password="testpassword"
+        )
+
+    def test_extract_hashtags(self):
+        self.assertEqual(
+            entities.extract_hashtags("#Django と ＃東京 #django a#b &#123; #東京"),
+            ["django", "東京"],
+        )
+
+    def test_extract_mentions(self):
+        self.assertEqual(
+            entities.extract_mentions("@testuser1 さん、＠testuser2. mail@example.com"),
+            ["testuser1", "testuser2"],
+        )
+
+    def test_save_entities(self):
+        tweet = Tweet.objects.create(
+            user=self.user1, content="#Django の話 @testuser2 @nobody #python"
+        )
+        entities.save_entities([tweet])
+        self.assertEqual(
+            set(Hashtag.objects.values_list("name", flat=True)), {"django", "python"}
+        )
+        self.assertEqual(TweetHashtag.objects.filter(tweet=tweet).count(), 2)
+        self.assertEqual(
+            list(Mention.objects.values_list("user", flat=True)), [self.user2.id]
+        )
+        # 2回目は何も増えない
+        entities.save_entities([tweet])
+        self.assertEqual(TweetHashtag.objects.count(), 2)
+        self.assertEqual(Mention.objects.count(), 1)
+
+    def test_no_entities_no_queries(self):
+        tweet = Tweet.objects.create(user=self.user1, content="ただのツイート")
+        with self.assertNumQueries(0):
+            entities.save_entities([tweet])
+
+    def test_create_view_saves_entities(self):
+        self.client.login(username="testuser1", password="testpassword")
+        self.client.post(reverse("tweets:create"), {"content": "#テスト @testuser2 こんにちは"})
+        tweet = Tweet.objects.get()
+        self.assertTrue(
+            TweetHashtag.objects.filter(tweet=tweet, hashtag__name="テスト").exists()
+        )
+        self.assertTrue(Mention.objects.filter(tweet=tweet, user=self.user2).exists())
+
+    def test_linkify(self):
+        self.client.login(username="testuser1", password="testpassword")
+        tweet = Tweet.objects.create(
+            user=self.user1, content="<b>#Django</b> @testuser2."
+        )
+        response = self.client.get(reverse("tweets:detail", kwargs={"pk": tweet.pk}))
+        hashtag_url = reverse("tweets:hashtag", kwargs={"name": "django"})
+        mention_url = reverse("tweets:mentions", kwargs={"username": "testuser2"})
+        self.assertContains(response, f'&lt;b&gt;<a href="{hashtag_url}">#Django</a>')
+        self.assertContains(response, f'<a href="{mention_url}">@testuser2</a>.')
+
+
+class TestEntityTimelineViews(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(
+            username="testuser1", password="testpassword"
+        )
+        self.user2 = User.objects.create_user(
+            username="testuser2", password="testpassword"
+        )
+        self.client.login(username="testuser1", password="testpassword")
+        self.tweets = []
+        for i in range(25):
+            tweet = Tweet.objects.create(
+                user=self.user1, content=f"#Django {i} @testuser2"
+            )
+            entities.save_entities([tweet])
+            self.tweets.append(tweet)
+        Tweet.objects.create(user=self.user1, content="関係ないツイート")
+
+    def test_hashtag_pages(self):
+        url = reverse("tweets:hashtag", kwargs={"name": "DJANGO"})
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, "tweets/hashtag.html")
+        self.assertEqual(response.context["hashtag"], "django")
+        first = list(response.context["tweet_list"])
+        self.assertEqual(first, self.tweets[::-1][:20])
+
+        response = self.client.get(url, {"cursor": response.context["next_cursor"]})
+        self.assertEqual(list(response.context["tweet_list"]), self.tweets[::-1][20:])
+        self.assertIsNone(response.context["next_cursor"])
+
+    def test_unknown_hashtag(self):
+        response = self.client.get(reverse("tweets:hashtag", kwargs={"name": "none"}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context["tweet_list"]), [])
+
+    def test_mention_pages(self):
+        url = reverse("tweets:mentions", kwargs={"username": "testuser2"})
+        with self.assertNumQueries(5):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, "tweets/mentions.html")
+        self.assertEqual(list(response.context["tweet_list"]), self.tweets[::-1][:20])
+
+    def test_mention_unknown_user(self):
+        url = reverse("tweets:mentions", kwargs={"username": "nobody"})
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_invalid_cursor(self):
+        url = reverse("tweets:hashtag", kwargs={"name": "django"})
+        self.assertEqual(self.client.get(url, {"cursor": "!!"}).status_code, 404)
+
+    def test_deleted_with_tweet(self):
+        self.tweets[0].delete()
+        self.assertEqual(TweetHashtag.objects.count(), 24)
+        self.assertEqual(Mention.objects.count(), 24)
+
+
+class TestBackfillTweetEntities(TestCase):
+    def test_backfill(self):
+        user = User.objects.create_user(username="testuser", password="testpassword")
+        Tweet.objects.bulk_create(
+            [Tweet(user=user, content=f"#tag{i % 3} @testuser") for i in range(7)]
+        )
+        out = StringIO()
+        call_command("backfill_tweet_entities", chunk_size=3, stdout=out)
+        self.assertIn("7 件のツイート", out.getvalue())
+        self.assertEqual(Hashtag.objects.count(), 3)
+        self.assertEqual(TweetHashtag.objects.count(), 7)
+        self.assertEqual(Mention.objects.count(), 7)
+
+        # 何度実行しても増えない
+        call_command("backfill_tweet_entities", stdout=StringIO())
+        self.assertEqual(TweetHashtag.objects.count(), 7)
+
+
+class TestQueryPlans(TestCase):
+    def test_hot_queries_use_indexes(self):
+        out = StringIO()
+        call_command("audit_query_plans", stdout=out)
+        self.assertIn(f"{len(query_plans.HOT_QUERIES)} 件のクエリを確認しました。", out.getvalue())
+        self.assertNotIn("[NG]", out.getvalue())
+
+    def test_profile_uses_user_created_index(self):
+        plan = query_plans.explain(
+            keyset_queryset(
+                Tweet.objects.filter(user_id=1), encode_cursor(timezone.now(), 1)
+            )
+        )
+        self.assertIn("tweet_user_created_idx", " ".join(plan))
+
+    def test_problems(self):
+        # インデックスのない列で絞って並べると、全件スキャンと並べ替えになる
+        plan = query_plans.explain(
+            Tweet.objects.filter(content="a").order_by("like_count")
+        )
+        self.assertEqual(
+            [kind for kind, _ in query_plans.problems(plan)], ["scan", "sort"]
+        )
+
+    def test_command_fails(self):
+        bad = query_plans.HotQuery("bad", lambda: Tweet.objects.order_by("content"))
+        with mock.patch.object(query_plans, "HOT_QUERIES", [bad]):
+            out = StringIO()
+            with self.assertRaises(CommandError):
+                call_command("audit_query_plans", stdout=out)
+        self.assertIn("[NG] bad", out.getvalue())
+
+    def test_unsupported_database(self):
+        with mock.patch.object(connection, "vendor", "postgresql"):
+            with self.assertRaisesMessage(CommandError, "postgresql の実行計画"):
+                call_command("audit_query_plans", stdout=StringIO())
+
+
+class TestCardCache(TestCase):
+    def setUp(self):
+        self.url = reverse("tweets:home")
+        self.user1 = User.objects.create_user(
+            username="testuser1", password="testpassword"
+        )
+        self.user2 = User.objects.create_user(
+            username="testuser2", password="testpassword"
+        )
+        follows.follow(self.user2, self.user1)
+        self.client.login(username="testuser1", password="testpassword")
+        self.client.post(reverse("tweets:create"), {"content": "#django のカード"})
+        self.tweet = Tweet.objects.get()
+
+    def test_fragment_is_reused(self):
+        self.client.get(self.url)
+        with mock.patch.object(
+            card_cache, "render_fragment", wraps=card_cache.render_fragment
+        ) as render_fragment:
+            response = self.client.get(self.url)
+        render_fragment.assert_not_called()
+        self.assertContains(response, "#django</a> のカード")
+        self.assertContains(response, self.tweet.get_absolute_url())
+
+    def test_like_state_is_per_viewer(self):
+        self.client.get(self.url)
+        self.client.post(reverse("tweets:like", kwargs={"pk": self.tweet.pk}))
+        # カードはキャッシュのまま、いいねボタンといいね数だけが変わる
+        response = self.client.get(self.url)
+        self.assertContains(response, 'data-liked="true"')
+        self.assertContains(response, f'<span class="count_{self.tweet.id}">1 </span>')
+
+        self.client.login(username="testuser2", password="testpassword")
+        response = self.client.get(self.url)
+        self.assertContains(response, 'data-liked="false"')
+        self.assertContains(response, f'<span class="count_{self.tweet.id}">1 </span>')
+
+    def test_updated_tweet_is_rendered_again(self):
+        self.client.get(self.url)
+        self.tweet.content = "書き直した"
+        self.tweet.save()
+        response = self.client.get(self.url)
+        self.assertContains(response, "書き直した")
+        self.assertNotContains(response, "のカード")
+
+    def test_renamed_author_is_rendered_again(self):
+        etag = self.client.get(self.url)["ETag"]
+        old_url = reverse("accounts:user_profile", kwargs={"username": "testuser1"})
+        self.user1.username = "renamed"
+        self.user1.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(
+            response, reverse("accounts:user_profile", kwargs={"username": "renamed"})
+        )
+        self.assertNotContains(response, old_url)
+
+    def test_login_keeps_cards(self):
+        # ログインの last_login だけの保存では描き直さない
+        self.client.get(self.url)
+        self.client.login(username="testuser1", password="testpassword")
+        with mock.patch.object(
+            card_cache, "render_fragment", wraps=card_cache.render_fragment
+        ) as render_fragment:
+            self.client.get(self.url)
+        render_fragment.assert_not_called()
+
+    def test_same_html_as_uncached(self):
+        self.tweet.is_liked = True
+        cached = card_cache.render_cards([self.tweet])
+        with override_settings(TWEET_CARD_CACHE_ENABLED=False):
+            uncached = card_cache.render_cards([self.tweet])
+        self.assertEqual(cached, uncached)
+        self.assertEqual(card_cache.render_cards([self.tweet]), uncached)
+        self.assertNotIn(card_cache.LIKE_SLOT, uncached)
+
+    def test_slot_in_content_is_escaped(self):
+        tweet = Tweet.objects.create(user=self.user1, content=card_cache.LIKE_SLOT)
+        tweet.is_liked = False
+        html = card_cache.render_cards([tweet])
+        self.assertEqual(html.count("data-liked"), 1)
+        self.assertIn("&lt;!-- like --&gt;", html)
+
+
+class TestConditionalGet(TestCase):
+    def setUp(self):
+        self.url = reverse("tweets:home")
+        self.user1 = User.objects.create_user(
+            username="testuser1", password="testpassword"
+        )
+        self.user2 = User.objects.create_user(
+            username="testuser2", password="testpassword"
+        )
+        follows.follow(self.user1, self.user2)
+        self.tweet = Tweet.objects.create(user=self.user2, content="最初のツイート")
+        self.client.login(username="testuser1", password="testpassword")
+
+    def get_etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("private", response["Cache-Control"])
+        return response["ETag"]
+
+    def test_not_modified(self):
+        etag = self.get_etag()
+        # session, user だけ (タイムラインもいいね状態も読まない)
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_modified_by_like(self):
+        etag = self.get_etag()
+        self.client.post(reverse("tweets:like", kwargs={"pk": self.tweet.pk}))
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_not_modified_by_like_elsewhere(self):
+        # ページに出ていない作者のツイートへのいいねでは、ETag は変わらない
+        user3 = User.objects.create_user(username="testuser3", password="testpassword")
+        other = Tweet.objects.create(user=user3, content="フォローしていない人のツイート")
+        etag = self.get_etag()
+        self.client.login(username="testuser2", password="testpassword")
+        self.client.post(reverse("tweets:like", kwargs={"pk": other.pk}))
+        self.client.login(username="testuser1", password="testpassword")
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_modified_by_followee_tweet(self):
+        etag = self.get_etag()
+        self.client.login(username="testuser2", password="testpassword")
+        self.client.post(reverse("tweets:create"), {"content": "新しいツイート"})
+        self.client.login(username="testuser1", password="testpassword")
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "新しいツイート")
+
+    @override_settings(TASKS_EAGER=False)
+    def test_modified_by_own_tweet_before_fan_out(self):
+        # 配信 (fan_out) がまだワーカーで実行されていなくても、投稿した人には自分のツイートが出る
+        etag = self.get_etag()
+        self.client.post(reverse("tweets:create"), {"content": "自分のツイート"})
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "自分のツイート")
+
+    def test_etag_is_per_user(self):
+        etag = self.get_etag()
+        self.client.login(username="testuser2", password="testpassword")
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_stamps_are_shared_between_processes(self):
+        etag = self.get_etag()
+        # 別のプロセス (ワーカー) が同じ設定で開いたキャッシュから更新しても、ETag が変わる
+        other = caches.create_connection(settings.TIMELINE_CACHE_ALIAS)
+        with mock.patch.object(timeline_cache, "get_cache", return_value=other):
+            timeline_cache.touch([("suggestions", 0)])
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_cache_lost(self):
+        etag = self.get_etag()
+        # stamp を持っていないプロセスが答えるときも、古い ETag で 304 にしない
+        timeline_cache.get_cache().clear()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_check_warns_local_memory_cache_in_production(self):
+        redis = {"BACKEND": "django.core.cache.backends.redis.RedisCache"}
+        with override_settings(DEBUG=False):
+            errors = checks.check_timeline_cache(None)
+            self.assertEqual([error.id for error in errors], ["tweets.W001"])
+            with override_settings(CACHES={**settings.CACHES, "timeline": redis}):
+                self.assertEqual(checks.check_timeline_cache(None), [])
+        # 開発 (DEBUG) は 1 プロセスなので LocMemCache のままでよい
+        with override_settings(DEBUG=True):
+            self.assertEqual(checks.check_timeline_cache(None), [])
+
+    def test_last_modified(self):
+        with mock.patch("time.time", return_value=1_000_000.5):
+            # setUp のフォローで付いた (実時間の) スタンプも、この時刻に揃える
+            timeline_cache.touch(
+                [("timeline", self.user1.id), ("follow", self.user1.id)]
+            )
+            # 変わったのと同じ秒のうちは Last-Modified を出さない
+            response = self.client.get(self.url)
+            self.assertFalse(response.has_header("Last-Modified"))
+        with mock.patch("time.time", return_value=1_000_010.0):
+            response = self.client.get(self.url)
+            last_modified = response["Last-Modified"]
+            response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_pending_messages(self):
+        # 一度だけ出すメッセージがあるときは 304 にしない ("*" はどの ETag とも一致する)
+        self.assertEqual(
+            self.client.get(self.url, HTTP_IF_NONE_MATCH="*").status_code, 304
+        )
+        user3 = User.objects.create_user(username="testuser3", password="testpassword")
+        self.client.post(
+            reverse("accounts:follow", kwargs={"username": user3.username})
+        )
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH="*")
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "testuser3 をフォローしました。")
@@ -0,0 +1,162 @@
+from django.conf import settings
+from django.db.models import Exists, OuterRef
+
+from accounts.models import FriendShip
+
+from . import timeline_cache
+from .models import TimelineEntry, Tweet
+from .pagination import DEFAULT_PAGE_SIZE, keyset_queryset, page_from_rows
+
+FANOUT_BATCH_SIZE = 1000
+
+# ホームタイムラインの組み立て方
+# - 普通のユーザーのツイートは、投稿時にフォロワー全員の TimelineEntry へ書き込む(push)
+# - フォロワーが多すぎるユーザーのツイートと自分自身のツイートは、読み込み時に Tweet から直接取ってきて混ぜる(pull)
+#   どちらにするかは投稿した時点で決めて Tweet.pulled に残す (後でフォロワーが減っても増えても変えない)
+
+
+def is_pulled_author(user):
+    # 1人ずつ配信すると書き込みが多すぎるユーザーかどうか
+    return user.followers_count >= settings.TIMELINE_FANOUT_THRESHOLD
+
+
+def followed_authors(user):
+    # user がフォローしているユーザーの id (サブクエリのまま返す)
+    return FriendShip.objects.filter(follower=user).values("following")
+
+
+def pulled_tweets(user, cursor=None):
+    # user のタイムラインに、読み込み時に混ぜるツイートを (created_at, id) の降順で返す
+    # 自分のツイート (tweet_user_created_idx) とフォローしている作者の pull のツイート (tweet_pulled_created_idx) を
+    # それぞれインデックスの順に読み、UNION ALL で混ぜる。OR で書くと両方を全部読んでから並べ替えることになる
+    # フォローの判定は EXISTS にする (IN だと user ごとに読んで並べ替える計画になる)
+    own = keyset_queryset(Tweet.objects.filter(user=user), cursor)
+    followed = keyset_queryset(
+        Tweet.objects.filter(
+            Exists(
+                FriendShip.objects.filter(follower=user, following=OuterRef("user"))
+            ),
+            pulled=True,
+        ),
+        cursor,
+    )
+    return (
+        own.select_related("user")
+        .order_by()
+        .union(followed.select_related("user").order_by(), all=True)
+        .order_by("-created_at", "-id")
+    )
+
+
+def _entries(owner_ids, tweets):
+    return [
+        TimelineEntry(
+            owner_id=owner_id,
+            tweet_id=tweet.id,
+            author_id=tweet.user_id,
+            tweet_created_at=tweet.created_at,
+        )
+        for owner_id in owner_ids
+        for tweet in tweets
+    ]
+
+
+def tweet_created(tweet):
+    # 投稿したリクエストの中で呼ぶ。作者自身のホーム・プロフィールと pull のタイムラインはここで無効にする
+    # (フォロワーへの配信 fan_out はワーカーが後から行うので、それを待つと作者に自分のツイートが出ない)
+    timeline_cache.bump("timeline", [tweet.user_id])
+    timeline_cache.bump("author", [tweet.user_id])
+    if tweet.pulled:
+        timeline_cache.bump("pulled", [0])
+
+
+def fan_out(tweet):
+    # 投稿されたツイートをフォロワー全員のタイムラインへまとめて書き込む (作者の側は tweet_created で済んでいる)
+    author = tweet.user
+    if tweet.pulled:
+        return 0
+    follower_ids = (
+        FriendShip.objects.filter(following=author)
+        .values_list("follower_id", flat=True)
+        .iterator(chunk_size=FANOUT_BATCH_SIZE)
+    )
+    written = 0
+    batch = []
+    for follower_id in follower_ids:
+        batch.append(follower_id)
+        if len(batch) >= FANOUT_BATCH_SIZE:
+            written += _write(batch, [tweet])
+            batch = []
+    if batch:
+        written += _write(batch, [tweet])
+    return written
+
+
+def tweet_changed(tweet):
+    # ツイートを書き換えた後・消す前に呼ぶ (tweets.signals)。配信済みのタイムラインを持っている人のキャッシュを無効にする
+    # (ページをキャッシュしないときも、条件付き GET の stamp は更新する)
+    owner_ids = list(
+        TimelineEntry.objects.filter(tweet=tweet).values_list("owner_id", flat=True)
+    )
+    timeline_cache.bump("timeline", [tweet.user_id, *owner_ids])
+    timeline_cache.bump("author", [tweet.user_id])
+    if tweet.pulled:
+        timeline_cache.bump("pulled", [0])
+    timeline_cache.forget_tweets([tweet.id])
+
+
+def _write(owner_ids, tweets):
+    entries = _entries(owner_ids, tweets)
+    TimelineEntry.objects.bulk_create(
+        entries, batch_size=FANOUT_BATCH_SIZE, ignore_conflicts=True
+    )
+    timeline_cache.bump("timeline", owner_ids)
+    return len(entries)
+
+
+def backfill(follower, following):
+    # フォローした時点で、相手の最近のツイートを自分のタイムラインへ遡って入れる (pull のツイートは読み込み時に混ざる)
+    timeline_cache.bump("timeline", [follower.id])
+    tweets = Tweet.objects.filter(user=following, pulled=False).order_by(
+        "-created_at", "-id"
+    )[: settings.TIMELINE_INBOX_SIZE]
+    return _write([follower.id], tweets)
+
+
+def remove_author(follower, following):
+    # フォロー解除したら、相手のツイートを自分のタイムラインから消す
+    deleted, _ = TimelineEntry.objects.filter(owner=follower, author=following).delete()
+    timeline_cache.bump("timeline", [follower.id])
+    return deleted
+
+
+def rebuild(user):
+    TimelineEntry.objects.filter(owner=user).delete()
+    timeline_cache.bump("timeline", [user.id])
+    tweets = Tweet.objects.filter(
+        user__in=followed_authors(user), pulled=False
+    ).order_by("-created_at", "-id")[: settings.TIMELINE_INBOX_SIZE]
+    return _write([user.id], tweets)
+
+
+def home_timeline(user, cursor=None, per_page=DEFAULT_PAGE_SIZE):
+    # push 分と pull 分をそれぞれ per_page + 1 件ずつ取り、(created_at, id) の降順で混ぜる
+    entries = keyset_queryset(
+        TimelineEntry.objects.filter(owner=user).select_related("tweet__user"),
+        cursor,
+        fields=("tweet_created_at", "tweet_id"),
+    )[: per_page + 1]
+    pulled = pulled_tweets(user, cursor)[: per_page + 1]
+    tweets = {entry.tweet.id: entry.tweet for entry in entries}
+    tweets.update((tweet.id, tweet) for tweet in pulled)
+    rows = sorted(tweets.values(), key=lambda t: (t.created_at, t.id), reverse=True)
+    return page_from_rows(rows[: per_page + 1], per_page)
+
+
+def cached_home_timeline(user, cursor=None, per_page=DEFAULT_PAGE_SIZE):
+    # フォロワーの多いユーザーが投稿したときは "pulled" のバージョンで全員分をまとめて無効にする
+    return timeline_cache.cached_page(
+        f"home:{user.id}:{cursor or ''}:{per_page}",
+        [("timeline", user.id), ("pulled", 0)],
+        lambda: home_timeline(user, cursor, per_page),
+    )
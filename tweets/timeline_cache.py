@@ -0,0 +1,233 @@
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import viewer_state
+from .models import Tweet
+from .pagination import KeysetPage
+
+# タイムラインのページとツイート、いいね状態を Django のキャッシュフレームワークに載せる
+# - ページのキーには「バージョン」を含める。ツイート作成・削除やフォローの変更ではバージョンを
+#   新しくするだけで、古いキーは参照されなくなり、そのうち期限切れで消える (消して回らない)
+# - バックエンドは settings.TIMELINE_CACHE_ALIAS で選ぶ。開発・テストは LocMemCache、本番はワーカーとも共有する Redis
+# - バージョンとは別に「最後に変わった時刻」(stamp) も持ち、ETag / Last-Modified に使う (tweets.conditional)
+#   こちらはページをキャッシュしないときも更新する
+
+STATS_NAMESPACES = ("page", "tweet", "liked")
+
+
+def get_cache():
+    return caches[settings.TIMELINE_CACHE_ALIAS]
+
+
+def enabled():
+    return settings.TIMELINE_CACHE_ENABLED
+
+
+def _version_key(kind, key):
+    return f"tl:v:{kind}:{key}"
+
+
+def _new_version():
+    # 連番にすると、キーが追い出された後に 1 からやり直して古いページと衝突するのでランダムにする
+    return uuid.uuid4().hex[:12]
+
+
+def versions(pairs):
+    cache = get_cache()
+    keys = [_version_key(kind, key) for kind, key in pairs]
+    found = cache.get_many(keys)
+    missing = {key: _new_version() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        found.update(missing)
+    return [found[key] for key in keys]
+
+
+def _stamp_key(kind, key):
+    return f"tl:stamp:{kind}:{key}"
+
+
+def touch(pairs):
+    now = time.time()
+    get_cache().set_many(
+        {_stamp_key(kind, key): now for kind, key in pairs}, timeout=None
+    )
+
+
+def stamps(pairs):
+    # キャッシュから消えていたら今の時刻にする (変わったものとして扱うので、古いページを 304 にすることはない)
+    cache = get_cache()
+    keys = [_stamp_key(kind, key) for kind, key in pairs]
+    found = cache.get_many(keys)
+    now = time.time()
+    missing = {key: now for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        found.update(missing)
+    return [found[key] for key in keys]
+
+
+def forget_versions(kind, keys):
+    # 次に versions で読んだときに新しいバージョンになる (bump と違い、TIMELINE_CACHE_ENABLED によらず消す)
+    get_cache().delete_many([_version_key(kind, key) for key in keys])
+
+
+def bump(kind, keys):
+    touch([(kind, key) for key in keys])
+    if not enabled():
+        return
+    get_cache().set_many(
+        {_version_key(kind, key): _new_version() for key in keys}, timeout=None
+    )
+
+
+def _incr(key, delta):
+    if not delta:
+        return
+    cache = get_cache()
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        if not cache.add(key, delta, timeout=None):
+            cache.incr(key, delta)
+
+
+def _record(namespace, hits, misses):
+    _incr(f"tl:stats:{namespace}:hit", hits)
+    _incr(f"tl:stats:{namespace}:miss", misses)
+
+
+def stats():
+    cache = get_cache()
+    keys = [
+        f"tl:stats:{namespace}:{kind}"
+        for namespace in STATS_NAMESPACES
+        for kind in ("hit", "miss")
+    ]
+    values = cache.get_many(keys)
+    result = {}
+    for namespace in STATS_NAMESPACES:
+        hits = values.get(f"tl:stats:{namespace}:hit", 0)
+        misses = values.get(f"tl:stats:{namespace}:miss", 0)
+        total = hits + misses
+        result[namespace] = {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if total else 0.0,
+        }
+    return result
+
+
+def reset_stats():
+    get_cache().delete_many(
+        [
+            f"tl:stats:{namespace}:{kind}"
+            for namespace in STATS_NAMESPACES
+            for kind in ("hit", "miss")
+        ]
+    )
+
+
+def _tweet_key(tweet_id):
+    return f"tl:tweet:{tweet_id}"
+
+
+def _liked_key(user_id, tweet_id):
+    return f"tl:liked:{user_id}:{tweet_id}"
+
+
+def cached_page(name, version_pairs, loader):
+    # ページにはツイートの id と次のカーソルだけを保存し、ツイート本体は get_tweets で1件ずつ共有する
+    if not enabled():
+        return loader()
+    cache = get_cache()
+    key = ":".join(["tl:page", name, *versions(version_pairs)])
+    if (cached := cache.get(key)) is not None:
+        _record("page", 1, 0)
+        tweet_ids, next_cursor = cached
+        return KeysetPage(get_tweets(tweet_ids), next_cursor)
+    _record("page", 0, 1)
+    page = loader()
+    store_tweets(page.object_list)
+    cache.set(
+        key,
+        ([tweet.id for tweet in page.object_list], page.next_cursor),
+        settings.TIMELINE_CACHE_TIMEOUT,
+    )
+    return page
+
+
+def store_tweets(tweets):
+    get_cache().set_many(
+        {_tweet_key(tweet.id): tweet for tweet in tweets},
+        settings.TIMELINE_CACHE_TIMEOUT,
+    )
+
+
+def get_tweets(tweet_ids):
+    found = get_cache().get_many([_tweet_key(tweet_id) for tweet_id in tweet_ids])
+    tweets = {tweet.id: tweet for tweet in found.values()}
+    missing = [tweet_id for tweet_id in tweet_ids if tweet_id not in tweets]
+    _record("tweet", len(tweets), len(missing))
+    if missing:
+        loaded = Tweet.objects.select_related("user").in_bulk(missing)
+        store_tweets(loaded.values())
+        tweets.update(loaded)
+    # 削除済みのツイートは飛ばす
+    return [tweets[tweet_id] for tweet_id in tweet_ids if tweet_id in tweets]
+
+
+def annotate_viewer_state(user, tweets):
+    tweets = list(tweets)
+    if not enabled() or not user.is_authenticated:
+        return viewer_state.annotate_viewer_state(user, tweets)
+    cache = get_cache()
+    keys = {tweet.id: _liked_key(user.id, tweet.id) for tweet in tweets}
+    found = cache.get_many(keys.values())
+    missing = [tweet_id for tweet_id, key in keys.items() if key not in found]
+    _record("liked", len(keys) - len(missing), len(missing))
+    if missing:
+        liked = viewer_state.liked_tweet_ids(user, missing)
+        values = {keys[tweet_id]: tweet_id in liked for tweet_id in missing}
+        cache.set_many(values, settings.TIMELINE_CACHE_TIMEOUT)
+        found.update(values)
+    for tweet in tweets:
+        tweet.is_liked = found[keys[tweet.id]]
+    return tweets
+
+
+def like_changed(user, tweet_id, is_liked, author_id=None):
+    likes_changed(user, {tweet_id: is_liked}, [author_id] if author_id else [])
+
+
+def likes_changed(user, liked, author_ids=()):
+    # いいね数が変わったツイート本体は捨て、押した人のいいね状態は新しい値で上書きする
+    if not liked:
+        return
+    # いいね数はツイートの作者ごとの "author_likes"。ホームとプロフィールはページに出ている作者の分だけを見る
+    touch(
+        [
+            ("viewer_likes", user.id),
+            *(("author_likes", author_id) for author_id in set(author_ids)),
+        ]
+    )
+    if not enabled():
+        return
+    cache = get_cache()
+    cache.delete_many([_tweet_key(tweet_id) for tweet_id in liked])
+    cache.set_many(
+        {
+            _liked_key(user.id, tweet_id): is_liked
+            for tweet_id, is_liked in liked.items()
+        },
+        settings.TIMELINE_CACHE_TIMEOUT,
+    )
+
+
+def forget_tweets(tweet_ids):
+    if not enabled():
+        return
+    get_cache().delete_many([_tweet_key(tweet_id) for tweet_id in tweet_ids])
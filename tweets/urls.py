@@ -5,9 +5,17 @@ from . import views
 app_name = "tweets"
 urlpatterns = [
     path("home/", views.HomeView.as_view(), name="home"),
+    path("home/feed/", views.HomeFeedView.as_view(), name="home_feed"),
     path("create/", views.TweetCreateView.as_view(), name="create"),
     path("<int:pk>/", views.TweetDetailView.as_view(), name="detail"),
     path("<int:pk>/delete/", views.TweetDeleteView.as_view(), name="delete"),
     path("<int:pk>/like/", views.LikeView.as_view(), name="like"),
     path("<int:pk>/unlike/", views.UnlikeView.as_view(), name="unlike"),
+    path("<int:pk>/like/async/", views.AsyncLikeView.as_view(), name="like_async"),
+    path(
+        "<int:pk>/unlike/async/", views.AsyncUnlikeView.as_view(), name="unlike_async"
+    ),
+    path("hashtag/<str:name>/", views.HashtagView.as_view(), name="hashtag"),
+    path("mentions/<str:username>/", views.MentionView.as_view(), name="mentions"),
+    path("likes/batch/", views.LikeBatchView.as_view(), name="like_batch"),
 ]
@@ -0,0 +1,25 @@
+from .models import Like
+
+# ログイン中のユーザー(viewer)ごとに変わる表示状態をまとめて解決する
+# テンプレートの中でツイート1件ごとにクエリが走らないよう、表示するページ分だけを1回のクエリで取る
+
+
+def liked_tweet_ids(user, tweet_ids):
+    # tweet_ids のうち、user がいいね済みのものを frozenset で返す
+    tweet_ids = list(tweet_ids)
+    if not user.is_authenticated or not tweet_ids:
+        return frozenset()
+    return frozenset(
+        Like.objects.filter(user=user, tweet_id__in=tweet_ids).values_list(
+            "tweet_id", flat=True
+        )
+    )
+
+
+def annotate_viewer_state(user, tweets):
+    # 各ツイートに is_liked を付ける (tweets/like.html が参照する)
+    tweets = list(tweets)
+    liked = liked_tweet_ids(user, (tweet.id for tweet in tweets))
+    for tweet in tweets:
+        tweet.is_liked = tweet.id in liked
+    return tweets
@@ -1,33 +1,147 @@
+import json
+
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
 from django.shortcuts import get_object_or_404
+from django.template.loader import render_to_string
 from django.urls import reverse, reverse_lazy
 from django.views import View
 from django.views.generic import CreateView, DeleteView, DetailView, ListView
 
+from accounts.mixins import AsyncLoginRequiredMixin
+from accounts.models import User
+from live import events as live
+from mysite.db_router import ReplicaReadMixin
+from suggestions import index as suggestions
+from trends import counters as trends
+
+from . import entities, likes, tasks, timeline, timeline_cache
+from .conditional import ConditionalGetMixin
 from .forms import CreateTweetForm
-from .models import Like, Tweet
+from .models import Mention, Tweet, TweetHashtag
+from .pagination import DEFAULT_PAGE_SIZE, InvalidCursor, KeysetPage, paginate_or_404
 
 
-class HomeView(LoginRequiredMixin, ListView):
+class HomeView(LoginRequiredMixin, ConditionalGetMixin, ReplicaReadMixin, ListView):
     model = Tweet
     template_name = "tweets/home.html"
     context_object_name = "tweet_list"
     # テンプレートで表示する際のモデルの参照名を設定
     # → どこから持ってきたデータか分かり易くなった気がする
-    # queryset = Tweet.objects.select_related("user").order_by("-created_at")
-    queryset = (
-        Tweet.objects.select_related("user")
-        .prefetch_related("likes")
-        .order_by("-created_at")
-    )
-    # created_at を、マイナスを付けることで日付が新しい順にしてる
+    page_size = DEFAULT_PAGE_SIZE
+    show_suggestions = True
+
+    def get_stamp_pairs(self):
+        # タイムラインの中身 (cached_home_timeline と同じ) と、表示するいいね数・いいね状態
+        # いいね数は、このページに出ている作者のツイートへのいいねでだけ変わる ("author_likes")
+        # ページはバージョン付きのキャッシュ (TIMELINE_CACHE_ENABLED) から取るので、304 のときも一覧の SQL は流れない
+        user = self.request.user
+        author_ids = sorted({tweet.user_id for tweet in self.get_page().object_list})
+        return [
+            ("timeline", user.id),
+            ("pulled", 0),
+            *(("author_likes", author_id) for author_id in author_ids),
+            # カードに出る作者のユーザー名 (tweets.card_cache)
+            *(("user", author_id) for author_id in author_ids),
+            ("viewer_likes", user.id),
+            ("notifications", user.id),
+            # おすすめユーザー (作り直し・自分のフォロー)
+            ("suggestions", 0),
+            ("follow", user.id),
+        ]
+
+    def get_page(self):
+        # 自分とフォロー中のユーザーのツイートだけを (created_at, id) の降順で表示する
+        # ETag を作るときに一度だけ読み、200 のときも get_queryset で使い回す
+        if getattr(self, "page", None) is None:
+            cursor = self.request.GET.get("cursor")
+            try:
+                self.page = timeline.cached_home_timeline(
+                    self.request.user, cursor, self.page_size
+                )
+            except InvalidCursor:
+                raise Http404("無効なカーソルです。")
+        return self.page
+
+    def get_queryset(self):
+        return timeline_cache.annotate_viewer_state(
+            self.request.user, self.get_page().object_list
+        )
+        # このページのツイートについてだけ、いいね済みかどうかを1回のクエリで付ける
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        user = self.request.user
-        context["liked_list"] = user.likes.values_list("tweet", flat=True)
-        # ログイン中のユーザーがいいねしているツイート一覧をidで取得
+        context["next_cursor"] = self.page.next_cursor
+        if self.show_suggestions:
+            context["suggestion_list"] = suggestions.suggestions_for(self.request.user)
+        return context
+
+
+class HomeFeedView(HomeView):
+    # 無限スクロール用。HomeView と同じページをカードのHTMLごとJSONで返す
+    show_suggestions = False
+
+    def render_to_response(self, context, **response_kwargs):
+        html = render_to_string("tweets/tweet_list.html", context, self.request)
+        context = {
+            "html": html,
+            "next_cursor": self.page.next_cursor,
+            "has_next": self.page.has_next,
+        }
+        return JsonResponse(context)
+
+
+class EntityTimelineView(LoginRequiredMixin, ListView):
+    # ハッシュタグ・メンションのタイムライン。TweetHashtag / Mention を (tweet_created_at, tweet_id) の降順で読む
+    model = Tweet
+    context_object_name = "tweet_list"
+    page_size = DEFAULT_PAGE_SIZE
+
+    def get_entries(self):
+        raise NotImplementedError
+
+    def get_queryset(self):
+        page = paginate_or_404(
+            self.get_entries().select_related("tweet__user"),
+            self.request.GET.get("cursor"),
+            self.page_size,
+            fields=("tweet_created_at", "tweet_id"),
+        )
+        self.page = KeysetPage([entry.tweet for entry in page], page.next_cursor)
+        return timeline_cache.annotate_viewer_state(
+            self.request.user, self.page.object_list
+        )
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["next_cursor"] = self.page.next_cursor
+        return context
+
+
+class HashtagView(EntityTimelineView):
+    template_name = "tweets/hashtag.html"
+
+    def get_entries(self):
+        # まだ使われていないタグは 404 にせず、空の一覧を出す (Hashtag を引くクエリを省く)
+        self.hashtag = entities.normalize_hashtag(self.kwargs["name"])
+        return TweetHashtag.objects.filter(hashtag__name=self.hashtag)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["hashtag"] = self.hashtag
+        return context
+
+
+class MentionView(EntityTimelineView):
+    template_name = "tweets/mentions.html"
+
+    def get_entries(self):
+        self.mentioned = get_object_or_404(User, username=self.kwargs["username"])
+        return Mention.objects.filter(user=self.mentioned)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["mentioned"] = self.mentioned
         return context
 
 
@@ -39,8 +153,21 @@ class TweetCreateView(LoginRequiredMixin, CreateView):
     def form_valid(self, form):
         form.instance.user = self.request.user
         # formでログインユーザーを取得する
-        return super().form_valid(form)
+        form.instance.pulled = timeline.is_pulled_author(self.request.user)
+        # フォロワーへ配信するか、読み込み時に混ぜるかは投稿した時点で決める
+        response = super().form_valid(form)
         # super(): classの継承元の何かを呼び出す時に用いる(今回で言うとCreateView)
+        timeline.tweet_created(self.object)
+        # 自分のホームには pull 側で出るので、自分のキャッシュと ETag はこの場で無効にする
+        tasks.fan_out_tweet.defer(self.object.id, key=f"fan_out:{self.object.id}")
+        # フォロワーのタイムラインへの配信はワーカーに任せる (フォロワーの数だけ時間がかかるので)
+        live.tweet_created(self.object)
+        # 開いているフォロワーの画面にも知らせる
+        entities.save_entities([self.object])
+        # ハッシュタグとメンションを取り出しておく
+        trends.record_hashtags(entities.extract_hashtags(self.object.content))
+        # トレンドのハッシュタグの投稿数を数える
+        return response
 
 
 class TweetDetailView(LoginRequiredMixin, DetailView):
@@ -48,11 +175,6 @@ class TweetDetailView(LoginRequiredMixin, DetailView):
     context_object_name = "tweet_detail"
     template_name = "tweets/tweet_detail.html"
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context["like_count"] = Like.objects.filter(tweet=self.object).count()
-        return context
-
 
 class TweetDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
     model = Tweet
@@ -65,42 +187,73 @@ class TweetDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
         return self.request.user == tweet.user
 
 
+def like_data(tweet_id, is_liked, like_count):
+    # いいね系のビューが返す JSON (like.js が読む)
+    return {
+        "tweet_id": tweet_id,
+        "is_liked": is_liked,
+        "like_url": reverse("tweets:like", kwargs={"pk": tweet_id}),
+        "unlike_url": reverse("tweets:unlike", kwargs={"pk": tweet_id}),
+        "like_count": like_count,
+    }
+
+
 class LikeView(LoginRequiredMixin, View):
+    # UnlikeView と共通。is_liked を切り替えるだけで、処理は tweets.likes.set_like にまとめてある
+    is_liked = True
+
     def post(self, request, **kwargs):
         user = self.request.user
         tweet_id = self.kwargs["pk"]
-        tweet = get_object_or_404(Tweet, id=tweet_id)
-        Like.objects.get_or_create(tweet=tweet, user=user)
-        is_liked = True
-        like_url = reverse("tweets:like", kwargs={"pk": tweet_id})
-        unlike_url = reverse("tweets:unlike", kwargs={"pk": tweet_id})
-        like_count = tweet.likes.count()
-        context = {
-            "tweet_id": tweet_id,
-            "is_liked": is_liked,
-            "like_url": like_url,
-            "unlike_url": unlike_url,
-            "like_count": like_count,
-        }
-        return JsonResponse(context)
+        like_count = likes.set_like(user, tweet_id, self.is_liked)
+        if like_count is None:
+            raise Http404("ツイートが見つかりませんでした。")
+        return JsonResponse(like_data(tweet_id, self.is_liked, like_count))
 
 
-class UnlikeView(LoginRequiredMixin, View):
-    def post(self, request, **kwargs):
-        user = self.request.user
+class UnlikeView(LikeView):
+    is_liked = False
+
+
+class AsyncLikeView(AsyncLoginRequiredMixin, View):
+    # LikeView の async 版。ASGI で動かすと、DB を待つ間ワーカーのスレッドを占有しない
+    is_liked = True
+
+    async def post(self, request, **kwargs):
         tweet_id = self.kwargs["pk"]
-        tweet = get_object_or_404(Tweet, id=tweet_id)
-        if like := Like.objects.filter(user=user, tweet=tweet):
-            like.delete()
-        is_liked = False
-        like_url = reverse("tweets:like", kwargs={"pk": tweet_id})
-        unlike_url = reverse("tweets:unlike", kwargs={"pk": tweet_id})
-        like_count = tweet.likes.count()
+        like_count = await likes.aset_like(request.user, tweet_id, self.is_liked)
+        if like_count is None:
+            raise Http404("ツイートが見つかりませんでした。")
+        return JsonResponse(like_data(tweet_id, self.is_liked, like_count))
+
+
+class AsyncUnlikeView(AsyncLikeView):
+    is_liked = False
+
+
+class LikeBatchView(LoginRequiredMixin, View):
+    # like.js がまとめて送ってくるいいね・取り消しを1回のトランザクションで反映する
+    # body: {"operations": [{"tweet_id": 1, "action": "like" | "unlike"}, ...]}
+    def post(self, request, **kwargs):
+        try:
+            operations = json.loads(request.body)["operations"]
+            if len(operations) > likes.BATCH_MAX_OPERATIONS:
+                return JsonResponse({"error": "操作が多すぎます。"}, status=400)
+            final = {}
+            for operation in operations:
+                if operation["action"] not in ("like", "unlike"):
+                    raise ValueError(operation["action"])
+                final[int(operation["tweet_id"])] = operation["action"] == "like"
+                # 同じツイートへの操作は、最後のものだけが残る
+        except (ValueError, KeyError, TypeError):
+            return JsonResponse({"error": "無効な操作です。"}, status=400)
+
+        results = likes.apply_batch(self.request.user, final)
         context = {
-            "tweet_id": tweet_id,
-            "is_liked": is_liked,
-            "like_url": like_url,
-            "unlike_url": unlike_url,
-            "like_count": like_count,
+            "results": [
+                like_data(tweet_id, is_liked, like_count)
+                for tweet_id, (is_liked, like_count) in results.items()
+            ],
+            "missing": sorted(set(final) - set(results)),
         }
         return JsonResponse(context)